@@ -0,0 +1,154 @@
+"""
+Benchmark the ProfilingRecord indexes against typical admin / report queries.
+
+Creates a throwaway (test) database, fills it with --rows records spread over
+--days days, then times each query with the indexes, and again after dropping
+them:
+
+    $ python benchmarks/indexes.py --rows 2000000
+
+Uses tests.settings (SQLite) unless DJANGO_SETTINGS_MODULE is set - point it
+at a PostgreSQL database to benchmark there.
+
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.db.models import Avg  # noqa: E402
+
+from request_profiler.models import ProfilingRecord  # noqa: E402
+
+TABLE = ProfilingRecord._meta.db_table
+VIEWS = [f"app.views.view_{i}" for i in range(200)]
+STATUS_CODES = [200] * 90 + [301, 302, 304, 400, 403, 404, 404, 500, 502, 503]
+
+
+def fill(rows: int, days: int, batch_size: int = 10000) -> datetime.datetime:
+    """Insert rows records, in start_ts order, and return the latest start_ts."""
+    rnd = random.Random(42)
+    end = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    step = datetime.timedelta(days=days) / rows
+    start_ts = end - datetime.timedelta(days=days)
+    for offset in range(0, rows, batch_size):
+        batch = []
+        for _ in range(min(batch_size, rows - offset)):
+            view = rnd.choice(VIEWS)
+            duration = rnd.lognormvariate(-3, 1)
+            batch.append(
+                ProfilingRecord(
+                    start_ts=start_ts,
+                    end_ts=start_ts + datetime.timedelta(seconds=duration),
+                    duration=duration,
+                    http_method="GET",
+                    request_uri=f"/{view.rsplit('.', 1)[-1]}/{rnd.randint(0, 50)}/",
+                    remote_addr="127.0.0.1",
+                    http_user_agent="benchmark",
+                    view_func_name=view,
+                    response_status_code=rnd.choice(STATUS_CODES),
+                    response_content_length=rnd.randint(0, 100000),
+                    query_count=rnd.randint(0, 50),
+                )
+            )
+            start_ts += step
+        ProfilingRecord.objects.bulk_create(batch)
+        print(f"\rinserted {offset + len(batch)} records", end="", file=sys.stderr)
+    print(file=sys.stderr)
+    return end
+
+
+def queries(end: datetime.datetime) -> dict[str, Callable[[], object]]:
+    day = end - datetime.timedelta(days=1)
+    records = ProfilingRecord.objects.all()
+    return {
+        "admin changelist (latest 100)": lambda: list(
+            records.order_by("-start_ts")[:100]
+        ),
+        "view, last day (count)": lambda: records.filter(
+            view_func_name=VIEWS[0], start_ts__gte=day
+        ).count(),
+        "path, last day (avg duration)": lambda: records.filter(
+            request_uri="/view_0/1/", start_ts__gte=day
+        ).aggregate(Avg("duration")),
+        "500s, last day (latest 100)": lambda: list(
+            records.filter(response_status_code=500, start_ts__gte=day).order_by(
+                "-start_ts"
+            )[:100]
+        ),
+        "truncation batch (oldest 1000)": lambda: list(
+            records.filter(start_ts__lt=day)
+            .order_by("start_ts")
+            .values_list("pk", flat=True)[:1000]
+        ),
+    }
+
+
+def analyze() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {connection.ops.quote_name(TABLE)}")
+
+
+def drop_indexes() -> None:
+    """Drop the indexes on the table, other than the primary key and user FK."""
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, TABLE)
+        for name, info in constraints.items():
+            if (
+                info["index"]
+                and not info["primary_key"]
+                and info["columns"] != ["user_id"]
+            ):
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+    analyze()
+
+
+def best_of(func: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        end = fill(args.rows, args.days)
+        analyze()
+        timings = {
+            name: best_of(func, args.repeat) for name, func in queries(end).items()
+        }
+        drop_indexes()
+        print(f"{args.rows} records, {connection.vendor}, best of {args.repeat}")
+        print(f"{'query':<32}{'no indexes':>12}{'indexes':>12}")
+        for name, func in queries(end).items():
+            before = best_of(func, args.repeat)
+            print(f"{name:<32}{before * 1000:>10.1f}ms{timings[name] * 1000:>10.1f}ms")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,64 @@
+from __future__ import annotations
+
+from typing import Any
+
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.http import HttpRequest, HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import URLPattern, path
+
+from .dashboard import MAX_TOP, WINDOWS, get_dashboard_data
+from .models import (
+    NormalizedProfilingRecord,
+    ProfilingRecord,
+    ProfilingRollup,
+    RuleSet,
+    ViewSketch,
+)
+from .paginators import CURSOR_VAR, ProfilingRecordPaginator
 
-from .models import ProfilingRecord, RuleSet
+# request attribute that holds the changelist keyset cursor
+CURSOR_ATTR = "request_profiler_cursor"
 
 
 class RuleSetAdmin(admin.ModelAdmin):
-    list_display = ("enabled", "uri_regex", "user_filter_type", "user_group_filter")
+    list_display = (
+        "enabled",
+        "uri_regex",
+        "user_filter_type",
+        "user_group_filter",
+        "sample_rate",
+        "max_records_per_second",
+    )
+
+
+class StatusClassFilter(admin.SimpleListFilter):
+    """Filter by 1xx - 5xx, as a range on the (indexed) status code."""
+
+    title = "response status"
+    parameter_name = "status_class"
+
+    def lookups(self, request: HttpRequest, model_admin: Any) -> list[tuple]:
+        return [(str(i), f"{i}xx") for i in range(1, 6)]
+
+    def queryset(self, request: HttpRequest, queryset: QuerySet) -> QuerySet:
+        if (value := self.value()) not in {"1", "2", "3", "4", "5"}:
+            return queryset
+        status_from = int(value) * 100
+        return queryset.filter(
+            response_status_code__gte=status_from,
+            response_status_code__lt=status_from + 100,
+        )
 
 
 class ProfilingRecordAdmin(admin.ModelAdmin):
+    # built to stay responsive with tens of millions of records - no exact
+    # counts, keyset pagination (see ProfilingRecordPaginator), and filters
+    # that are ranges on indexed columns. there's no date_hierarchy, as
+    # that runs a DISTINCT over every matching record to list the dates.
     list_display = (
         "start_ts",
         "user",
@@ -18,6 +69,11 @@ class ProfilingRecordAdmin(admin.ModelAdmin):
         "response_status_code",
         "duration",
     )
+    list_filter = ("start_ts", StatusClassFilter)
+    list_select_related = ("user",)
+    ordering = ("-start_ts",)
+    paginator = ProfilingRecordPaginator
+    show_full_result_count = False
     readonly_fields = (
         "user",
         "session_key",
@@ -33,9 +89,150 @@ class ProfilingRecordAdmin(admin.ModelAdmin):
         "response_status_code",
         "response_content_length",
         "query_count",
+        "query_duration",
+        "slowest_query_duration",
         "duration",
+        "time_to_view",
+        "view_duration",
+        "response_duration",
+        "time_to_first_byte",
+        "time_to_last_byte",
     )
 
+    def get_urls(self) -> list[URLPattern]:
+        return [
+            path(
+                "dashboard/",
+                self.admin_site.admin_view(self.dashboard_view),
+                name="request_profiler_dashboard",
+            ),
+            *super().get_urls(),
+        ]
+
+    def dashboard_view(self, request: HttpRequest) -> HttpResponse:
+        """Show the slowest views, status codes and query outliers."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            hours = int(request.GET.get("hours", 24))
+            top = max(1, min(int(request.GET.get("top", 10)), MAX_TOP))
+        except ValueError:
+            hours, top = 24, 10
+        if hours not in WINDOWS:
+            hours = 24
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Request profiler dashboard",
+            "opts": self.model._meta,
+            "windows": WINDOWS,
+            "hours": hours,
+            "top": top,
+            **get_dashboard_data(hours, top),
+        }
+        return TemplateResponse(
+            request, "admin/request_profiler/dashboard.html", context
+        )
+
+    def changelist_view(
+        self, request: HttpRequest, extra_context: dict | None = None
+    ) -> HttpResponse:
+        # the cursor is not a filter, so must be hidden from the changelist
+        request.GET = request.GET.copy()
+        setattr(request, CURSOR_ATTR, request.GET.pop(CURSOR_VAR, [None])[-1])
+        return super().changelist_view(request, extra_context)
+
+    def get_paginator(
+        self,
+        request: HttpRequest,
+        queryset: QuerySet,
+        per_page: int,
+        orphans: int = 0,
+        allow_empty_first_page: bool = True,
+    ) -> Paginator:
+        return ProfilingRecordPaginator(
+            queryset,
+            per_page,
+            orphans,
+            allow_empty_first_page,
+            request=request,
+            cursor=getattr(request, CURSOR_ATTR, None),
+        )
+
+
+class ProfilingRollupAdmin(admin.ModelAdmin):
+    list_display = (
+        "bucket_start",
+        "period",
+        "view_func_name",
+        "status_class",
+        "count",
+        "duration_mean",
+        "duration_p95",
+        "duration_max",
+    )
+    list_filter = ("period", "status_class")
+    readonly_fields = (
+        "period",
+        "bucket_start",
+        "view_func_name",
+        "status_class",
+        "count",
+        "duration_sum",
+        "duration_max",
+        "histogram",
+    )
+
+    @admin.display(description="Duration p95 (sec)")
+    def duration_p95(self, obj: ProfilingRollup) -> float | None:
+        return obj.quantile(0.95)
+
+
+class ViewSketchAdmin(admin.ModelAdmin):
+    list_display = (
+        "period_start",
+        "view_func_name",
+        "count",
+        "duration_p50",
+        "duration_p99",
+    )
+    readonly_fields = ("view_func_name", "period_start", "count")
+    exclude = ("sketch",)
+
+    @admin.display(description="Duration p50 (sec)")
+    def duration_p50(self, obj: ViewSketch) -> float | None:
+        return obj.get_sketch().quantile(0.5)
+
+    @admin.display(description="Duration p99 (sec)")
+    def duration_p99(self, obj: ViewSketch) -> float | None:
+        return obj.get_sketch().quantile(0.99)
+
+
+class NormalizedProfilingRecordAdmin(admin.ModelAdmin):
+    list_display = (
+        "start_ts",
+        "http_method",
+        "request_path",
+        "view_function",
+        "query_count",
+        "response_status_code",
+        "duration",
+    )
+    list_select_related = ("request_path", "view_function")
+    ordering = ("-start_ts",)
+    raw_id_fields = ("user", "request_path", "user_agent", "referer", "view_function")
+    show_full_result_count = False
+
+    def has_add_permission(self, request: HttpRequest) -> bool:
+        return False
+
+    def has_change_permission(
+        self, request: HttpRequest, obj: NormalizedProfilingRecord | None = None
+    ) -> bool:
+        return False
+
 
 admin.site.register(RuleSet, RuleSetAdmin)
 admin.site.register(ProfilingRecord, ProfilingRecordAdmin)
+admin.site.register(ProfilingRollup, ProfilingRollupAdmin)
+admin.site.register(ViewSketch, ViewSketchAdmin)
+admin.site.register(NormalizedProfilingRecord, NormalizedProfilingRecordAdmin)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+from typing import Any, Iterable, Sequence
+
+from django.db import connections
+from django.db.models import Aggregate, Avg, Count, FloatField, Max, QuerySet
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+
+from .models import ProfilingRecord
+from .sketches import QuantileSketch
+
+# the fields records can be grouped by, in addition to a time period
+GROUP_BY_FIELDS = ("view_func_name", "request_uri", "http_method")
+PERIODS = {"minute": TruncMinute, "hour": TruncHour, "day": TruncDay}
+METRICS = ("duration", "query_count")
+PERCENTILES = (50, 90, 95, 99)
+
+
+class PercentileCont(Aggregate):
+    """PostgreSQL percentile_cont ordered-set aggregate (an interpolated percentile)."""
+
+    function = "PERCENTILE_CONT"
+    name = "PercentileCont"
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression: Any, percentile: float, **extra: Any) -> None:
+        if not 0 <= percentile <= 1:
+            raise ValueError("percentile must be between 0 and 1.")
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+def supports_percentile_cont(using: str = "default") -> bool:
+    """Return True if the database can calculate percentiles itself."""
+    return connections[using].vendor == "postgresql"
+
+
+def result_columns(
+    metrics: Sequence[str] = METRICS, percentiles: Sequence[int] = PERCENTILES
+) -> list[str]:
+    """Return the names of the values in each row, after the group fields."""
+    columns = ["count"]
+    for metric in metrics:
+        columns += [f"{metric}_mean"]
+        columns += [f"{metric}_p{p}" for p in percentiles]
+        columns += [f"{metric}_max"]
+    return columns
+
+
+def aggregate_percentiles(
+    queryset: QuerySet | None = None,
+    group_by: Sequence[str] = ("view_func_name",),
+    period: str | None = None,
+    metrics: Sequence[str] = METRICS,
+    percentiles: Sequence[int] = PERCENTILES,
+    exact: bool | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Return count, mean, percentiles and max of each metric, per group.
+
+    Records are grouped by the `group_by` fields and, if `period` is set
+    ("minute", "hour" or "day"), the start of the period in which the request
+    started (as "bucket"). Each row contains the group values, the number of
+    records ("count"), and "{metric}_mean", "{metric}_p{n}" for each of the
+    percentiles, and "{metric}_max" for each metric - e.g. "duration_p99".
+    Null values (e.g. query_count) are ignored.
+
+    If `exact` is True the percentiles are calculated by the database, using
+    percentile_cont, which requires PostgreSQL. If False they are estimated
+    (to within 1%) from a streaming sketch, in a single pass over the
+    records - which works on any database, without sorting the records. The
+    default is to use the database when possible.
+
+    """
+    if queryset is None:
+        queryset = ProfilingRecord.objects.all()
+    if invalid := set(group_by) - set(GROUP_BY_FIELDS):
+        raise ValueError(f"Cannot group by {', '.join(sorted(invalid))}.")
+    if invalid := set(metrics) - set(METRICS):
+        raise ValueError(f"Invalid metrics: {', '.join(sorted(invalid))}.")
+    keys = list(group_by)
+    if period is not None:
+        queryset = queryset.annotate(bucket=PERIODS[period]("start_ts"))
+        keys.append("bucket")
+    if exact is None:
+        exact = supports_percentile_cont(queryset.db)
+    if exact:
+        return _aggregate_in_db(queryset, keys, metrics, percentiles)
+    return _aggregate_sketches(queryset, keys, metrics, percentiles)
+
+
+def _aggregate_in_db(
+    queryset: QuerySet,
+    keys: list[str],
+    metrics: Sequence[str],
+    percentiles: Sequence[int],
+) -> list[dict[str, Any]]:
+    aggregates: dict[str, Aggregate] = {"count": Count("id")}
+    for metric in metrics:
+        aggregates[f"{metric}_mean"] = Avg(metric)
+        for p in percentiles:
+            aggregates[f"{metric}_p{p}"] = PercentileCont(metric, p / 100)
+        aggregates[f"{metric}_max"] = Max(metric)
+    rows = queryset.values(*keys).annotate(**aggregates).order_by(*keys)
+    return [
+        {k: row[k] for k in keys + result_columns(metrics, percentiles)} for row in rows
+    ]
+
+
+def _aggregate_sketches(
+    queryset: QuerySet,
+    keys: list[str],
+    metrics: Sequence[str],
+    percentiles: Sequence[int],
+) -> list[dict[str, Any]]:
+    counts: dict[tuple, int] = {}
+    sketches: dict[tuple, dict[str, QuantileSketch]] = {}
+    rows: Iterable[tuple] = (
+        queryset.order_by().values_list(*keys, *metrics).iterator(chunk_size=2000)
+    )
+    for row in rows:
+        group = row[: len(keys)]
+        if group not in counts:
+            counts[group] = 0
+            sketches[group] = {metric: QuantileSketch() for metric in metrics}
+        counts[group] += 1
+        for metric, value in zip(metrics, row[len(keys) :]):
+            if value is not None:
+                sketches[group][metric].add(value)
+    results = []
+    for group in sorted(counts):
+        result: dict[str, Any] = dict(zip(keys, group))
+        result["count"] = counts[group]
+        for metric, sketch in sketches[group].items():
+            result[f"{metric}_mean"] = sketch.mean
+            for p in percentiles:
+                result[f"{metric}_p{p}"] = sketch.quantile(p / 100)
+            result[f"{metric}_max"] = sketch.max if sketch.count else None
+        results.append(result)
+    return results
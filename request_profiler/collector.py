@@ -0,0 +1,166 @@
+"""
+Receive records sent (as datagrams) by the UDPWriter, and save them in bulk.
+
+The collector runs as a separate process on each host - see the
+request_profiler_collector management command - so that request latency
+never depends on the database.
+
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import stat
+import threading
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+
+from . import settings
+from .models import ProfilingRecord
+from .rollups import update_rollups
+from .serialization import parse_row, record_from_dict
+
+logger = logging.getLogger(__name__)
+
+# large enough for any datagram
+MAX_DATAGRAM_SIZE = 65536
+
+
+def parse_address(address: str) -> tuple[socket.AddressFamily, str | tuple[str, int]]:
+    """Parse "host:port" (UDP) or a path (Unix datagram socket)."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    if address.startswith("/"):
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid collector address: {address!r}")
+    return socket.AF_INET, (host.strip("[]"), int(port))
+
+
+def bind_socket(address: str) -> socket.socket:
+    """
+    Return a datagram socket bound to the address.
+
+    A Unix socket left behind by a previous collector is removed, but
+    ValueError is raised if anything else exists at the path.
+
+    """
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX and os.path.lexists(str(addr)):
+        if not stat.S_ISSOCK(os.lstat(str(addr)).st_mode):
+            raise ValueError(f"{addr} exists, and is not a socket.")
+        os.remove(str(addr))
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.bind(addr)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def save_records(records: list[ProfilingRecord], store_records: bool = True) -> int:
+    """
+    Save a batch of records and update the rollups, returning the number saved.
+
+    If the batch fails to save (e.g. one record has a value that is too long
+    for its column) its records are saved one at a time, so that only the
+    invalid records are lost. Errors are logged.
+
+    """
+    try:
+        with transaction.atomic():
+            if store_records:
+                ProfilingRecord.objects.bulk_create(records)
+            update_rollups(records)
+    except Exception:
+        logger.exception("Error saving %i profiling records.", len(records))
+    else:
+        return len(records)
+    saved = 0
+    for record in records:
+        try:
+            with transaction.atomic():
+                if store_records:
+                    record.save()
+                update_rollups([record])
+        except Exception:
+            logger.warning("Error saving profiling record.", exc_info=True)
+        else:
+            saved += 1
+    return saved
+
+
+class Collector:
+    """
+    Batch the records received on a socket, and save them.
+
+    Records are saved (with `save_records`, updating any rollups) whenever
+    `batch_size` have been received, or every `flush_interval` seconds. If
+    `store_records` is False only the rollups are updated. Datagrams that
+    are not valid records (see `record_from_dict`) are counted in `invalid`.
+
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        batch_size: int | None = None,
+        flush_interval: float | None = None,
+        store_records: bool = True,
+    ) -> None:
+        self.sock = sock
+        self.batch_size = batch_size or settings.WRITER_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.WRITER_FLUSH_INTERVAL
+        self.store_records = store_records
+        self.received = 0
+        self.invalid = 0
+        self.flushed = 0
+        self.dropped = 0
+        self._batch: list[ProfilingRecord] = []
+        self._flushed_at = time.monotonic()
+
+    def handle_datagram(self, data: bytes) -> None:
+        self.received += 1
+        try:
+            record = record_from_dict(parse_row(data.decode("utf-8")))
+        except (ValidationError, ValueError, TypeError):
+            self.invalid += 1
+            return
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        batch, self._batch = self._batch, []
+        self._flushed_at = time.monotonic()
+        if not batch:
+            return
+        saved = save_records(batch, self.store_records)
+        self.flushed += saved
+        self.dropped += len(batch) - saved
+        close_old_connections()
+
+    def receive(self, timeout: float) -> None:
+        """Handle the datagrams received within timeout seconds."""
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            self.sock.settimeout(remaining)
+            try:
+                data = self.sock.recv(MAX_DATAGRAM_SIZE)
+            except socket.timeout:
+                break
+            self.handle_datagram(data)
+
+    def serve(self, stopped: threading.Event) -> None:
+        """Receive and save records until stopped, then save the rest."""
+        while not stopped.is_set():
+            self.receive(min(self.flush_interval, 1))
+            if time.monotonic() - self._flushed_at >= self.flush_interval:
+                self.flush()
+        self.flush()
@@ -0,0 +1,160 @@
+"""
+Write columns of values to a NumPy .npz file, without needing NumPy.
+
+An .npz file is a zip of .npy files - one typed array per column - which
+`numpy.load` reads without any parsing:
+
+    data = numpy.load("records.npz")
+    durations = data["duration"]
+
+Each column is written to a temporary file as the rows are added, so memory
+use does not depend on the number of rows. Strings with few distinct values
+(CATEGORY_FIELDS) are dictionary encoded: "{name}" holds int32 codes into
+"{name}_categories", e.g.
+
+    pandas.Categorical.from_codes(data["view_func_name"],
+                                  data["view_func_name_categories"])
+
+Other strings (such as query_string, which may be unique to each row) are
+written as their UTF-8 bytes, concatenated in "{name}_bytes", with the
+n + 1 (uint64) offsets of each value in "{name}_offsets":
+
+    offsets, values = data["query_string_offsets"], data["query_string_bytes"]
+    values[offsets[i] : offsets[i + 1]].tobytes().decode()
+
+"""
+
+from __future__ import annotations
+
+import datetime
+import math
+import shutil
+import struct
+import tempfile
+import zipfile
+from typing import IO, Any, Sequence
+
+from django.db import models
+
+# column kinds: (numpy dtype, struct format)
+FLOAT = ("<f8", "<d")
+INT = ("<i8", "<q")
+DATETIME = ("<M8[us]", "<q")
+CATEGORY = ("<i4", "<i")
+# offsets into UTF-8 bytes
+TEXT = ("<u8", "<Q")
+
+# text fields with few distinct values, which are dictionary encoded
+CATEGORY_FIELDS = ("http_method", "view_func_name")
+
+# numpy's "not a time" value
+NAT = -(2**63)
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def field_kind(field: models.Field) -> tuple[str, str]:
+    """Return the column kind for a model field."""
+    if isinstance(field, models.DateTimeField):
+        return DATETIME
+    if isinstance(field, models.FloatField):
+        return FLOAT
+    if isinstance(field, (models.IntegerField, models.ForeignKey)):
+        # nullable ints are stored as floats, with NaN for null
+        return FLOAT if field.null else INT
+    if field.name in CATEGORY_FIELDS or field.choices:
+        return CATEGORY
+    return TEXT
+
+
+def npy_header(dtype: str, length: int) -> bytes:
+    """Return the header of a version 1.0 .npy file of a 1-d array."""
+    header = f"{{'descr': '{dtype}', 'fortran_order': False, 'shape': ({length},), }}"
+    # the header (inc. the 10 byte preamble and newline) is 64 byte aligned
+    header += " " * (-(10 + len(header) + 1) % 64) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode()
+
+
+class _Column:
+    def __init__(self, name: str, kind: tuple[str, str]) -> None:
+        self.name = name
+        self.dtype, fmt = kind
+        self.struct = struct.Struct(fmt)
+        self.file: IO[bytes] = tempfile.TemporaryFile()
+        self.categories: dict[str, int] = {}
+        if self.dtype == TEXT[0]:
+            self.bytes: IO[bytes] = tempfile.TemporaryFile()
+            self.offset = 0
+            self.file.write(self.struct.pack(0))
+
+    def add(self, value: Any) -> None:
+        if self.dtype == TEXT[0]:
+            data = b"" if value is None else str(value).encode()
+            self.bytes.write(data)
+            self.offset += len(data)
+            value = self.offset
+        elif self.dtype == CATEGORY[0]:
+            value = "" if value is None else str(value)
+            if (code := self.categories.get(value)) is None:
+                code = self.categories[value] = len(self.categories)
+            value = code
+        elif self.dtype == DATETIME[0]:
+            if value is None:
+                value = NAT
+            else:
+                # naive datetimes (USE_TZ = False) are taken to be UTC
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=datetime.timezone.utc)
+                value = (value - EPOCH) // MICROSECOND
+        elif self.dtype == FLOAT[0] and value is None:
+            value = math.nan
+        self.file.write(self.struct.pack(value))
+
+    def write(self, zf: zipfile.ZipFile, count: int) -> None:
+        """Write the column's arrays to the .npz file, and close it."""
+        if self.dtype == TEXT[0]:
+            _write_npy(zf, f"{self.name}_offsets", self.dtype, count + 1, self.file)
+            _write_npy(zf, f"{self.name}_bytes", "|u1", self.offset, self.bytes)
+            return
+        _write_npy(zf, self.name, self.dtype, count, self.file)
+        if self.dtype == CATEGORY[0]:
+            self._write_categories(zf)
+
+    def _write_categories(self, zf: zipfile.ZipFile) -> None:
+        # fixed width UTF-32 strings, as numpy stores them
+        width = max((len(value) for value in self.categories), default=1) or 1
+        with zf.open(f"{self.name}_categories.npy", "w", force_zip64=True) as npy:
+            npy.write(npy_header(f"<U{width}", len(self.categories)))
+            for value in self.categories:
+                npy.write(value.ljust(width, "\0").encode("utf-32-le"))
+
+
+def _write_npy(
+    zf: zipfile.ZipFile, name: str, dtype: str, length: int, file: IO[bytes]
+) -> None:
+    # copy the (temporary) file of values into the .npz file, and close it
+    with zf.open(f"{name}.npy", "w", force_zip64=True) as npy:
+        npy.write(npy_header(dtype, length))
+        file.seek(0)
+        shutil.copyfileobj(file, npy)
+    file.close()
+
+
+class NpzWriter:
+    """Write rows of values as columns of an .npz file."""
+
+    def __init__(self, file: IO[bytes], columns: Sequence[tuple[str, tuple]]) -> None:
+        self.file = file
+        self.columns = [_Column(name, kind) for name, kind in columns]
+        self.count = 0
+
+    def add(self, row: Sequence[Any]) -> None:
+        for column, value in zip(self.columns, row):
+            column.add(value)
+        self.count += 1
+
+    def close(self) -> None:
+        with zipfile.ZipFile(self.file, "w", zipfile.ZIP_STORED) as zf:
+            for column in self.columns:
+                column.write(zf, self.count)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import datetime
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Count
+from django.utils.timezone import now as tz_now
+
+from . import settings
+from .aggregates import aggregate_percentiles
+from .models import ProfilingRecord
+
+logger = logging.getLogger(__name__)
+
+# the windows (in hours) that the dashboard can show
+WINDOWS = (1, 6, 24, 24 * 7)
+# the most views that the dashboard can show in each table
+MAX_TOP = 100
+
+
+def _store(key: str, value: Any) -> None:
+    cache.set(
+        key,
+        (time.time() + settings.DASHBOARD_CACHE_TIMEOUT, value),
+        settings.DASHBOARD_CACHE_TIMEOUT + settings.DASHBOARD_STALE_TIMEOUT,
+    )
+
+
+def _refresh(key: str, func: Callable[[], Any], lock_key: str) -> None:
+    try:
+        _store(key, func())
+    except Exception:
+        logger.exception("Error refreshing %s.", key)
+    finally:
+        cache.delete(lock_key)
+        close_old_connections()
+
+
+def get_or_refresh(key: str, func: Callable[[], Any], default: Any = None) -> Any:
+    """
+    Return the value of func, cached with stale-while-revalidate.
+
+    A value is fresh for DASHBOARD_CACHE_TIMEOUT seconds, after which it is
+    still returned, for up to DASHBOARD_STALE_TIMEOUT seconds more, whilst a
+    background thread recalculates it. A lock in the cache ensures only one
+    process recalculates it at a time, so a burst of requests (e.g. everyone
+    opening the dashboard during an incident) runs the queries at most once.
+
+    If there is no value at all, the request that takes the lock calculates
+    it, and any others return `default` until it has been cached.
+
+    """
+    entry = cache.get(key)
+    lock_key = f"{key}:refresh"
+    if entry is None:
+        if not cache.add(lock_key, True, settings.DASHBOARD_CACHE_TIMEOUT):
+            return default
+        try:
+            value = func()
+            _store(key, value)
+        finally:
+            cache.delete(lock_key)
+        return value
+    fresh_until, value = entry
+    if time.time() >= fresh_until and cache.add(
+        lock_key, True, settings.DASHBOARD_CACHE_TIMEOUT
+    ):
+        threading.Thread(
+            target=_refresh,
+            args=(key, func, lock_key),
+            name="request-profiler-dashboard",
+            daemon=True,
+        ).start()
+    return value
+
+
+def dashboard_data(hours: int, top: int) -> dict[str, Any]:
+    """Return the slowest views, status codes and query outliers over the window."""
+    since = tz_now() - datetime.timedelta(hours=hours)
+    records = ProfilingRecord.objects.filter(start_ts__gte=since)
+    views = aggregate_percentiles(
+        records, metrics=("duration", "query_count"), percentiles=(50, 95)
+    )
+    statuses = list(
+        records.order_by()
+        .values("response_status_code")
+        .annotate(count=Count("id"))
+        .order_by("response_status_code")
+    )
+    total = sum(status["count"] for status in statuses)
+    for status in statuses:
+        status["percent"] = 100 * status["count"] / total
+    return {
+        "generated_at": tz_now(),
+        "since": since,
+        "total": total,
+        "slowest_views": sorted(
+            views, key=lambda row: row["duration_p95"] or 0, reverse=True
+        )[:top],
+        "status_codes": statuses,
+        "query_outliers": sorted(
+            views, key=lambda row: row["query_count_p95"] or 0, reverse=True
+        )[:top],
+    }
+
+
+def get_dashboard_data(hours: int, top: int) -> dict[str, Any]:
+    """
+    Return the (cached) dashboard data for the window, with the top views.
+
+    One result (of the MAX_TOP views) is cached per window, so that the
+    number of views shown doesn't affect how often the queries run.
+
+    """
+    data = get_or_refresh(
+        f"request_profiler:dashboard:{hours}",
+        lambda: dashboard_data(hours, MAX_TOP),
+        default={"calculating": True},
+    )
+    if "calculating" in data:
+        return data
+    return {
+        **data,
+        "slowest_views": data["slowest_views"][:top],
+        "query_outliers": data["query_outliers"][:top],
+    }
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+
+from django.db.models import Exists, OuterRef
+
+from . import settings
+from .models import (
+    Dimension,
+    NormalizedProfilingRecord,
+    ProfilingRecord,
+    Referer,
+    RequestPath,
+    UserAgent,
+    ViewFunction,
+)
+
+# NormalizedProfilingRecord field: dimension model
+MODELS: dict[str, type[Dimension]] = {
+    "request_path": RequestPath,
+    "user_agent": UserAgent,
+    "referer": Referer,
+    "view_function": ViewFunction,
+}
+
+
+class DimensionCache:
+    """
+    In-process LRU cache of dimension ids, keyed on (model, value).
+
+    Resolving a value that has been seen recently costs no queries; others
+    are fetched (or created) and added to the cache, evicting the least
+    recently used once there are more than `max_size` values.
+
+    """
+
+    def __init__(self, max_size: int | None = None) -> None:
+        self.max_size = max_size or settings.DIMENSION_CACHE_SIZE
+        self._ids: OrderedDict[tuple[type[Dimension], str], int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get_id(self, model: type[Dimension], value: str) -> int:
+        key = (model, value[: Dimension._meta.get_field("value").max_length])
+        with self._lock:
+            if (pk := self._ids.get(key)) is not None:
+                self._ids.move_to_end(key)
+                return pk
+        # get_or_create copes with another process creating it first
+        pk = model.objects.get_or_create(value=key[1])[0].pk
+        with self._lock:
+            self._ids[key] = pk
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+        return pk
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+
+
+def normalize(
+    record: ProfilingRecord, cache: DimensionCache
+) -> NormalizedProfilingRecord:
+    """Return an (unsaved) NormalizedProfilingRecord copy of a record."""
+    values = {
+        f.attname: getattr(record, f.attname)
+        for f in NormalizedProfilingRecord._meta.concrete_fields
+        if f.name not in MODELS and not f.primary_key
+    }
+    for field, record_field in NormalizedProfilingRecord.DIMENSIONS.items():
+        values[f"{field}_id"] = cache.get_id(
+            MODELS[field], getattr(record, record_field)
+        )
+    return NormalizedProfilingRecord(**values)
+
+
+def delete_unused_dimensions() -> int:
+    """
+    Delete the dimension values that no NormalizedProfilingRecord uses.
+
+    Run (by the truncation command) once old records have been deleted. A
+    writer may still have the id of a deleted value cached - see
+    NormalizedWriter.write.
+
+    """
+    count = 0
+    for field, model in MODELS.items():
+        used = NormalizedProfilingRecord.objects.filter(**{field: OuterRef("pk")})
+        count += model.objects.filter(~Exists(used)).delete()[0]
+    return count
@@ -0,0 +1,72 @@
+import signal
+import threading
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.utils.translation import gettext_lazy as _lazy
+
+from request_profiler import settings
+from request_profiler.collector import Collector, bind_socket
+
+
+class Command(BaseCommand):
+    help = "Receive records sent by the UDPWriter, and save them in batches."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--address",
+            default=settings.COLLECTOR_ADDRESS,
+            help=_lazy(
+                "host:port or socket path to listen on. "
+                "Defaults to REQUEST_PROFILER_COLLECTOR_ADDRESS."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.WRITER_BATCH_SIZE,
+            help=_lazy("Number of records to save at a time."),
+        )
+        parser.add_argument(
+            "--flush-interval",
+            type=float,
+            default=settings.WRITER_FLUSH_INTERVAL,
+            help=_lazy("Max number of seconds between saves."),
+        )
+        parser.add_argument(
+            "--rollups-only",
+            action="store_true",
+            help=_lazy(
+                "Only update the rollups (REQUEST_PROFILER_ROLLUP_PERIODS), "
+                "without storing the records."
+            ),
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if options["rollups_only"] and not settings.ROLLUP_PERIODS:
+            raise CommandError("REQUEST_PROFILER_ROLLUP_PERIODS is not set.")
+        try:
+            sock = bind_socket(options["address"])
+        except (ValueError, OSError) as ex:
+            raise CommandError(str(ex))
+        collector = Collector(
+            sock,
+            batch_size=options["batch_size"],
+            flush_interval=options["flush_interval"],
+            store_records=not options["rollups_only"],
+        )
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stopped.set())
+        self.stdout.write(f"request_profiler: collecting on {options['address']}")
+        try:
+            collector.serve(stopped)
+        except KeyboardInterrupt:
+            collector.flush()
+        finally:
+            sock.close()
+        self.stdout.write(
+            f"request_profiler: received {collector.received} records, "
+            f"saved {collector.flushed}, dropped {collector.dropped}, "
+            f"invalid {collector.invalid}."
+        )
@@ -0,0 +1,84 @@
+import signal
+import threading
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.utils.translation import gettext_lazy as _lazy
+
+from request_profiler import settings
+from request_profiler.ringbuffer import Drainer, RingBuffer
+
+
+class Command(BaseCommand):
+    help = "Save the records written to the ring buffer by the RingBufferWriter."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--path",
+            default=settings.RING_BUFFER_PATH,
+            help=_lazy(
+                "Path of the ring buffer file. "
+                "Defaults to REQUEST_PROFILER_RING_BUFFER_PATH."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.WRITER_BATCH_SIZE,
+            help=_lazy("Number of records to save at a time."),
+        )
+        parser.add_argument(
+            "--flush-interval",
+            type=float,
+            default=settings.WRITER_FLUSH_INTERVAL,
+            help=_lazy("Number of seconds between drains."),
+        )
+        parser.add_argument(
+            "--rollups-only",
+            action="store_true",
+            help=_lazy(
+                "Only update the rollups (REQUEST_PROFILER_ROLLUP_PERIODS), "
+                "without storing the records."
+            ),
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help=_lazy("Save the records in the buffer, then exit."),
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if not options["path"]:
+            raise CommandError("REQUEST_PROFILER_RING_BUFFER_PATH is not set.")
+        if options["rollups_only"] and not settings.ROLLUP_PERIODS:
+            raise CommandError("REQUEST_PROFILER_ROLLUP_PERIODS is not set.")
+        try:
+            buffer = RingBuffer(options["path"])
+        except (ValueError, OSError) as ex:
+            raise CommandError(str(ex))
+        drainer = Drainer(
+            buffer,
+            batch_size=options["batch_size"],
+            flush_interval=options["flush_interval"],
+            store_records=not options["rollups_only"],
+        )
+        try:
+            if options["once"]:
+                drainer.drain()
+            else:
+                stopped = threading.Event()
+                signal.signal(signal.SIGTERM, lambda *args: stopped.set())
+                self.stdout.write(f"request_profiler: draining {options['path']}")
+                try:
+                    drainer.serve(stopped)
+                except KeyboardInterrupt:
+                    drainer.drain()
+            dropped = buffer.dropped
+        finally:
+            buffer.close()
+        self.stdout.write(
+            f"request_profiler: read {drainer.received} records, "
+            f"saved {drainer.flushed}, failed {drainer.dropped}, "
+            f"invalid {drainer.invalid}; {dropped} overwritten in the buffer."
+        )
@@ -0,0 +1,163 @@
+import csv
+import datetime
+import json
+import sys
+from typing import IO, Any, Iterable
+
+from django.conf import settings as django_settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import now as tz_now
+from django.utils.translation import gettext_lazy as _lazy
+
+from request_profiler.columnar import NpzWriter, field_kind
+from request_profiler.models import ProfilingRecord
+from request_profiler.serialization import FIELDS, open_file
+
+FORMATS = ("csv", "jsonl", "npz")
+
+
+def parse_timestamp(value: str) -> datetime.datetime:
+    """Parse an ISO 8601 date or datetime argument."""
+    ts = parse_datetime(value)
+    if ts is None and (date := parse_date(value)) is not None:
+        ts = datetime.datetime.combine(date, datetime.time.min)
+    if ts is None:
+        raise ValueError(f"Invalid date: {value}")
+    if django_settings.USE_TZ and timezone.is_naive(ts):
+        ts = timezone.make_aware(ts)
+    return ts
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {value!r}")
+
+
+class Command(BaseCommand):
+    help = "Export profiling records to a CSV, JSONL or .npz (columnar) file."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        super().add_arguments(parser)
+        parser.add_argument(
+            "path",
+            help=_lazy(
+                "File to write - gzipped if it ends in .gz. "
+                "Use - to write CSV or JSONL to stdout."
+            ),
+        )
+        parser.add_argument(
+            "-f",
+            "--format",
+            choices=FORMATS,
+            help=_lazy("File format - defaults to the file extension."),
+        )
+        parser.add_argument(
+            "--since",
+            type=parse_timestamp,
+            help=_lazy("Only export records started at or after this date / time."),
+        )
+        parser.add_argument(
+            "--until",
+            type=parse_timestamp,
+            help=_lazy("Only export records started before this date / time."),
+        )
+        parser.add_argument(
+            "-d",
+            "--days",
+            type=float,
+            help=_lazy("Only export records from the last number of days."),
+        )
+        parser.add_argument(
+            "--view",
+            dest="views",
+            action="append",
+            help=_lazy("Only export records for this view - may be repeated."),
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help=_lazy("Number of records fetched at a time (default 2000)."),
+        )
+
+    def get_format(self, path: str, fmt: str | None) -> str:
+        if fmt:
+            return fmt
+        name = path.removesuffix(".gz")
+        for fmt in FORMATS:
+            if name.endswith(f".{fmt}"):
+                return fmt
+        raise CommandError("Use --format, or a .csv, .jsonl or .npz path.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        path = options["path"]
+        fmt = self.get_format(path, options["format"])
+        if fmt == "npz" and (path == "-" or path.endswith(".gz")):
+            raise CommandError(".npz files must be written to an uncompressed file.")
+        records = ProfilingRecord.objects.all()
+        if options["since"]:
+            records = records.filter(start_ts__gte=options["since"])
+        if options["until"]:
+            records = records.filter(start_ts__lt=options["until"])
+        if options["days"]:
+            since = tz_now() - datetime.timedelta(days=options["days"])
+            records = records.filter(start_ts__gte=since)
+        if options["views"]:
+            records = records.filter(view_func_name__in=options["views"])
+        # values_list + iterator streams the rows (using a server-side
+        # cursor where supported) without creating model instances
+        rows = (
+            records.order_by("start_ts", "pk")
+            .values_list(*FIELDS)
+            .iterator(chunk_size=options["chunk_size"])
+        )
+        if fmt == "npz":
+            with open(path, "wb") as file:
+                count = self.write_npz(file, rows)
+        elif path == "-":
+            count = self.write_text(sys.stdout, fmt, rows)
+        else:
+            with open_file(path, "w") as file:
+                count = self.write_text(file, fmt, rows)
+        self.stderr.write(f"request_profiler: exported {count} records.")
+
+    def write_text(self, file: IO[str], fmt: str, rows: Iterable[tuple]) -> int:
+        count = 0
+        if fmt == "csv":
+            writer = csv.writer(file)
+            writer.writerow(FIELDS)
+            for row in rows:
+                writer.writerow(
+                    v.isoformat() if isinstance(v, datetime.datetime) else v
+                    for v in row
+                )
+                count += 1
+            return count
+        for row in rows:
+            file.write(
+                json.dumps(
+                    dict(zip(FIELDS, row)),
+                    default=_json_default,
+                    separators=(",", ":"),
+                )
+                + "\n"
+            )
+            count += 1
+        return count
+
+    def write_npz(self, file: IO[bytes], rows: Iterable[tuple]) -> int:
+        columns = [
+            (
+                name,
+                field_kind(ProfilingRecord._meta.get_field(name.removesuffix("_id"))),
+            )
+            for name in FIELDS
+        ]
+        writer = NpzWriter(file, columns)
+        for row in rows:
+            writer.add(row)
+        writer.close()
+        return writer.count
@@ -0,0 +1,141 @@
+import csv
+import io
+import itertools
+import time
+from typing import Any, Iterable, Iterator
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connections, transaction
+from django.utils.translation import gettext_lazy as _lazy
+
+from request_profiler.models import ProfilingRecord
+from request_profiler.rollups import update_rollups
+from request_profiler.serialization import (
+    FIELDS,
+    FORMATS,
+    guess_format,
+    open_file,
+    parse_row,
+    read_rows,
+    record_from_dict,
+)
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def copy_records(records: list[ProfilingRecord], using: str) -> None:
+    """Insert records using PostgreSQL's COPY, which is faster than INSERT."""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    fields = [ProfilingRecord._meta.get_field(name) for name in FIELDS]
+    buffer = io.StringIO()
+    # all values are quoted, so None is written as "" and FORCE_NULL reads
+    # that as NULL - the nullable fields are all numeric, so there is no
+    # ambiguity with an empty string
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for record in records:
+        writer.writerow(
+            [f.get_db_prep_save(getattr(record, f.attname), connection) for f in fields]
+        )
+    nullable = ", ".join(qn(f.column) for f in fields if f.null)
+    sql = (
+        f"COPY {qn(ProfilingRecord._meta.db_table)} "
+        f"({', '.join(qn(f.column) for f in fields)}) "
+        f"FROM STDIN WITH (FORMAT csv, FORCE_NULL ({nullable}))"
+    )
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, "copy_expert"):
+            # psycopg2
+            buffer.seek(0)
+            raw.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+class Command(BaseCommand):
+    help = "Load profiling records from JSONL or CSV files (optionally gzipped)."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        super().add_arguments(parser)
+        parser.add_argument("paths", nargs="+", metavar="path")
+        parser.add_argument(
+            "-f",
+            "--format",
+            choices=FORMATS,
+            help=_lazy("File format - defaults to the file extension."),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help=_lazy("Number of records to insert at a time (default 5000)."),
+        )
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help=_lazy("Use INSERT rather than COPY on PostgreSQL."),
+        )
+        parser.add_argument(
+            "--strict",
+            action="store_true",
+            help=_lazy("Stop at the first invalid row, rather than skipping it."),
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        using = ProfilingRecord.objects.db
+        self.use_copy = (
+            connections[using].vendor == "postgresql" and not options["no_copy"]
+        )
+        self.strict = options["strict"]
+        self.verbosity = options["verbosity"]
+        for path in options["paths"]:
+            try:
+                fmt = options["format"] or guess_format(path)
+            except ValueError as ex:
+                raise CommandError(str(ex))
+            self.import_file(path, fmt, options["batch_size"], using)
+
+    def convert(self, rows: Iterable) -> Iterator[ProfilingRecord]:
+        """Yield a ProfilingRecord for each valid row, counting the invalid ones."""
+        for number, row in enumerate(rows, start=1):
+            try:
+                record = record_from_dict(parse_row(row))
+            except (ValidationError, ValueError, TypeError) as ex:
+                if self.strict:
+                    raise CommandError(f"Invalid row {number}: {ex}")
+                self.invalid += 1
+                if self.invalid <= 10:
+                    self.stderr.write(f"request_profiler: skipping row {number}: {ex}")
+                continue
+            yield record
+
+    def import_file(self, path: str, fmt: str, batch_size: int, using: str) -> None:
+        self.invalid = 0
+        count = 0
+        started_at = time.monotonic()
+        with open_file(path) as file:
+            records = self.convert(read_rows(file, fmt))
+            for batch in batched(records, batch_size):
+                with transaction.atomic(using=using):
+                    if self.use_copy:
+                        copy_records(batch, using)
+                    else:
+                        ProfilingRecord.objects.bulk_create(batch)
+                    update_rollups(batch)
+                count += len(batch)
+                if self.verbosity > 1:
+                    self.stdout.write(f"request_profiler: imported {count} records")
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(
+            f"request_profiler: imported {count} records from {path} in "
+            f"{elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} rows/s), "
+            f"skipped {self.invalid} invalid rows."
+        )
@@ -0,0 +1,68 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _lazy
+
+from request_profiler.partitions import PERIODS, PostgresPartitions, get_partitions
+
+
+class Command(BaseCommand):
+    help = "Manage the time partitions that profiling records are stored in."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        super().add_arguments(parser)
+        parser.add_argument(
+            "action",
+            choices=("list", "create", "setup"),
+            help=_lazy(
+                "list the partitions, create upcoming partitions, or print the "
+                "SQL to convert the records table to a partitioned table "
+                "(PostgreSQL only)."
+            ),
+        )
+        parser.add_argument(
+            "-p",
+            "--period",
+            choices=PERIODS,
+            help=_lazy("Defaults to REQUEST_PROFILER_PARTITION_PERIOD."),
+        )
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=2,
+            help=_lazy("Number of future partitions to create (default 2)."),
+        )
+        parser.add_argument(
+            "--execute",
+            action="store_true",
+            help=_lazy("Run the setup SQL, rather than printing it."),
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            partitions = get_partitions(options["period"])
+        except ValueError as ex:
+            raise CommandError(str(ex))
+        if options["action"] == "list":
+            for partition in partitions.list_partitions():
+                self.stdout.write(
+                    f"{partition.name}: {partition.start} - {partition.end}"
+                )
+        elif options["action"] == "create":
+            for partition in partitions.ensure_partitions(options["ahead"]):
+                self.stdout.write(f"request_profiler: created {partition.name}")
+        else:
+            if not isinstance(partitions, PostgresPartitions):
+                raise CommandError("Partitioned tables require PostgreSQL.")
+            statements = partitions.setup_sql()
+            if not options["execute"]:
+                self.stdout.write(";\n".join(statements) + ";")
+                return
+            using = partitions.connection.alias
+            with transaction.atomic(
+                using=using
+            ), partitions.connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+            self.stdout.write("request_profiler: records table is now partitioned.")
@@ -0,0 +1,93 @@
+import csv
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils.timezone import now as tz_now
+from django.utils.translation import gettext_lazy as _lazy
+
+from request_profiler.aggregates import (
+    GROUP_BY_FIELDS,
+    METRICS,
+    PERIODS,
+    aggregate_percentiles,
+    result_columns,
+)
+from request_profiler.models import ProfilingRecord
+
+
+class Command(BaseCommand):
+    help = "Report count, mean, percentiles and max of request durations."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        super().add_arguments(parser)
+        parser.add_argument(
+            "-g",
+            "--group-by",
+            dest="group_by",
+            action="append",
+            choices=GROUP_BY_FIELDS,
+            help=_lazy(
+                "Field to group records by - may be repeated. "
+                "Defaults to view_func_name."
+            ),
+        )
+        parser.add_argument(
+            "-p",
+            "--period",
+            choices=list(PERIODS),
+            help=_lazy("Also group records by the minute, hour or day they started."),
+        )
+        parser.add_argument(
+            "-m",
+            "--metric",
+            dest="metrics",
+            action="append",
+            choices=METRICS,
+            help=_lazy("Metric to report - may be repeated. Defaults to all."),
+        )
+        parser.add_argument(
+            "-d",
+            "--days",
+            type=float,
+            default=1,
+            help=_lazy(
+                "Only include records from the last number of days (default 1). "
+                "Use 0 to include all records."
+            ),
+        )
+        parser.add_argument(
+            "--estimate",
+            action="store_true",
+            help=_lazy(
+                "Estimate the percentiles with a sketch, even if the database "
+                "can calculate them."
+            ),
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        group_by = options["group_by"] or ["view_func_name"]
+        metrics = options["metrics"] or list(METRICS)
+        records = ProfilingRecord.objects.all()
+        if days := options["days"]:
+            records = records.filter(start_ts__gte=tz_now() - timedelta(days=days))
+        rows = aggregate_percentiles(
+            records,
+            group_by=group_by,
+            period=options["period"],
+            metrics=metrics,
+            exact=False if options["estimate"] else None,
+        )
+        keys = group_by + (["bucket"] if options["period"] else [])
+        writer = csv.writer(self.stdout, lineterminator="\n")
+        columns = result_columns(metrics)
+        writer.writerow(keys + columns)
+        for row in rows:
+            writer.writerow(
+                [row[k].isoformat() if k == "bucket" else row[k] for k in keys]
+                + [_format(row[c]) for c in columns]
+            )
+
+
+def _format(value: Any) -> Any:
+    return "" if value is None else round(value, 6)
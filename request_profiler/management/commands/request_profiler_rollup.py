@@ -0,0 +1,42 @@
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils.timezone import now as tz_now
+from django.utils.translation import gettext_lazy as _lazy
+
+from request_profiler.rollups import PERIODS, recompute_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the profiling rollups from the recent profiling records."
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        super().add_arguments(parser)
+        parser.add_argument(
+            "-p",
+            "--period",
+            dest="periods",
+            action="append",
+            choices=PERIODS,
+            help=_lazy("Period to roll up - may be repeated. Defaults to all."),
+        )
+        parser.add_argument(
+            "-d",
+            "--days",
+            type=float,
+            default=1,
+            help=_lazy(
+                "Rebuild the rollups for the last number of days (default 1). "
+                "Only rebuild periods for which the records have not been "
+                "truncated."
+            ),
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        since = tz_now() - timedelta(days=options["days"])
+        for period in options["periods"] or PERIODS:
+            count = recompute_rollups(period, since)
+            self.stdout.write(
+                f"request_profiler: rebuilt {count} {period} rollups since {since}."
+            )
@@ -1,11 +1,19 @@
-from datetime import date, timedelta
+import time
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
 from typing import Any
 
+from django.conf import settings as django_settings
 from django.core.management.base import BaseCommand, CommandParser
+from django.db.models import QuerySet
+from django.utils import timezone
 from django.utils.timezone import now as tz_now
 from django.utils.translation import gettext_lazy as _lazy
 
-from request_profiler.models import ProfilingRecord
+from request_profiler import settings
+from request_profiler.dimensions import delete_unused_dimensions
+from request_profiler.models import NormalizedProfilingRecord, ProfilingRecord
+from request_profiler.partitions import get_partitions
 from request_profiler.settings import LOG_TRUNCATION_DAYS
 
 
@@ -33,6 +41,27 @@ class Command(BaseCommand):
                 " command is a 'dry-run'."
             ),
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help=_lazy("Number of records to delete in each batch (default 1000)."),
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help=_lazy("Number of seconds to sleep between batches (default 0)."),
+        )
+        parser.add_argument(
+            "--max-runtime",
+            type=float,
+            default=0,
+            help=_lazy(
+                "Stop after this many seconds - the command can be run again "
+                "to carry on. Defaults to 0 (no limit)."
+            ),
+        )
 
     def handle(self, *args: Any, **options: Any) -> None:
         self.stdout.write(
@@ -45,13 +74,89 @@ class Command(BaseCommand):
             return
         cutoff = date.today() - timedelta(days=days)
         self.stdout.write(f"request_profiler: truncation cutoff: {cutoff}")
-        logs = ProfilingRecord.objects.filter(start_ts__date__lt=cutoff)
-        self.stdout.write(f"request_profiler: found {logs.count()} records to delete.")
+        # a range on start_ts (unlike start_ts__date) can use the index
+        cutoff_ts = datetime.combine(cutoff, datetime.min.time())
+        if django_settings.USE_TZ:
+            cutoff_ts = timezone.make_aware(cutoff_ts)
+        if settings.PARTITION_PERIOD:
+            self.drop_partitions(cutoff_ts, options["commit"])
+        logs = ProfilingRecord.objects.filter(start_ts__lt=cutoff_ts)
+        normalized = NormalizedProfilingRecord.objects.filter(start_ts__lt=cutoff_ts)
         if not options["commit"]:
+            self.stdout.write(
+                f"request_profiler: found {logs.count()} records to delete."
+            )
+            if count := normalized.count():
+                self.stdout.write(
+                    f"request_profiler: found {count} normalized records to delete."
+                )
             self.stderr.write(
                 "request_profiler: aborting truncation as --commit option is not set."
             )
             return
-        count, _ = logs.delete()
+        self.started_at = time.monotonic()
+        self.timed_out = False
+        count = self.delete_in_batches(logs, **options)
         self.stdout.write(f"request_profiler: deleted {count} log records.")
+        if not self.timed_out and normalized.exists():
+            count = self.delete_in_batches(normalized, **options)
+            self.stdout.write(
+                f"request_profiler: deleted {count} normalized log records."
+            )
+        if not self.timed_out and (count := delete_unused_dimensions()):
+            self.stdout.write(f"request_profiler: deleted {count} unused values.")
         self.stdout.write(f"request_profiler: truncation completed at {tz_now()}")
+
+    def drop_partitions(self, cutoff_ts: datetime, commit: bool) -> None:
+        """Drop the partitions that are wholly before the cutoff."""
+        if timezone.is_naive(cutoff_ts):
+            cutoff_ts = cutoff_ts.replace(tzinfo=dt_timezone.utc)
+        partitions = get_partitions()
+        if not commit:
+            for partition in partitions.list_partitions():
+                if partition.end <= cutoff_ts:
+                    self.stdout.write(
+                        f"request_profiler: found partition {partition.name} to drop."
+                    )
+            return
+        for partition in partitions.drop_partitions(cutoff_ts):
+            self.stdout.write(f"request_profiler: dropped partition {partition.name}.")
+
+    def delete_in_batches(
+        self,
+        logs: QuerySet,
+        batch_size: int,
+        sleep: float,
+        max_runtime: float,
+        **options: Any,
+    ) -> int:
+        """
+        Delete the logs in batches, and return the number deleted.
+
+        Each batch is selected using the start_ts index, oldest first, and
+        deleted by primary key in its own statement, so that no long-running
+        lock is held and the command can be stopped (or time out) and rerun.
+        The logs may be ProfilingRecords or NormalizedProfilingRecords.
+
+        """
+        total = 0
+        while True:
+            pks = list(
+                logs.order_by("start_ts").values_list("pk", flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            count, _ = logs.model.objects.filter(pk__in=pks).delete()
+            total += count
+            self.stdout.write(f"request_profiler: deleted {total} log records so far.")
+            if len(pks) < batch_size:
+                break
+            if max_runtime and time.monotonic() - self.started_at >= max_runtime:
+                self.timed_out = True
+                self.stdout.write(
+                    "request_profiler: stopping as --max-runtime has been reached."
+                )
+                break
+            if sleep:
+                time.sleep(sleep)
+        return total
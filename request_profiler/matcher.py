@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import logging
+import random
+import re
+import threading
+import time
+from typing import Hashable, Iterable, Iterator
+
+from django.conf import settings as django_settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import settings
+from .models import RuleSet, aget_ruleset_version, get_ruleset_version
+
+logger = logging.getLogger(__name__)
+
+# relative cost of each user filter - group filters require a db query
+USER_FILTER_COST = {
+    RuleSet.USER_FILTER_ALL: 0,
+    RuleSet.USER_FILTER_AUTH: 1,
+    RuleSet.USER_FILTER_GROUP: 2,
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket that allows `rate` takes per second."""
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Take a token if one is available."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.updated_at
+            self.tokens = min(self.rate, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class RuleMatcher:
+    """
+    Precompiled, immutable matcher for a set of RuleSet objects.
+
+    The uri_regex of each rule is compiled once, and where possible all of
+    the patterns are combined into a single alternation (with one named group
+    per rule), so that a request path that matches none of the rules - the
+    common case - costs a single regex search, regardless of the number of
+    rules. Rules are held in order of the cost of their user filter, so that
+    the cheap checks are made first, and group lookups only when necessary.
+
+    Each rule's sample_rate is applied once its path matches (before the
+    user filter), and its max_records_per_second limit once it has matched
+    completely, using a token bucket held by the matcher.
+
+    """
+
+    def __init__(self, rules: Iterable[RuleSet], version: Hashable = None) -> None:
+        self.version = version
+        entries: list[tuple[RuleSet, re.Pattern | None]] = []
+        for rule in rules:
+            regex = rule.uri_regex.strip()
+            try:
+                pattern = re.compile(regex) if regex else None
+            except re.error:
+                logger.exception("Regex error compiling %r.", rule)
+                continue
+            entries.append((rule, pattern))
+        entries.sort(key=lambda e: USER_FILTER_COST.get(e[0].user_filter_type, 3))
+        self.rules = tuple(rule for rule, _ in entries)
+        self._combined = self._combine(entries)
+        self._combined_rules: dict[str, RuleSet] = {}
+        self._entries: tuple[tuple[RuleSet, re.Pattern | None, bool], ...] = ()
+        for index, (rule, pattern) in enumerate(entries):
+            is_combined = self._combined is not None and self._is_combinable(pattern)
+            if is_combined:
+                self._combined_rules[f"r{index}"] = rule
+            self._entries += ((rule, pattern, is_combined),)
+        # the entries that need checking if the combined regex does not match
+        self._uncombined = tuple(e for e in self._entries if not e[2])
+        self._buckets = {
+            id(rule): TokenBucket(rule.max_records_per_second)
+            for rule in self.rules
+            if rule.max_records_per_second is not None
+        }
+
+    def __repr__(self) -> str:
+        return f"<RuleMatcher rules={len(self.rules)} version={self.version!r}>"
+
+    @staticmethod
+    def _is_combinable(pattern: re.Pattern | None) -> bool:
+        # patterns with groups (and so possibly backreferences), or inline
+        # flags, cannot safely be embedded in a larger pattern.
+        if pattern is None:
+            return False
+        return pattern.groups == 0 and pattern.flags == re.UNICODE
+
+    @classmethod
+    def _combine(
+        cls, entries: list[tuple[RuleSet, re.Pattern | None]]
+    ) -> re.Pattern | None:
+        parts = [
+            f"(?P<r{index}>{pattern.pattern})"
+            for index, (_, pattern) in enumerate(entries)
+            if pattern is not None and cls._is_combinable(pattern)
+        ]
+        if not parts:
+            return None
+        try:
+            return re.compile("|".join(parts))
+        except re.error:
+            logger.exception("Unable to combine request profiler regexes.")
+            return None
+
+    def match_uri(self, request_uri: str) -> Iterator[RuleSet]:
+        """Yield the rules whose uri_regex matches, cheapest user filter first."""
+        hit = self._combined.search(request_uri) if self._combined else None
+        if hit is None:
+            entries = self._uncombined
+            first_hit = None
+        else:
+            entries = self._entries
+            first_hit = self._combined_rules[str(hit.lastgroup)]
+        for rule, pattern, _ in entries:
+            if pattern is None or rule is first_hit:
+                yield rule
+            elif pattern.search(request_uri):
+                yield rule
+
+    def _sample(self, rule: RuleSet) -> bool:
+        return rule.sample_rate >= 1 or random.random() < rule.sample_rate  # noqa: S311
+
+    def _take(self, rule: RuleSet) -> bool:
+        return (bucket := self._buckets.get(id(rule))) is None or bucket.take()
+
+    def pre_match(self, request_uri: str) -> bool | None:
+        """
+        Match a request on its path alone, before the user is known.
+
+        Returns True if a rule that applies to all users matches, False if
+        no rule can match, or None if the outcome depends on the user. The
+        rules for all users are sampled / rate limited here, so to complete
+        the match call `match` with deferred=True.
+
+        """
+        depends_on_user = False
+        for rule in self.match_uri(request_uri):
+            if rule.user_filter_type != RuleSet.USER_FILTER_ALL:
+                depends_on_user = True
+            elif self._sample(rule) and self._take(rule):
+                return True
+        return None if depends_on_user else False
+
+    def matching_rules(
+        self, request_uri: str, user: django_settings.AUTH_USER_MODEL
+    ) -> list[RuleSet]:
+        """Return all the rules that match the request path and user (unsampled)."""
+        user = user or AnonymousUser()
+        return [r for r in self.match_uri(request_uri) if r.match_user(user)]
+
+    def _candidates(self, request_uri: str, deferred: bool) -> Iterator[RuleSet]:
+        for rule in self.match_uri(request_uri):
+            if deferred and rule.user_filter_type == RuleSet.USER_FILTER_ALL:
+                continue
+            if self._sample(rule):
+                yield rule
+
+    def match(
+        self,
+        request_uri: str,
+        user: django_settings.AUTH_USER_MODEL,
+        deferred: bool = False,
+    ) -> bool:
+        """
+        Return True if any rule matches the request path and user.
+
+        If deferred is True then the rules for all users are skipped, as
+        they have already been checked by pre_match.
+
+        """
+        user = user or AnonymousUser()
+        return any(
+            rule.match_user(user) and self._take(rule)
+            for rule in self._candidates(request_uri, deferred)
+        )
+
+    async def amatch(
+        self,
+        request_uri: str,
+        user: django_settings.AUTH_USER_MODEL,
+        deferred: bool = False,
+    ) -> bool:
+        """Async version of match."""
+        user = user or AnonymousUser()
+        for rule in self._candidates(request_uri, deferred):
+            if await rule.amatch_user(user) and self._take(rule):
+                return True
+        return False
+
+
+_matcher = RuleMatcher([])
+# time.monotonic() at which the version stamp was last checked, and at which
+# the rules were loaded
+_checked_at = 0.0
+_loaded_at = 0.0
+
+
+def _is_current() -> bool:
+    """Return True if the version stamp was checked recently enough."""
+    return (
+        _matcher.version is not None
+        and time.monotonic() - _checked_at < settings.RULESET_CACHE_TIMEOUT
+    )
+
+
+def _max_age() -> int:
+    """Return the number of seconds after which the rules are always reloaded."""
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache)):
+        # the version stamp is not shared with other processes
+        return settings.RULESET_CACHE_TIMEOUT
+    return settings.RULESET_MAX_AGE
+
+
+def _is_stale(version: str) -> bool:
+    return version != _matcher.version or time.monotonic() - _loaded_at >= _max_age()
+
+
+def get_matcher() -> RuleMatcher:
+    """
+    Return a RuleMatcher for the live rules.
+
+    The matcher is cached in the process. Every RULESET_CACHE_TIMEOUT
+    seconds the rules version stamp is checked, and if it has changed the
+    rules are reloaded from the database. The stamp is held in the cache, so
+    this relies on a cache shared between processes - the rules are also
+    reloaded every RULESET_MAX_AGE seconds (or every RULESET_CACHE_TIMEOUT
+    seconds with a per-process cache) regardless.
+
+    """
+    global _matcher, _checked_at, _loaded_at
+    if _is_current():
+        return _matcher
+    _checked_at = time.monotonic()
+    if _is_stale(version := get_ruleset_version()):
+        _matcher = RuleMatcher(RuleSet.objects.live_rules(), version=version)
+        _loaded_at = _checked_at
+    return _matcher
+
+
+async def aget_matcher() -> RuleMatcher:
+    """Async version of get_matcher."""
+    global _matcher, _checked_at, _loaded_at
+    if _is_current():
+        return _matcher
+    _checked_at = time.monotonic()
+    if _is_stale(version := await aget_ruleset_version()):
+        rules = [rule async for rule in RuleSet.objects.live_rules()]
+        _matcher = RuleMatcher(rules, version=version)
+        _loaded_at = _checked_at
+    return _matcher
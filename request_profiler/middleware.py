@@ -3,18 +3,43 @@ from __future__ import annotations
 import logging
 from typing import Any, Callable
 
+import django
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from django.db.models.query import QuerySet
 from django.http.request import HttpRequest
 from django.http.response import HttpResponse
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import empty
 
 from . import settings
+from .matcher import aget_matcher, get_matcher
 from .models import BadProfilerError, ProfilingRecord, RuleSet
 from .signals import request_profile_complete
 
+try:
+    from asgiref.sync import iscoroutinefunction
+except ImportError:  # asgiref < 3.6
+    from asyncio import iscoroutinefunction  # type: ignore[assignment]
+
 logger = logging.getLogger(__name__)
 
+# the async ORM and cache APIs used in async mode require Django 4.1+ - on
+# earlier versions the sync methods are run in a thread by MiddlewareMixin.
+NATIVE_ASYNC = django.VERSION >= (4, 1)
+
+
+async def _aload_user(request: HttpRequest) -> None:
+    """Load a lazy request.user, which would hit the db in a sync context."""
+    user = getattr(request, "user", None)
+    if getattr(user, "_wrapped", None) is not empty:
+        # there is no user, or it's not lazy, or it's already loaded
+        return
+    if hasattr(request, "auser"):
+        request.user = await request.auser()
+    else:
+        await sync_to_async(lambda: request.user.is_authenticated)()
+
 
 class ProfilingMiddleware(MiddlewareMixin):
     """
@@ -29,8 +54,28 @@ class ProfilingMiddleware(MiddlewareMixin):
     `process_response` method is used to extract the relevant data fields,
     and to stop the profiler.
 
+    Under ASGI the middleware runs natively in async mode, using the
+    `aprocess_*` versions of each method, which use the async ORM and cache
+    APIs rather than running the sync methods in a thread.
+
     """
 
+    def __init__(self, get_response: Callable) -> None:
+        super().__init__(get_response)
+        if NATIVE_ASYNC and iscoroutinefunction(self.get_response):
+            # replace the hook before the handler adapts it to async mode
+            hook = self.aprocess_view
+            self.process_view = hook  # type: ignore[method-assign,assignment]
+            thook = self.aprocess_template_response
+            self.process_template_response = thook  # type: ignore[method-assign]
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        if not NATIVE_ASYNC:
+            return await super().__acall__(request)
+        await self.aprocess_request(request)
+        response = await self.get_response(request)
+        return await self.aprocess_response(request, response)
+
     def match_rules(self, request: HttpRequest, rules: QuerySet) -> list[RuleSet]:
         """Return subset of a list of rules that match a request."""
         user = getattr(request, "user", AnonymousUser())
@@ -41,18 +86,101 @@ class ProfilingMiddleware(MiddlewareMixin):
     def match_funcs(self, request: HttpRequest) -> bool:
         return any(f(request) for f in settings.CUSTOM_FUNCTIONS)
 
-    def process_request(self, request: HttpRequest) -> None:
-        """Start profiling."""
-        # force the creation of a valid session by saving it.
+    def match_request(self, request: HttpRequest) -> bool | None:
+        """
+        Decide whether to profile a request before it is processed.
+
+        Returns False if the request is excluded, or matches no rules, True
+        if it matches a rule that does not depend on the user, and None if
+        the decision has to wait until the response (because the rules that
+        match depend on a user that isn't yet known, or because there are
+        CUSTOM_FUNCTIONS to call).
+
+        """
+        return self._decide(*self._match_on_request(request))
+
+    async def amatch_request(self, request: HttpRequest) -> bool | None:
+        """Async version of match_request."""
+        return self._decide(*(await self._amatch_on_request(request)))
+
+    def _decide(self, excluded: bool, matched: bool | None) -> bool | None:
+        if excluded:
+            return False
+        if matched is False and settings.CUSTOM_FUNCTIONS:
+            return None
+        return matched
+
+    def _match_on_request(self, request: HttpRequest) -> tuple[bool, bool | None]:
+        """
+        Return (excluded, matched) for a request before it is processed.
+
+        The path is matched first, as it is cheap, and the global exclude
+        function (which may load the user) only called if a rule could match
+        or there are CUSTOM_FUNCTIONS. `matched` is the outcome of the rules
+        alone - None if it depends on a user that isn't yet known.
+
+        """
+        matcher = get_matcher()
+        matched = matcher.pre_match(request.path)
+        if matched is False and not settings.CUSTOM_FUNCTIONS:
+            return True, False
+        if settings.GLOBAL_EXCLUDE_FUNC(request) is False:
+            return True, False
+        if matched is None and hasattr(request, "user"):
+            matched = matcher.match(request.path, request.user, deferred=True)
+        return False, matched
+
+    async def _amatch_on_request(
+        self, request: HttpRequest
+    ) -> tuple[bool, bool | None]:
+        """Async version of _match_on_request."""
+        matcher = await aget_matcher()
+        matched = matcher.pre_match(request.path)
+        if matched is False and not settings.CUSTOM_FUNCTIONS:
+            return True, False
+        await _aload_user(request)
+        if settings.GLOBAL_EXCLUDE_FUNC(request) is False:
+            return True, False
+        if matched is None and hasattr(request, "user"):
+            matched = await matcher.amatch(request.path, request.user, deferred=True)
+        return False, matched
+
+    def _start(self, request: HttpRequest, is_matched: bool | None) -> bool:
         request.profiler = ProfilingRecord().start()
-        if (
+        request.profiler.is_matched = is_matched
+        # force the creation of a valid session by saving it.
+        return (
             hasattr(request, "session")
             and request.session.session_key is None
             and settings.STORE_ANONYMOUS_SESSIONS is True
-        ):
+        )
+
+    def process_request(self, request: HttpRequest) -> None:
+        """Start profiling."""
+        is_matched = None
+        if settings.MATCH_ON_REQUEST:
+            excluded, is_matched = self._match_on_request(request)
+            if self._decide(excluded, is_matched) is False:
+                return
+        if self._start(request, is_matched):
             request.session.save()
         request.profiler.process_request(request)
 
+    async def aprocess_request(self, request: HttpRequest) -> None:
+        """Async version of process_request."""
+        is_matched = None
+        if settings.MATCH_ON_REQUEST:
+            excluded, is_matched = await self._amatch_on_request(request)
+            if self._decide(excluded, is_matched) is False:
+                return
+        if self._start(request, is_matched):
+            if hasattr(request.session, "asave"):
+                await request.session.asave()
+            else:
+                await sync_to_async(request.session.save)()
+        await _aload_user(request)
+        request.profiler.process_request(request)
+
     def process_view(
         self,
         request: HttpRequest,
@@ -61,38 +189,61 @@ class ProfilingMiddleware(MiddlewareMixin):
         view_kwargs: Any,
     ) -> None:
         """Add view_func to the profiler info."""
-        request.profiler.process_view(request, view_func)
+        if hasattr(request, "profiler"):
+            request.profiler.process_view(request, view_func)
 
-    def process_response(
+    async def aprocess_view(
+        self,
+        request: HttpRequest,
+        view_func: Callable,
+        view_args: Any,
+        view_kwargs: Any,
+    ) -> None:
+        """Async version of process_view."""
+        if hasattr(request, "profiler"):
+            request.profiler.process_view(request, view_func)
+
+    def process_template_response(
         self, request: HttpRequest, response: HttpResponse
     ) -> HttpResponse:
-        """
-        Add response information and save the profiler record.
-
-        By the time we get here, we've run all the middleware, the view_func
-        has been called, and we've rendered the templates.
+        """Record the end of the view, before the response is rendered."""
+        if hasattr(request, "profiler"):
+            request.profiler.process_template_response(response)
+        return response
 
-        This is the last chance to override the profiler and halt the saving
-        of the profiler record instance. This is done by sending out a signal
-        and aborting the save if any listeners respond False.
+    async def aprocess_template_response(
+        self, request: HttpRequest, response: HttpResponse
+    ) -> HttpResponse:
+        """Async version of process_template_response."""
+        if hasattr(request, "profiler"):
+            request.profiler.process_template_response(response)
+        return response
 
-        """
+    def _get_profiler(self, request: HttpRequest) -> ProfilingRecord | None:
+        """Return the request profiler, or None if it is excluded."""
         try:
             profiler = request.profiler
         except AttributeError:
+            if settings.MATCH_ON_REQUEST:
+                # request was excluded by match_request
+                return None
             raise BadProfilerError("Request has no profiler attached.")
 
         # call the global exclude first, as there's no point continuing if this
         # says no.
         if settings.GLOBAL_EXCLUDE_FUNC(request) is False:
             del request.profiler
-            return response
-
-        # see if we have any matching rules
-        matches_rules = self.match_rules(request, RuleSet.objects.live_rules())
-        matches_funcs = self.match_funcs(request)
-        log_request = matches_rules or matches_funcs
+            return None
+        return profiler
 
+    def _complete(
+        self,
+        request: HttpRequest,
+        response: HttpResponse,
+        profiler: ProfilingRecord,
+        log_request: bool,
+    ) -> bool:
+        """Extract response properties, and return True if it should be captured."""
         # clean up after ourselves
         if not log_request:
             logger.debug(
@@ -100,7 +251,7 @@ class ProfilingMiddleware(MiddlewareMixin):
                 request.profiler,
             )
             del request.profiler
-            return response
+            return False
 
         # extract properties from response for storing later
         profiler.process_response(response)
@@ -114,7 +265,67 @@ class ProfilingMiddleware(MiddlewareMixin):
         )
         # if any signal receivers have called cancel() on the profiler,
         # then we do not want to capture it.
-        if profiler.is_running:
+        return profiler.is_running
+
+    def process_response(
+        self, request: HttpRequest, response: HttpResponse
+    ) -> HttpResponse:
+        """
+        Add response information and save the profiler record.
+
+        By the time we get here, we've run all the middleware, the view_func
+        has been called, and we've rendered the templates.
+
+        This is the last chance to override the profiler and halt the saving
+        of the profiler record instance. This is done by sending out a signal
+        and aborting the save if any listeners respond False.
+
+        """
+        if (profiler := self._get_profiler(request)) is None:
+            return response
+
+        # see if we have any matching rules, unless that's already known
+        if profiler.is_matched:
+            log_request = True
+        elif profiler.is_matched is False:
+            # the rules were matched (and sampled) on the request
+            log_request = self.match_funcs(request)
+        else:
+            user = getattr(request, "user", AnonymousUser())
+            matches_rules = get_matcher().match(
+                request.path, user, deferred=settings.MATCH_ON_REQUEST
+            )
+            log_request = matches_rules or self.match_funcs(request)
+
+        if self._complete(request, response, profiler, log_request):
             profiler.capture()
 
         return response
+
+    async def aprocess_response(
+        self, request: HttpRequest, response: HttpResponse
+    ) -> HttpResponse:
+        """Async version of process_response."""
+        if settings.MATCH_ON_REQUEST and not hasattr(request, "profiler"):
+            # excluded by match_request - don't load the user
+            return response
+        await _aload_user(request)
+        if (profiler := self._get_profiler(request)) is None:
+            return response
+
+        if profiler.is_matched:
+            log_request = True
+        elif profiler.is_matched is False:
+            log_request = self.match_funcs(request)
+        else:
+            user = getattr(request, "user", AnonymousUser())
+            matcher = await aget_matcher()
+            matches_rules = await matcher.amatch(
+                request.path, user, deferred=settings.MATCH_ON_REQUEST
+            )
+            log_request = matches_rules or self.match_funcs(request)
+
+        if self._complete(request, response, profiler, log_request):
+            await profiler.acapture()
+
+        return response
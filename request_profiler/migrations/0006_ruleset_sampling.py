@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:43
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("request_profiler", "0005_alter_profilingrecord_id_alter_ruleset_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ruleset",
+            name="max_records_per_second",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Maximum number of requests to profile per second (in each process). Leave blank for no limit.",
+                null=True,
+                verbose_name="Max records per second",
+            ),
+        ),
+        migrations.AddField(
+            model_name="ruleset",
+            name="sample_rate",
+            field=models.FloatField(
+                default=1.0,
+                help_text="Proportion of matching requests to profile, from 0 to 1.",
+                validators=[
+                    django.core.validators.MinValueValidator(0.0),
+                    django.core.validators.MaxValueValidator(1.0),
+                ],
+                verbose_name="Sample rate",
+            ),
+        ),
+    ]
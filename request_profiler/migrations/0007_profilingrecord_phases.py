@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("request_profiler", "0006_ruleset_sampling"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profilingrecord",
+            name="response_duration",
+            field=models.FloatField(
+                blank=True,
+                help_text="Time from the view returning a TemplateResponse until the response was complete, including rendering the template.",
+                null=True,
+                verbose_name="Response duration (sec)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="profilingrecord",
+            name="time_to_view",
+            field=models.FloatField(
+                blank=True,
+                help_text="Time from the start of the request until the view was called.",
+                null=True,
+                verbose_name="Time to view (sec)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="profilingrecord",
+            name="view_duration",
+            field=models.FloatField(
+                blank=True,
+                help_text="Time spent in the view. Unless the view returns a TemplateResponse this includes the response processing of any later middleware.",
+                null=True,
+                verbose_name="View duration (sec)",
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("request_profiler", "0007_profilingrecord_phases"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profilingrecord",
+            name="query_duration",
+            field=models.FloatField(
+                blank=True,
+                help_text="Total time spent running database queries.",
+                null=True,
+                verbose_name="Query duration (sec)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="profilingrecord",
+            name="slowest_query_duration",
+            field=models.FloatField(
+                blank=True,
+                help_text="Time taken by the slowest database query.",
+                null=True,
+                verbose_name="Slowest query duration (sec)",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="profilingrecord",
+            name="query_count",
+            field=models.IntegerField(
+                blank=True,
+                help_text="Number of database queries run during request.",
+                null=True,
+            ),
+        ),
+    ]
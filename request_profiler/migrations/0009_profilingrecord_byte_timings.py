@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("request_profiler", "0008_profilingrecord_queries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profilingrecord",
+            name="time_to_first_byte",
+            field=models.FloatField(
+                blank=True,
+                help_text="Time from the start of the request until the first chunk of a streaming response was sent.",
+                null=True,
+                verbose_name="Time to first byte (sec)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="profilingrecord",
+            name="time_to_last_byte",
+            field=models.FloatField(
+                blank=True,
+                help_text="Time from the start of the request until a streaming response had been sent in full.",
+                null=True,
+                verbose_name="Time to last byte (sec)",
+            ),
+        ),
+    ]
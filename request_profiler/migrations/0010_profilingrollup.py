@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("request_profiler", "0009_profilingrecord_byte_timings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProfilingRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[
+                            ("minute", "Minute"),
+                            ("hour", "Hour"),
+                            ("day", "Day"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "bucket_start",
+                    models.DateTimeField(verbose_name="Period started at"),
+                ),
+                (
+                    "view_func_name",
+                    models.CharField(max_length=100, verbose_name="View function"),
+                ),
+                (
+                    "status_class",
+                    models.PositiveSmallIntegerField(
+                        help_text="Response status code class, e.g. 2 for 2xx responses."
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "duration_sum",
+                    models.FloatField(
+                        default=0, verbose_name="Total request duration (sec)"
+                    ),
+                ),
+                (
+                    "duration_max",
+                    models.FloatField(
+                        default=0, verbose_name="Longest request duration (sec)"
+                    ),
+                ),
+                (
+                    "histogram",
+                    models.JSONField(
+                        default=list,
+                        help_text="Number of requests in each duration bucket.",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "period",
+                            "bucket_start",
+                            "view_func_name",
+                            "status_class",
+                        ),
+                        name="unique_profiling_rollup",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("request_profiler", "0010_profilingrollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ViewSketch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "view_func_name",
+                    models.CharField(max_length=100, verbose_name="View function"),
+                ),
+                (
+                    "period_start",
+                    models.DateTimeField(verbose_name="Period started at"),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "sketch",
+                    models.BinaryField(
+                        help_text="Serialized QuantileSketch of durations."
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("view_func_name", "period_start"),
+                        name="unique_view_sketch",
+                    )
+                ],
+            },
+        ),
+    ]
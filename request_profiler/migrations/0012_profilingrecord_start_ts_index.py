@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:57
+
+from django.db import migrations, models
+
+from request_profiler.operations import AddFieldIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    # the index is created CONCURRENTLY on PostgreSQL
+    atomic = False
+
+    dependencies = [
+        ("request_profiler", "0011_viewsketch"),
+    ]
+
+    operations = [
+        AddFieldIndexConcurrently(
+            model_name="profilingrecord",
+            name="start_ts",
+            field=models.DateTimeField(
+                db_index=True, verbose_name="Request started at"
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:01
+
+from django.db import migrations, models
+
+from request_profiler.operations import AddIndexConcurrently
+
+BRIN_INDEX = "request_prof_start_ts_brin"
+
+
+def create_brin_index(apps, schema_editor):
+    # BRIN indexes are tiny, and suit start_ts as records are inserted in
+    # (roughly) start_ts order. PostgreSQL only.
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE INDEX CONCURRENTLY {BRIN_INDEX} "
+            "ON request_profiler_profilingrecord "
+            "USING brin (start_ts)"
+        )
+
+
+def drop_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {BRIN_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    # the indexes are created CONCURRENTLY on PostgreSQL
+    atomic = False
+
+    dependencies = [
+        ("request_profiler", "0012_profilingrecord_start_ts_index"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="profilingrecord",
+            index=models.Index(
+                fields=["view_func_name", "start_ts"], name="request_prof_view_ts_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="profilingrecord",
+            index=models.Index(
+                fields=["request_uri", "start_ts"], name="request_prof_uri_ts_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="profilingrecord",
+            index=models.Index(
+                fields=["response_status_code", "start_ts"],
+                name="request_prof_status_ts_idx",
+            ),
+        ),
+        migrations.RunPython(create_brin_index, drop_brin_index),
+    ]
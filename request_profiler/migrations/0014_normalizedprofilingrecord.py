@@ -0,0 +1,170 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("request_profiler", "0013_profilingrecord_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Referer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.CharField(max_length=400, unique=True)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="RequestPath",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.CharField(max_length=400, unique=True)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="UserAgent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.CharField(max_length=400, unique=True)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="ViewFunction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.CharField(max_length=400, unique=True)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="NormalizedProfilingRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("session_key", models.CharField(blank=True, max_length=40)),
+                (
+                    "start_ts",
+                    models.DateTimeField(
+                        db_index=True, verbose_name="Request started at"
+                    ),
+                ),
+                ("end_ts", models.DateTimeField(verbose_name="Request ended at")),
+                ("duration", models.FloatField(verbose_name="Request duration (sec)")),
+                ("http_method", models.CharField(max_length=10)),
+                ("query_string", models.TextField(blank=True)),
+                ("remote_addr", models.CharField(max_length=100)),
+                ("response_status_code", models.IntegerField()),
+                ("response_content_length", models.IntegerField()),
+                ("query_count", models.IntegerField(blank=True, null=True)),
+                ("query_duration", models.FloatField(blank=True, null=True)),
+                ("slowest_query_duration", models.FloatField(blank=True, null=True)),
+                ("time_to_view", models.FloatField(blank=True, null=True)),
+                ("view_duration", models.FloatField(blank=True, null=True)),
+                ("response_duration", models.FloatField(blank=True, null=True)),
+                ("time_to_first_byte", models.FloatField(blank=True, null=True)),
+                ("time_to_last_byte", models.FloatField(blank=True, null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "referer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="request_profiler.referer",
+                    ),
+                ),
+                (
+                    "request_path",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="request_profiler.requestpath",
+                    ),
+                ),
+                (
+                    "user_agent",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="request_profiler.useragent",
+                    ),
+                ),
+                (
+                    "view_function",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        to="request_profiler.viewfunction",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["view_function", "start_ts"],
+                        name="request_prof_norm_view_ts_idx",
+                    )
+                ],
+            },
+        ),
+    ]
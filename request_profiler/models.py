@@ -1,20 +1,31 @@
 from __future__ import annotations
 
+import datetime
 import logging
 import re
-from typing import Any, Callable
+import time
+import uuid
+from typing import Any, Callable, Iterable
 
 from django.conf import settings as django_settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import connection, models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import IntegrityError, models, transaction
 from django.db.models.query import QuerySet
-from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpRequest, HttpResponse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _lazy
 
 from . import settings
+from .queries import QueryCounter
+from .sketches import QuantileSketch, registry
+from .streaming import StreamCounter
+from .writers import get_writer
 
 logger = logging.getLogger(__name__)
 
@@ -23,18 +34,88 @@ class BadProfilerError(ValueError):
     pass
 
 
+def _seconds(nanoseconds: int) -> float:
+    """Convert a time.perf_counter_ns() interval to seconds."""
+    return nanoseconds / 1e9
+
+
+def get_ruleset_version() -> str:
+    """Return the current version stamp for the rules, shared via the cache."""
+    if (version := cache.get(settings.RULESET_CACHE_KEY)) is None:
+        cache.add(settings.RULESET_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        # another process may have got there first
+        version = cache.get(settings.RULESET_CACHE_KEY, uuid.uuid4().hex)
+    return version
+
+
+async def aget_ruleset_version() -> str:
+    """Async version of get_ruleset_version."""
+    if (version := await cache.aget(settings.RULESET_CACHE_KEY)) is None:
+        await cache.aadd(settings.RULESET_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        version = await cache.aget(settings.RULESET_CACHE_KEY, uuid.uuid4().hex)
+    return version
+
+
+def bump_ruleset_version() -> str:
+    """Set a new version stamp, invalidating the rules cached by each process."""
+    version = uuid.uuid4().hex
+    cache.set(settings.RULESET_CACHE_KEY, version, timeout=None)
+    return version
+
+
+# attribute used to memoise a user's group names for the rest of the request
+GROUP_NAMES_ATTR = "_request_profiler_group_names"
+
+
+def _group_names_cache_key(user_pk: Any) -> str:
+    return f"request_profiler:group_names:{user_pk}"
+
+
+def get_group_names(user: django_settings.AUTH_USER_MODEL) -> frozenset[str]:
+    """
+    Return the (lowercased) names of the groups the user belongs to.
+
+    The names are loaded with a single query and memoised on the user object
+    (i.e. for the request), so that any number of group rules can be matched
+    against them. If GROUP_CACHE_TIMEOUT is set they are also cached per user.
+
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    if (names := getattr(user, GROUP_NAMES_ATTR, None)) is not None:
+        return names
+    key = _group_names_cache_key(user.pk)
+    if not settings.GROUP_CACHE_TIMEOUT or (names := cache.get(key)) is None:
+        names = frozenset(n.lower() for n in user.groups.values_list("name", flat=True))
+        if settings.GROUP_CACHE_TIMEOUT:
+            cache.set(key, names, settings.GROUP_CACHE_TIMEOUT)
+    setattr(user, GROUP_NAMES_ATTR, names)
+    return names
+
+
+async def aget_group_names(user: django_settings.AUTH_USER_MODEL) -> frozenset[str]:
+    """Async version of get_group_names."""
+    if not user.is_authenticated:
+        return frozenset()
+    if (names := getattr(user, GROUP_NAMES_ATTR, None)) is not None:
+        return names
+    key = _group_names_cache_key(user.pk)
+    if not settings.GROUP_CACHE_TIMEOUT or (names := await cache.aget(key)) is None:
+        names = frozenset(
+            [n.lower() async for n in user.groups.values_list("name", flat=True)]
+        )
+        if settings.GROUP_CACHE_TIMEOUT:
+            await cache.aset(key, names, settings.GROUP_CACHE_TIMEOUT)
+    setattr(user, GROUP_NAMES_ATTR, names)
+    return names
+
+
 class RuleSetQuerySet(models.query.QuerySet):
     """Custom QuerySet for RuleSet instances."""
 
     def live_rules(self) -> QuerySet:
         """Return enabled rules."""
-        rulesets = cache.get(settings.RULESET_CACHE_KEY)
-        if rulesets is None:
-            rulesets = self.filter(enabled=True)
-            cache.set(
-                settings.RULESET_CACHE_KEY, rulesets, settings.RULESET_CACHE_TIMEOUT
-            )
-        return rulesets
+        return self.filter(enabled=True)
 
 
 class RuleSet(models.Model):
@@ -72,6 +153,21 @@ class RuleSet(models.Model):
         help_text="Group used to filter users.",
         verbose_name="User group filter",
     )
+    sample_rate = models.FloatField(
+        default=1.0,
+        validators=[MinValueValidator(0.0), MaxValueValidator(1.0)],
+        help_text="Proportion of matching requests to profile, from 0 to 1.",
+        verbose_name="Sample rate",
+    )
+    max_records_per_second = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text=(
+            "Maximum number of requests to profile per second (in each "
+            "process). Leave blank for no limit."
+        ),
+        verbose_name="Max records per second",
+    )
     # use the custom model manager
     objects = RuleSetQuerySet.as_manager()
 
@@ -135,12 +231,78 @@ class RuleSet(models.Model):
 
         if self.user_filter_type == RuleSet.USER_FILTER_GROUP:
             group = self.user_group_filter.strip()
-            return user.groups.filter(name__iexact=group).exists()
+            return group.lower() in get_group_names(user)
 
         # if we're still going, then it's a no. it's also an invalid
         # user_filter_type, so we may want to think about a warning
         return False
 
+    async def amatch_user(self, user: django_settings.AUTH_USER_MODEL) -> bool:
+        """Async version of match_user."""
+        if self.user_filter_type == RuleSet.USER_FILTER_GROUP:
+            user = user or AnonymousUser()
+            group = self.user_group_filter.strip()
+            return group.lower() in await aget_group_names(user)
+        return self.match_user(user)
+
+
+@receiver(post_save, sender=RuleSet)
+@receiver(post_delete, sender=RuleSet)
+def on_ruleset_changed(sender: type[RuleSet], **kwargs: Any) -> None:
+    """
+    Invalidate the cached rules when a RuleSet is saved or deleted.
+
+    The version is bumped immediately, and again once the transaction has
+    been committed, so that other processes can't cache the old rules under
+    the new version stamp.
+
+    NB QuerySet.update() does not send signals - call bump_ruleset_version()
+    after any bulk updates.
+
+    """
+    bump_ruleset_version()
+    transaction.on_commit(bump_ruleset_version)
+
+
+@receiver(m2m_changed)
+def on_user_groups_changed(
+    sender: type[models.Model],
+    instance: models.Model,
+    action: str,
+    reverse: bool,
+    pk_set: set[Any] | None,
+    **kwargs: Any,
+) -> None:
+    """
+    Clear the memoised / cached group names when a user's groups change.
+
+    NB the group names are not cleared if a Group is renamed or deleted -
+    keep GROUP_CACHE_TIMEOUT short.
+
+    """
+    user_model = get_user_model()
+    if sender is not getattr(getattr(user_model, "groups", None), "through", None):
+        return
+    user_pks: Iterable[Any]
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        # user.groups.add(...) etc.
+        instance.__dict__.pop(GROUP_NAMES_ATTR, None)
+        user_pks = [instance.pk]
+    elif not settings.GROUP_CACHE_TIMEOUT:
+        return
+    elif reverse and action in ("post_add", "post_remove"):
+        # group.user_set.add(...) etc.
+        user_pks = pk_set or []
+    elif reverse and action == "pre_clear":
+        # the users are unknown once the group has been cleared
+        user_pks = user_model.objects.filter(groups=instance).values_list(
+            "pk", flat=True
+        )
+    else:
+        return
+    if settings.GROUP_CACHE_TIMEOUT:
+        cache.delete_many([_group_names_cache_key(pk) for pk in user_pks])
+
 
 class ProfilingRecord(models.Model):
     """Record of a request and its response."""
@@ -152,7 +314,7 @@ class ProfilingRecord(models.Model):
         blank=True,
     )
     session_key = models.CharField(blank=True, max_length=40)
-    start_ts = models.DateTimeField(verbose_name="Request started at")
+    start_ts = models.DateTimeField(verbose_name="Request started at", db_index=True)
     end_ts = models.DateTimeField(verbose_name="Request ended at")
     duration = models.FloatField(verbose_name="Request duration (sec)")
     http_method = models.CharField(max_length=10)
@@ -165,16 +327,98 @@ class ProfilingRecord(models.Model):
     response_status_code = models.IntegerField()
     response_content_length = models.IntegerField()
     query_count = models.IntegerField(
-        help_text="Number of database queries logged during request.",
+        help_text="Number of database queries run during request.",
+        blank=True,
+        null=True,
+    )
+    query_duration = models.FloatField(
+        help_text="Total time spent running database queries.",
+        verbose_name="Query duration (sec)",
+        blank=True,
+        null=True,
+    )
+    slowest_query_duration = models.FloatField(
+        help_text="Time taken by the slowest database query.",
+        verbose_name="Slowest query duration (sec)",
+        blank=True,
+        null=True,
+    )
+    time_to_view = models.FloatField(
+        help_text="Time from the start of the request until the view was called.",
+        verbose_name="Time to view (sec)",
+        blank=True,
+        null=True,
+    )
+    view_duration = models.FloatField(
+        help_text=(
+            "Time spent in the view. Unless the view returns a TemplateResponse "
+            "this includes the response processing of any later middleware."
+        ),
+        verbose_name="View duration (sec)",
+        blank=True,
+        null=True,
+    )
+    response_duration = models.FloatField(
+        help_text=(
+            "Time from the view returning a TemplateResponse until the response "
+            "was complete, including rendering the template."
+        ),
+        verbose_name="Response duration (sec)",
+        blank=True,
+        null=True,
+    )
+    time_to_first_byte = models.FloatField(
+        help_text=(
+            "Time from the start of the request until the first chunk of a "
+            "streaming response was sent."
+        ),
+        verbose_name="Time to first byte (sec)",
         blank=True,
         null=True,
     )
+    time_to_last_byte = models.FloatField(
+        help_text=(
+            "Time from the start of the request until a streaming response "
+            "had been sent in full."
+        ),
+        verbose_name="Time to last byte (sec)",
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        # start_ts is indexed on its own for the admin (and truncation); these
+        # cover the usual filters over a time range. see also migration 0013,
+        # which adds a BRIN index on start_ts on PostgreSQL.
+        indexes = [
+            models.Index(
+                fields=["view_func_name", "start_ts"], name="request_prof_view_ts_idx"
+            ),
+            models.Index(
+                fields=["request_uri", "start_ts"], name="request_prof_uri_ts_idx"
+            ),
+            models.Index(
+                fields=["response_status_code", "start_ts"],
+                name="request_prof_status_ts_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return "Profiling record #{}".format(self.pk)
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         self.is_running = False
+        # set by the middleware if the rules were matched on the request -
+        # None if they are still to be matched on the response
+        self.is_matched: bool | None = None
+        # time.perf_counter_ns() values used to calculate durations
+        self._start_ns = 0
+        self._view_start_ns: int | None = None
+        self._view_end_ns: int | None = None
+        self._queries = QueryCounter()
+        # set if the response is streamed, see process_response
+        self._stream: StreamCounter | None = None
+        self._write_on_close = False
         super().__init__(*args, **kwargs)
 
     def save(self, *args: Any, **kwargs: Any) -> ProfilingRecord:
@@ -185,7 +429,7 @@ class ProfilingRecord(models.Model):
     def elapsed(self) -> float:
         """Time (in seconds) elapsed so far."""
         self.check_is_running()
-        return (timezone.now() - self.start_ts).total_seconds()
+        return _seconds(time.perf_counter_ns() - self._start_ns)
 
     def process_request(self, request: HttpRequest) -> None:
         """Extract values from HttpRequest and store locally."""
@@ -222,20 +466,61 @@ class ProfilingRecord(models.Model):
         )
 
     def _content_length(self, response: HttpResponse) -> int:
-        """Return the response content length."""
-        if isinstance(response, StreamingHttpResponse):
+        """Return the response content length, or -1 if it is not yet known."""
+        try:
+            return int(response["Content-Length"])
+        except (KeyError, ValueError):
+            pass
+        if response.streaming:
             return -1
+        # response.content would join the chunks into a new bytes object
+        if (container := getattr(response, "_container", None)) is not None:
+            return sum(len(chunk) for chunk in container)
         return len(response.content)
 
     def process_view(self, request: HttpRequest, view_func: Callable) -> None:
         """Handle the process_view middleware event."""
+        self._view_start_ns = time.perf_counter_ns()
         self.view_func_name = self._extract_view_func_name(view_func)
 
+    def process_template_response(self, response: HttpResponse) -> None:
+        """Handle the process_template_response middleware event."""
+        # called as soon as the view returns, before the template is rendered
+        self._view_end_ns = time.perf_counter_ns()
+
     def process_response(self, response: HttpResponse) -> None:
         """Extract values from HttpResponse and store locally."""
         self.response = response
         self.response_status_code = response.status_code
         self.response_content_length = self._content_length(response)
+        if response.streaming:
+            # the bytes are counted as they are sent, and the record is only
+            # written once the response has been closed.
+            self._stream = StreamCounter.wrap(response, self._stream_closed)
+
+    def _stream_closed(self, stream: StreamCounter) -> None:
+        if stream.is_iterated:
+            self.response_content_length = stream.count
+        if stream.first_byte_ns is not None:
+            self.time_to_first_byte = _seconds(stream.first_byte_ns - self._start_ns)
+        if stream.last_byte_ns is not None:
+            self.time_to_last_byte = _seconds(stream.last_byte_ns - self._start_ns)
+        if not self._write_on_close:
+            return
+        if self.is_running and stream.closed_ns is not None:
+            # capture was deferred (DEFER_STREAMING_CAPTURE) - the headers
+            # have been sent, so there's no X-Profiler-Duration header.
+            self._stop(stream.closed_ns)
+        try:
+            get_writer().write(self)
+        except Exception:
+            # HttpResponse.close() silently swallows any exception
+            logger.exception("Error writing %r.", self)
+
+    @property
+    def is_streaming(self) -> bool:
+        """True if the response is being streamed, and has not yet closed."""
+        return self._stream is not None and not self._stream.is_closed
 
     def check_is_running(self) -> ProfilingRecord:
         """Raise BadProfilerError if profile is not running."""
@@ -246,27 +531,53 @@ class ProfilingRecord(models.Model):
         return self
 
     def start(self) -> ProfilingRecord:
-        """Set start_ts from current datetime."""
+        """Set start_ts from current datetime, and start the timer."""
         self.is_running = True
         self.start_ts = timezone.now()
+        self._start_ns = time.perf_counter_ns()
+        self._view_start_ns = self._view_end_ns = None
         self.end_ts = None
         self.duration = None
+        self.time_to_view = self.view_duration = self.response_duration = None
+        self.time_to_first_byte = self.time_to_last_byte = None
+        self._stream = None
+        self._write_on_close = False
         self.query_count = 0
-        self._query_count = len(connection.queries)
-        self._force_debug_cursor = connection.force_debug_cursor
-        connection.force_debug_cursor = settings.FORCE_DEBUG_CURSOR
+        self.query_duration = self.slowest_query_duration = None
+        self._queries = QueryCounter().start()
         return self
 
+    def _set_phases(self, end_ns: int) -> None:
+        if self._view_start_ns is None:
+            return
+        self.time_to_view = _seconds(self._view_start_ns - self._start_ns)
+        view_end_ns = self._view_end_ns or end_ns
+        self.view_duration = _seconds(view_end_ns - self._view_start_ns)
+        if self._view_end_ns is not None:
+            self.response_duration = _seconds(end_ns - self._view_end_ns)
+
+    def _set_queries(self) -> None:
+        queries = self._queries.stop()
+        self.query_count = queries.count
+        self.query_duration = _seconds(queries.total_ns)
+        self.slowest_query_duration = _seconds(queries.slowest_ns)
+
+    def _stop(self, end_ns: int) -> None:
+        self.duration = _seconds(end_ns - self._start_ns)
+        # the monotonic timer is the source of truth, end_ts is for display
+        self.end_ts = self.start_ts + datetime.timedelta(seconds=self.duration)
+        self._set_phases(end_ns)
+        self._set_queries()
+        self.is_running = False
+        if settings.SKETCHES_ENABLED:
+            registry.add_record(self)
+
     def stop(self) -> ProfilingRecord:
-        """Set end_ts and duration from current datetime."""
+        """Stop the timer, and set the durations and query counts."""
         self.check_is_running()
-        self.end_ts = timezone.now()
-        self.duration = (self.end_ts - self.start_ts).total_seconds()
-        self.query_count = len(connection.queries) - self._query_count
-        connection.force_debug_cursor = self._force_debug_cursor
+        self._stop(time.perf_counter_ns())
         if hasattr(self, "response"):
             self.response["X-Profiler-Duration"] = self.duration
-        self.is_running = False
         return self
 
     def cancel(self) -> ProfilingRecord:
@@ -275,8 +586,306 @@ class ProfilingRecord(models.Model):
         self.end_ts = None
         self.duration = None
         self.is_running = False
+        self._queries.stop()
         return self
 
+    def _capture(self) -> bool:
+        """Stop the record (unless deferred), returning True if ready to write."""
+        self.check_is_running()
+        if not self.is_streaming:
+            self.stop()
+            return True
+        # streamed records are written when the response closes (and with
+        # DEFER_STREAMING_CAPTURE only stopped then) - see _stream_closed
+        if not settings.DEFER_STREAMING_CAPTURE:
+            self.stop()
+        self._write_on_close = True
+        return False
+
     def capture(self) -> ProfilingRecord:
-        """Call stop and save."""
-        return self.check_is_running().stop().save()
+        """
+        Call stop and hand the record over to the configured writer.
+
+        If the response is being streamed the record is handed over when the
+        response is closed instead, once the content length is known.
+
+        """
+        if self._capture():
+            get_writer().write(self)
+        return self
+
+    async def acapture(self) -> ProfilingRecord:
+        """Async version of capture."""
+        if self._capture():
+            await get_writer().awrite(self)
+        return self
+
+
+class ProfilingRollup(models.Model):
+    """
+    Pre-aggregated counts and duration histogram of the records in a period.
+
+    There is one rollup per view function, response status class (2 for 2xx
+    etc.) and period (minute, hour or day, starting at bucket_start, in UTC).
+    The histogram holds the number of requests whose duration was up to each
+    of HISTOGRAM_BOUNDS seconds (exclusive of the previous bound), with a
+    final count for longer requests. Rollups are kept when the raw records
+    are truncated.
+
+    """
+
+    PERIOD_MINUTE = "minute"
+    PERIOD_HOUR = "hour"
+    PERIOD_DAY = "day"
+
+    PERIOD_CHOICES = (
+        (PERIOD_MINUTE, "Minute"),
+        (PERIOD_HOUR, "Hour"),
+        (PERIOD_DAY, "Day"),
+    )
+
+    # upper bounds (sec) of the histogram buckets - changing these requires
+    # all rollups to be recalculated from the raw records.
+    HISTOGRAM_BOUNDS = (
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+    )
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField(verbose_name="Period started at")
+    view_func_name = models.CharField(max_length=100, verbose_name="View function")
+    status_class = models.PositiveSmallIntegerField(
+        help_text="Response status code class, e.g. 2 for 2xx responses."
+    )
+    count = models.PositiveIntegerField(default=0)
+    duration_sum = models.FloatField(
+        default=0, verbose_name="Total request duration (sec)"
+    )
+    duration_max = models.FloatField(
+        default=0, verbose_name="Longest request duration (sec)"
+    )
+    histogram = models.JSONField(
+        default=list, help_text="Number of requests in each duration bucket."
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["period", "bucket_start", "view_func_name", "status_class"],
+                name="unique_profiling_rollup",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return "Profiling rollup #{}".format(self.pk)
+
+    @property
+    def duration_mean(self) -> float | None:
+        return self.duration_sum / self.count if self.count else None
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Return the estimated duration at quantile q (0 to 1), or None if empty.
+
+        Durations are assumed to be evenly distributed within each histogram
+        bucket; the final (unbounded) bucket is capped at duration_max.
+
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        bounds = self.HISTOGRAM_BOUNDS + (self.duration_max,)
+        for upper, count in zip(bounds, self.histogram):
+            upper = min(upper, self.duration_max)
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.duration_max
+
+
+class ViewSketchQuerySet(models.query.QuerySet):
+    """Custom QuerySet for ViewSketch instances."""
+
+    def merge_sketch(
+        self,
+        view_func_name: str,
+        period_start: datetime.datetime,
+        sketch: QuantileSketch,
+    ) -> ViewSketch:
+        """Merge sketch into the stored sketch for the view and period."""
+        key = {"view_func_name": view_func_name, "period_start": period_start}
+        with transaction.atomic():
+            view_sketch = self.select_for_update().filter(**key).first()
+            if view_sketch is None:
+                try:
+                    with transaction.atomic():
+                        return self.create(
+                            **key, count=sketch.count, sketch=sketch.to_bytes()
+                        )
+                except IntegrityError:
+                    # another process created it first
+                    view_sketch = self.select_for_update().get(**key)
+            merged = view_sketch.get_sketch()
+            merged.merge(sketch)
+            view_sketch.count = merged.count
+            view_sketch.sketch = merged.to_bytes()
+            view_sketch.save()
+        return view_sketch
+
+    def merged(self) -> QuantileSketch:
+        """Return a single sketch merged from all the sketches in the queryset."""
+        result = QuantileSketch()
+        for data in self.values_list("sketch", flat=True).iterator():
+            result.merge(QuantileSketch.from_bytes(data))
+        return result
+
+
+class ViewSketch(models.Model):
+    """
+    Quantile sketch of the request durations of a view over a period.
+
+    These are filled by the in-process sketch registry (see SKETCHES_ENABLED),
+    and can be merged - across views and periods - to estimate percentiles
+    without the raw records, e.g.
+
+        ViewSketch.objects.filter(view_func_name="foo").merged().quantile(0.99)
+
+    """
+
+    view_func_name = models.CharField(max_length=100, verbose_name="View function")
+    period_start = models.DateTimeField(verbose_name="Period started at")
+    count = models.PositiveIntegerField(default=0)
+    sketch = models.BinaryField(help_text="Serialized QuantileSketch of durations.")
+
+    objects = ViewSketchQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["view_func_name", "period_start"], name="unique_view_sketch"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return "View sketch #{}".format(self.pk)
+
+    def get_sketch(self) -> QuantileSketch:
+        return QuantileSketch.from_bytes(self.sketch)
+
+
+class Dimension(models.Model):
+    """Distinct string value referenced by NormalizedProfilingRecord."""
+
+    value = models.CharField(max_length=400, unique=True)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class RequestPath(Dimension):
+    pass
+
+
+class UserAgent(Dimension):
+    pass
+
+
+class Referer(Dimension):
+    pass
+
+
+class ViewFunction(Dimension):
+    pass
+
+
+class NormalizedProfilingRecordQuerySet(models.QuerySet):
+    def with_values(self) -> NormalizedProfilingRecordQuerySet:
+        """Fetch the dimension values in the same query."""
+        return self.select_related(*NormalizedProfilingRecord.DIMENSIONS)
+
+
+class NormalizedProfilingRecord(models.Model):
+    """
+    Compact copy of a ProfilingRecord, written by the NormalizedWriter.
+
+    The long, repeated strings (path, user agent, referer and view function)
+    are held once each in the dimension tables and referenced by id, so each
+    row (and its indexes) is a fraction of the size of a ProfilingRecord.
+
+    """
+
+    # dimension field: the ProfilingRecord field it holds
+    DIMENSIONS = {
+        "request_path": "request_uri",
+        "user_agent": "http_user_agent",
+        "referer": "http_referer",
+        "view_function": "view_func_name",
+    }
+
+    user = models.ForeignKey(
+        django_settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    session_key = models.CharField(blank=True, max_length=40)
+    start_ts = models.DateTimeField(verbose_name="Request started at", db_index=True)
+    end_ts = models.DateTimeField(verbose_name="Request ended at")
+    duration = models.FloatField(verbose_name="Request duration (sec)")
+    http_method = models.CharField(max_length=10)
+    request_path = models.ForeignKey(RequestPath, on_delete=models.PROTECT)
+    query_string = models.TextField(blank=True)
+    remote_addr = models.CharField(max_length=100)
+    user_agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT)
+    referer = models.ForeignKey(Referer, on_delete=models.PROTECT)
+    view_function = models.ForeignKey(ViewFunction, on_delete=models.PROTECT)
+    response_status_code = models.IntegerField()
+    response_content_length = models.IntegerField()
+    query_count = models.IntegerField(blank=True, null=True)
+    query_duration = models.FloatField(blank=True, null=True)
+    slowest_query_duration = models.FloatField(blank=True, null=True)
+    time_to_view = models.FloatField(blank=True, null=True)
+    view_duration = models.FloatField(blank=True, null=True)
+    response_duration = models.FloatField(blank=True, null=True)
+    time_to_first_byte = models.FloatField(blank=True, null=True)
+    time_to_last_byte = models.FloatField(blank=True, null=True)
+
+    objects = NormalizedProfilingRecordQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["view_function", "start_ts"],
+                name="request_prof_norm_view_ts_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return "Normalized profiling record #{}".format(self.pk)
+
+    def to_record(self) -> ProfilingRecord:
+        """Return an (unsaved) ProfilingRecord with the dimension values."""
+        values = {
+            f.attname: getattr(self, f.attname)
+            for f in self._meta.concrete_fields
+            if f.name not in self.DIMENSIONS and not f.primary_key
+        }
+        for field, record_field in self.DIMENSIONS.items():
+            values[record_field] = getattr(self, field).value
+        return ProfilingRecord(**values)
@@ -0,0 +1,97 @@
+"""
+Migration operations that add indexes without blocking writes on PostgreSQL.
+
+A plain CREATE INDEX blocks inserts into the table until it has been built,
+which on a large ProfilingRecord table (with records saved on the response
+path) can take a long time. On PostgreSQL these operations build the index
+CONCURRENTLY instead, so they must be used in a migration with
+`atomic = False`. On other databases they behave as the operations they
+extend.
+
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from django.db import migrations
+from django.db.models import Index
+
+
+def _is_postgresql(schema_editor: Any) -> bool:
+    return schema_editor.connection.vendor == "postgresql"
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """AddIndex, using CREATE INDEX CONCURRENTLY on PostgreSQL."""
+
+    def database_forwards(
+        self, app_label: str, schema_editor: Any, from_state: Any, to_state: Any
+    ) -> None:
+        if not _is_postgresql(schema_editor):
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(
+        self, app_label: str, schema_editor: Any, from_state: Any, to_state: Any
+    ) -> None:
+        if not _is_postgresql(schema_editor):
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class AddFieldIndexConcurrently(migrations.AlterField):
+    """
+    AlterField that only adds db_index=True to a field.
+
+    On PostgreSQL the field's index is created CONCURRENTLY (and dropped
+    CONCURRENTLY when reversed).
+
+    """
+
+    def database_forwards(
+        self, app_label: str, schema_editor: Any, from_state: Any, to_state: Any
+    ) -> None:
+        if not _is_postgresql(schema_editor):
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            field = model._meta.get_field(self.name)
+            schema_editor.execute(
+                schema_editor._create_index_sql(
+                    model, fields=[field], concurrently=True
+                )
+            )
+
+    def database_backwards(
+        self, app_label: str, schema_editor: Any, from_state: Any, to_state: Any
+    ) -> None:
+        if not _is_postgresql(schema_editor):
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            field = model._meta.get_field(self.name)
+            # the field's own (btree) index, not those in Meta.indexes
+            names = schema_editor._constraint_names(
+                model,
+                [field.column],
+                index=True,
+                type_=Index.suffix,
+                exclude={index.name for index in model._meta.indexes},
+            )
+            for name in names:
+                schema_editor.execute(
+                    schema_editor._delete_index_sql(model, name, concurrently=True)
+                )
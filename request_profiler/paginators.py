@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import datetime
+import json
+from typing import Any
+
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.http import HttpRequest
+from django.utils.functional import cached_property
+
+from . import settings
+
+# the querystring parameter that holds the keyset cursor
+CURSOR_VAR = "before"
+
+# the changelist ordering that the keyset cursor follows
+KEYSET_ORDERING = ["-start_ts", "-pk"]
+
+
+def estimate_count(queryset: QuerySet) -> int | None:
+    """Return the planner's estimate of the number of rows (PostgreSQL only)."""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def parse_cursor(value: str | None) -> tuple[datetime.datetime, int] | None:
+    """Parse a "{start_ts}_{pk}" cursor, returning None if it's invalid."""
+    try:
+        start_ts, pk = (value or "").rsplit("_", 1)
+        return datetime.datetime.fromisoformat(start_ts), int(pk)
+    except ValueError:
+        return None
+
+
+class ProfilingRecordPaginator(Paginator):
+    """
+    Paginator for very large ProfilingRecord tables.
+
+    The count is the PostgreSQL planner's estimate, unless that is under
+    REQUEST_PROFILER_ADMIN_COUNT_ESTIMATE_THRESHOLD, when it is counted
+    exactly (as it is on other databases).
+
+    Pages are fetched by OFFSET, which gets slower the further in you go,
+    so `next_url` links to the (older) records after the last one on the
+    page, using a (start_ts, id) cursor that is read from the index at any
+    depth. The cursor is only used with the default ordering.
+
+    """
+
+    def __init__(
+        self,
+        object_list: QuerySet,
+        per_page: int,
+        *args: Any,
+        request: HttpRequest | None = None,
+        cursor: str | None = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(object_list, per_page, *args, **kwargs)
+        self.request = request
+        self.cursor = parse_cursor(cursor)
+        self.next_url: str | None = None
+
+    @cached_property
+    def count(self) -> int:
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < settings.ADMIN_COUNT_ESTIMATE_THRESHOLD:
+            return super().count
+        return estimate
+
+    @property
+    def is_keyset(self) -> bool:
+        # the changelist can repeat fields in the ordering
+        return list(dict.fromkeys(self.object_list.query.order_by)) == KEYSET_ORDERING
+
+    def page(self, number: Any) -> Page:
+        if self.cursor and self.is_keyset:
+            start_ts, pk = self.cursor
+            records = self.object_list.filter(
+                Q(start_ts__lt=start_ts) | Q(start_ts=start_ts, pk__lt=pk)
+            )
+            page = self._get_page(list(records[: self.per_page]), 1, self)
+        else:
+            page = super().page(number)
+        self._set_next_url(page)
+        return page
+
+    def _set_next_url(self, page: Page) -> None:
+        if self.request is None or not self.is_keyset:
+            return
+        if len(page.object_list) < self.per_page:
+            # the last page
+            return
+        last = page.object_list[len(page.object_list) - 1]
+        params = self.request.GET.copy()
+        params.pop("p", None)
+        params[CURSOR_VAR] = f"{last.start_ts.isoformat()}_{last.pk}"
+        self.next_url = f"?{params.urlencode()}"
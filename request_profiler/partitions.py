@@ -0,0 +1,351 @@
+"""
+Time-partitioned storage of ProfilingRecord (see REQUEST_PROFILER_PARTITION_PERIOD).
+
+Records are written to one partition per day or week (starting at midnight
+UTC, weeks on a Monday), so that retention is a matter of dropping whole
+partitions rather than deleting rows.
+
+On PostgreSQL this uses native declarative partitioning: the records table
+must first be converted to a partitioned table (see `setup_sql`), after
+which the ORM, admin etc. work as before, and queries on a start_ts range
+only scan the relevant partitions.
+
+SQLite has no partitioning, so each period is held in its own table, named
+after the records table and the start of the period. These tables are not
+visible to the ORM - use `records_between` to query them (which only reads
+the tables for the range) - and are created from the schema of the records
+table at the time, so are not altered by later migrations.
+
+"""
+
+from __future__ import annotations
+
+import datetime
+import re
+from typing import Any, NamedTuple
+
+from django.db import NotSupportedError, connections, transaction
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import QuerySet
+from django.db.models.query import RawQuerySet
+
+from . import settings
+from .models import ProfilingRecord
+
+PERIOD_DAY = "day"
+PERIOD_WEEK = "week"
+PERIODS = (PERIOD_DAY, PERIOD_WEEK)
+
+
+class Partition(NamedTuple):
+    name: str
+    start: datetime.datetime
+    end: datetime.datetime
+
+
+def period_start(ts: datetime.datetime, period: str) -> datetime.datetime:
+    """Return the start (midnight UTC) of the period that contains ts."""
+    start = datetime.datetime.combine(
+        ts.astimezone(datetime.timezone.utc).date(),
+        datetime.time.min,
+        tzinfo=datetime.timezone.utc,
+    )
+    if period == PERIOD_DAY:
+        return start
+    if period == PERIOD_WEEK:
+        return start - datetime.timedelta(days=start.weekday())
+    raise ValueError(f"Invalid partition period: {period!r}")
+
+
+def period_end(start: datetime.datetime, period: str) -> datetime.datetime:
+    return start + datetime.timedelta(days=7 if period == PERIOD_WEEK else 1)
+
+
+class Partitions:
+    """Manage the partitions of the records table, for a database vendor."""
+
+    def __init__(self, period: str, connection: BaseDatabaseWrapper) -> None:
+        if period not in PERIODS:
+            raise ValueError(f"Invalid partition period: {period!r}")
+        self.period = period
+        self.connection = connection
+        self.table = ProfilingRecord._meta.db_table
+        self._pattern = re.compile(rf"^{re.escape(self.table)}_(\d{{8}})$")
+        # names of the partitions known to exist
+        self._created: set[str] = set()
+
+    def partition(self, ts: datetime.datetime) -> Partition:
+        """Return the partition that holds records started at ts."""
+        start = period_start(ts, self.period)
+        return Partition(
+            f"{self.table}_{start:%Y%m%d}", start, period_end(start, self.period)
+        )
+
+    def _table_names(self) -> list[str]:
+        raise NotImplementedError
+
+    def list_partitions(self) -> list[Partition]:
+        """Return the existing partitions, oldest first."""
+        partitions = []
+        for name in self._table_names():
+            if match := self._pattern.match(name):
+                start = datetime.datetime.strptime(match.group(1), "%Y%m%d")
+                start = start.replace(tzinfo=datetime.timezone.utc)
+                partitions.append(
+                    Partition(name, start, period_end(start, self.period))
+                )
+        return sorted(partitions, key=lambda p: p.start)
+
+    def create_partition(self, partition: Partition) -> None:
+        raise NotImplementedError
+
+    def ensure_partition(self, ts: datetime.datetime) -> Partition:
+        """Create the partition for ts, if it doesn't already exist."""
+        partition = self.partition(ts)
+        if partition.name not in self._created:
+            self.create_partition(partition)
+            self._created.add(partition.name)
+        return partition
+
+    def ensure_partitions(self, ahead: int = 1) -> list[Partition]:
+        """Create the current partition and `ahead` future partitions."""
+        ts = datetime.datetime.now(tz=datetime.timezone.utc)
+        partitions = []
+        for _ in range(ahead + 1):
+            partitions.append(self.ensure_partition(ts))
+            ts = partitions[-1].end
+        return partitions
+
+    def drop_partitions(self, before: datetime.datetime) -> list[Partition]:
+        """Drop the partitions that end on or before `before`."""
+        qn = self.connection.ops.quote_name
+        dropped = []
+        with self.connection.cursor() as cursor:
+            for partition in self.list_partitions():
+                if partition.end > before:
+                    continue
+                cursor.execute(f"DROP TABLE IF EXISTS {qn(partition.name)}")
+                self._created.discard(partition.name)
+                dropped.append(partition)
+        return dropped
+
+    def insert(self, record: ProfilingRecord) -> None:
+        """Save a record to the partition for its start_ts."""
+        record.save()
+
+    def records_between(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> QuerySet | RawQuerySet:
+        """Return the records started in the range [start, end)."""
+        return ProfilingRecord.objects.filter(start_ts__gte=start, start_ts__lt=end)
+
+
+class PostgresPartitions(Partitions):
+    """Native declarative partitions, attached to the records table."""
+
+    def _table_names(self) -> list[str]:
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+                "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+                "WHERE parent.relname = %s",
+                [self.table],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    @property
+    def default_partition(self) -> str:
+        """The partition that holds records not in any other partition."""
+        return f"{self.table}_default"
+
+    def create_partition(self, partition: Partition) -> None:
+        """
+        Create the partition, moving any of its records out of the default.
+
+        The partition is created, filled and attached in a transaction (and
+        an advisory lock, in case another process is creating it), as
+        PostgreSQL won't attach it whilst the default partition holds any
+        records in its range.
+
+        """
+        qn = self.connection.ops.quote_name
+        name = qn(partition.name)
+        default = qn(self.default_partition)
+        with transaction.atomic(
+            using=self.connection.alias
+        ), self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtext(%s))", [partition.name]
+            )
+            cursor.execute("SELECT to_regclass(%s)", [partition.name])
+            if cursor.fetchone()[0] is not None:
+                return
+            cursor.execute(
+                f"CREATE TABLE {name} (LIKE {qn(self.table)} INCLUDING DEFAULTS)"
+            )
+            cursor.execute("SELECT to_regclass(%s)", [self.default_partition])
+            if cursor.fetchone()[0] is not None:
+                cursor.execute(
+                    f"WITH moved AS (DELETE FROM {default} "
+                    "WHERE start_ts >= %s AND start_ts < %s RETURNING *) "
+                    f"INSERT INTO {name} SELECT * FROM moved",
+                    [partition.start, partition.end],
+                )
+            cursor.execute(
+                f"ALTER TABLE {qn(self.table)} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{partition.start.isoformat()}') "
+                f"TO ('{partition.end.isoformat()}')"
+            )
+
+    def setup_sql(self) -> list[str]:
+        """
+        Return the SQL that converts the records table to a partitioned table.
+
+        The existing table is attached as a "legacy" partition holding all
+        of the records before the current period - it is not dropped by
+        `drop_partitions`, but its rows are deleted by the truncate command
+        as before (or it can be dropped by hand). A default partition holds
+        any records (e.g. saved by writers other than the PartitionedWriter)
+        for which no partition has been created yet - they are moved to
+        their partition when it is created. The primary key of a
+        partitioned table must include the partition key, so it becomes
+        (id, start_ts), and ids come from a new sequence owned by the
+        partitioned table. Review (and back up) before running.
+
+        """
+        qn = self.connection.ops.quote_name
+        table = qn(self.table)
+        legacy = qn(f"{self.table}_legacy")
+        sequence = qn(f"{self.table}_partitioned_id_seq")
+        first = self.partition(datetime.datetime.now(tz=datetime.timezone.utc))
+        user = ProfilingRecord._meta.get_field("user")
+        user_table = user.related_model._meta.db_table
+        return [
+            f"ALTER TABLE {table} RENAME TO {legacy}",
+            f"ALTER TABLE {legacy} ALTER COLUMN id DROP IDENTITY IF EXISTS",
+            f"ALTER TABLE {legacy} ALTER COLUMN id DROP DEFAULT",
+            f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (start_ts)",
+            f"CREATE SEQUENCE {sequence} OWNED BY {table}.id",
+            f"SELECT setval('{sequence}', "
+            f"COALESCE((SELECT MAX(id) FROM {legacy}), 0) + 1, false)",
+            f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{sequence}')",
+            f"ALTER TABLE {table} ADD PRIMARY KEY (id, start_ts)",
+            f"CREATE INDEX ON {table} (start_ts)",
+            f"CREATE INDEX ON {table} ({qn(user.column)})",
+            f"CREATE INDEX ON {table} USING brin (start_ts)",
+            *(
+                f"CREATE INDEX ON {table} ({', '.join(index.fields)})"
+                for index in ProfilingRecord._meta.indexes
+            ),
+            f"ALTER TABLE {table} ADD FOREIGN KEY ({qn(user.column)}) "
+            f"REFERENCES {qn(user_table)} (id) ON DELETE SET NULL "
+            "DEFERRABLE INITIALLY DEFERRED",
+            f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{first.start.isoformat()}')",
+            f"CREATE TABLE {qn(self.default_partition)} PARTITION OF {table} DEFAULT",
+        ]
+
+
+class SQLitePartitions(Partitions):
+    """A table per period, with the same schema as the records table."""
+
+    def _table_names(self) -> list[str]:
+        return self.connection.introspection.table_names()
+
+    def create_partition(self, partition: Partition) -> None:
+        qn = self.connection.ops.quote_name
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s",
+                [self.table],
+            )
+            (sql,) = cursor.fetchone()
+            # CREATE TABLE "request_profiler_profilingrecord" (...)
+            sql = sql.replace(
+                f"CREATE TABLE {qn(self.table)}",
+                f"CREATE TABLE IF NOT EXISTS {qn(partition.name)}",
+                1,
+            )
+            cursor.execute(sql)
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {qn(partition.name + '_start_ts')} "
+                f"ON {qn(partition.name)} (start_ts)"
+            )
+
+    def _next_id(self, cursor: Any) -> int:
+        # ids are taken from the records table's AUTOINCREMENT sequence, so
+        # that they are unique across the records table and its partitions
+        table = self.connection.ops.quote_name(self.table)
+        cursor.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT %s, "
+            f"(SELECT COALESCE(MAX(id), 0) FROM {table}) "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+            [self.table, self.table],
+        )
+        cursor.execute(
+            "UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = %s", [self.table]
+        )
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [self.table])
+        return cursor.fetchone()[0]
+
+    def insert(self, record: ProfilingRecord) -> None:
+        qn = self.connection.ops.quote_name
+        partition = self.partition(record.start_ts)
+        fields = ProfilingRecord._meta.concrete_fields
+        with transaction.atomic(
+            using=self.connection.alias
+        ), self.connection.cursor() as cursor:
+            record.pk = self._next_id(cursor)
+            values = [
+                f.get_db_prep_save(f.pre_save(record, True), self.connection)
+                for f in fields
+            ]
+            cursor.execute(
+                f"INSERT INTO {qn(partition.name)} "
+                f"({', '.join(qn(f.column) for f in fields)}) "
+                f"VALUES ({', '.join(['%s'] * len(fields))})",
+                values,
+            )
+
+    def records_between(
+        self, start: datetime.datetime, end: datetime.datetime
+    ) -> RawQuerySet:
+        """Return the records in the records table and overlapping partitions."""
+        qn = self.connection.ops.quote_name
+        tables = [self.table] + [
+            p.name for p in self.list_partitions() if p.start < end and p.end > start
+        ]
+        columns = ", ".join(qn(f.column) for f in ProfilingRecord._meta.concrete_fields)
+        field = ProfilingRecord._meta.get_field("start_ts")
+        params = [
+            field.get_db_prep_value(start, self.connection),
+            field.get_db_prep_value(end, self.connection),
+        ]
+        sql = " UNION ALL ".join(
+            f"SELECT {columns} FROM {qn(table)} "
+            "WHERE start_ts >= %s AND start_ts < %s"
+            for table in tables
+        )
+        return ProfilingRecord.objects.raw(sql, params * len(tables))
+
+
+def get_partitions(period: str | None = None, using: str | None = None) -> Partitions:
+    """
+    Return the Partitions for the database.
+
+    The period defaults to REQUEST_PROFILER_PARTITION_PERIOD.
+
+    """
+    period = period or settings.PARTITION_PERIOD
+    if period is None:
+        raise ValueError("REQUEST_PROFILER_PARTITION_PERIOD is not set.")
+    connection = connections[using or ProfilingRecord.objects.db]
+    if connection.vendor == "postgresql":
+        return PostgresPartitions(period, connection)
+    if connection.vendor == "sqlite":
+        return SQLitePartitions(period, connection)
+    raise NotSupportedError(
+        f"Partitioned storage is not supported on {connection.vendor}."
+    )
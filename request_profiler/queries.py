@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+from typing import Any, Callable
+
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+class QueryCounter:
+    """
+    Count and time the database queries run during a request.
+
+    Only the number of queries, their total duration and the duration of the
+    slowest are kept - no SQL - so this is safe to use under load. Queries
+    are counted across all database aliases, from the point at which the
+    counter is started (which makes it the current counter) until it is
+    stopped.
+
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ns = 0
+        self.slowest_ns = 0
+        self.is_running = False
+
+    def start(self) -> QueryCounter:
+        _current_counter.set(self)
+        # connection_created covers connections opened from now on
+        for connection in connections.all():
+            install(connection)
+        self.is_running = True
+        return self
+
+    def stop(self) -> QueryCounter:
+        self.is_running = False
+        return self
+
+    def record(self, duration_ns: int) -> None:
+        self.count += 1
+        self.total_ns += duration_ns
+        self.slowest_ns = max(self.slowest_ns, duration_ns)
+
+
+# context variables are copied into the threads used by sync_to_async, so
+# queries run by sync code under ASGI are counted against the right request.
+_current_counter: ContextVar[QueryCounter | None] = ContextVar(
+    "request_profiler_query_counter", default=None
+)
+
+
+def execute_wrapper(
+    execute: Callable, sql: str, params: Any, many: bool, context: dict
+) -> Any:
+    """Database execute wrapper that records queries against the current counter."""
+    counter = _current_counter.get()
+    if counter is None or not counter.is_running:
+        return execute(sql, params, many, context)
+    start_ns = time.perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.record(time.perf_counter_ns() - start_ns)
+
+
+def install(connection: BaseDatabaseWrapper) -> None:
+    """Add the execute wrapper to a connection, if not already added."""
+    if execute_wrapper not in connection.execute_wrappers:
+        # added as the outermost wrapper, as connection.execute_wrapper()
+        # removes the last wrapper when it exits.
+        connection.execute_wrappers.insert(0, execute_wrapper)
+
+
+@receiver(connection_created)
+def on_connection_created(
+    sender: type[BaseDatabaseWrapper], connection: BaseDatabaseWrapper, **kwargs: Any
+) -> None:
+    install(connection)
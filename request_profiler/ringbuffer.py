@@ -0,0 +1,304 @@
+"""
+A fixed size ring buffer of records, in a file shared by all processes on a host.
+
+The buffer is a memory mapped file (ideally on a tmpfs, e.g. /dev/shm) made
+up of a header and `capacity` slots of `slot_size` bytes. The header holds
+the sequence number of the next record to write, the next record to read,
+and the number of records dropped:
+
+    magic, version, slot_size, capacity | write_seq | read_seq | dropped
+
+Each slot holds the sequence number of the record in it, its length, and
+the record itself (as a JSON array of its values, see `pack_record`).
+
+The only lock - an fcntl lock on the header, held whilst a sequence number
+is reserved - is taken for a few microseconds; each writer then copies its
+record into its own slot, writing the slot's sequence number last. When the
+buffer is full the oldest (unread) record is overwritten, and counted in
+`dropped`.
+
+There is a single reader - see the request_profiler_drain command - which
+checks the slot's sequence number before and after copying a record, so a
+record that is overwritten whilst it is being read is skipped.
+
+This uses fcntl, so is only available on Unix.
+
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any
+
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections
+
+from . import settings
+from .collector import save_records
+from .models import ProfilingRecord
+from .serialization import FIELDS, record_from_dict, record_to_dict
+
+MAGIC = b"RPRB"
+VERSION = 1
+
+# magic, version, slot_size, capacity
+HEADER = struct.Struct("<4sIII")
+HEADER_SIZE = 64
+# offsets of the header counters
+WRITE_SEQ = HEADER.size
+READ_SEQ = WRITE_SEQ + 8
+DROPPED = READ_SEQ + 8
+COUNTER = struct.Struct("<Q")
+
+# sequence number, length
+SLOT_HEADER = struct.Struct("<QI")
+
+# seconds to wait for a writer to finish a slot before skipping it (in case
+# the writer died mid-write)
+STALL_TIMEOUT = 1.0
+
+# text fields that are truncated, in order, if a record doesn't fit its slot
+TRUNCATABLE_FIELDS = ("query_string", "http_referer", "http_user_agent", "request_uri")
+
+
+def pack_record(record: ProfilingRecord, size: int) -> bytes | None:
+    """
+    Return the record as (at most size bytes of) a JSON array of FIELDS.
+
+    If the record is too large its longest free text fields are truncated,
+    and if it still doesn't fit None is returned.
+
+    """
+    data: dict[str, Any] = record_to_dict(record)
+    payload = json.dumps(list(data.values()), separators=(",", ":")).encode()
+    for name in TRUNCATABLE_FIELDS:
+        if len(payload) <= size:
+            break
+        # non-ASCII characters are escaped, so each is at least one byte
+        value = data[name] or ""
+        data[name] = value[: max(0, len(value) - (len(payload) - size))]
+        payload = json.dumps(list(data.values()), separators=(",", ":")).encode()
+    return payload if len(payload) <= size else None
+
+
+def unpack_record(payload: bytes) -> ProfilingRecord:
+    """Return an (unsaved) record from pack_record, raising ValueError if invalid."""
+    values = json.loads(payload)
+    if not isinstance(values, list) or len(values) != len(FIELDS):
+        raise ValueError(f"Expected a JSON array of {len(FIELDS)} values.")
+    return record_from_dict(dict(zip(FIELDS, values)))
+
+
+class RingBuffer:
+    """
+    A ring buffer in a shared, memory mapped, file.
+
+    The file is created (with the given capacity and slot size) if it does
+    not exist, and raises ValueError if it exists with a different layout.
+
+    """
+
+    def __init__(
+        self, path: str, capacity: int | None = None, slot_size: int | None = None
+    ) -> None:
+        self.path = path
+        capacity = capacity or settings.RING_BUFFER_CAPACITY
+        slot_size = slot_size or settings.RING_BUFFER_SLOT_SIZE
+        if slot_size <= SLOT_HEADER.size:
+            raise ValueError(f"Slot size must be more than {SLOT_HEADER.size} bytes.")
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            with self._locked():
+                if os.fstat(self._fd).st_size == 0:
+                    os.ftruncate(self._fd, HEADER_SIZE + capacity * slot_size)
+                    os.pwrite(
+                        self._fd, HEADER.pack(MAGIC, VERSION, slot_size, capacity), 0
+                    )
+                    # sequence numbers start at 1, so an empty slot has seq 0
+                    os.pwrite(self._fd, COUNTER.pack(1) * 2, WRITE_SEQ)
+                magic, version, self.slot_size, self.capacity = HEADER.unpack(
+                    os.pread(self._fd, HEADER.size, 0)
+                )
+            if (magic, version) != (MAGIC, VERSION):
+                raise ValueError(f"{path} is not a request profiler ring buffer.")
+            if (self.capacity, self.slot_size) != (capacity, slot_size):
+                raise ValueError(
+                    f"{path} has {self.capacity} slots of {self.slot_size} bytes, "
+                    f"not {capacity} of {slot_size} - remove it to resize it."
+                )
+            self._mmap = mmap.mmap(self._fd, HEADER_SIZE + self.capacity * slot_size)
+        except Exception:
+            os.close(self._fd)
+            raise
+        # the slot being written when the reader last had to wait, and when
+        self._stalled: tuple[int, float] | None = None
+
+    @property
+    def max_record_size(self) -> int:
+        return self.slot_size - SLOT_HEADER.size
+
+    def _locked(self) -> _HeaderLock:
+        return _HeaderLock(self)
+
+    def _get(self, offset: int) -> int:
+        return COUNTER.unpack_from(self._mmap, offset)[0]
+
+    def _set(self, offset: int, value: int) -> None:
+        COUNTER.pack_into(self._mmap, offset, value)
+
+    @property
+    def dropped(self) -> int:
+        """Number of records overwritten before they were read (or lost)."""
+        return self._get(DROPPED)
+
+    @property
+    def pending(self) -> int:
+        """Number of records waiting to be read."""
+        return min(self._get(WRITE_SEQ) - self._get(READ_SEQ), self.capacity)
+
+    def _offset(self, seq: int) -> int:
+        return HEADER_SIZE + (seq % self.capacity) * self.slot_size
+
+    def append(self, payload: bytes) -> None:
+        """Append a record, overwriting the oldest if the buffer is full."""
+        if len(payload) > self.max_record_size:
+            raise ValueError(f"Records must be at most {self.max_record_size} bytes.")
+        with self._locked():
+            seq = self._get(WRITE_SEQ)
+            self._set(WRITE_SEQ, seq + 1)
+            if seq - self._get(READ_SEQ) >= self.capacity:
+                self._set(DROPPED, self._get(DROPPED) + 1)
+        offset = self._offset(seq)
+        start = offset + SLOT_HEADER.size
+        # mark the slot as being written, then commit it with its seq
+        SLOT_HEADER.pack_into(self._mmap, offset, 0, 0)
+        self._mmap[start : start + len(payload)] = payload
+        SLOT_HEADER.pack_into(self._mmap, offset, seq, len(payload))
+
+    def read(self, max_count: int) -> list[bytes]:
+        """
+        Remove and return up to max_count records, oldest first.
+
+        Reading stops at a slot that is still being written, unless it has
+        been for more than STALL_TIMEOUT seconds, when it is skipped.
+
+        """
+        with self._locked():
+            write_seq = self._get(WRITE_SEQ)
+            # anything older has been overwritten
+            seq = max(self._get(READ_SEQ), write_seq - self.capacity)
+        records: list[bytes] = []
+        skipped = 0
+        while seq < write_seq and len(records) < max_count:
+            offset = self._offset(seq)
+            slot_seq, length = SLOT_HEADER.unpack_from(self._mmap, offset)
+            if slot_seq < seq:
+                if not self._is_stalled(seq):
+                    break
+                skipped += 1
+            elif slot_seq == seq:
+                start = offset + SLOT_HEADER.size
+                payload = self._mmap[start : start + length]
+                # if it changed whilst being copied it has been overwritten
+                if SLOT_HEADER.unpack_from(self._mmap, offset)[0] == seq:
+                    records.append(payload)
+            seq += 1
+        with self._locked():
+            self._set(READ_SEQ, max(seq, self._get(READ_SEQ)))
+            if skipped:
+                self._set(DROPPED, self._get(DROPPED) + skipped)
+        return records
+
+    def _is_stalled(self, seq: int) -> bool:
+        now = time.monotonic()
+        if self._stalled is None or self._stalled[0] != seq:
+            self._stalled = (seq, now)
+        return now - self._stalled[1] > STALL_TIMEOUT
+
+    def close(self) -> None:
+        self._mmap.close()
+        os.close(self._fd)
+
+
+class _HeaderLock:
+    # held whilst reading / updating the header counters - the thread lock is
+    # needed as fcntl locks are per process, not per thread
+    def __init__(self, buffer: RingBuffer) -> None:
+        self.buffer = buffer
+
+    def __enter__(self) -> None:
+        self.buffer._lock.acquire()
+        try:
+            fcntl.lockf(self.buffer._fd, fcntl.LOCK_EX, HEADER_SIZE, 0)
+        except BaseException:
+            self.buffer._lock.release()
+            raise
+
+    def __exit__(self, *args: object) -> None:
+        fcntl.lockf(self.buffer._fd, fcntl.LOCK_UN, HEADER_SIZE, 0)
+        self.buffer._lock.release()
+
+
+class Drainer:
+    """
+    Read records from a RingBuffer, and save them in batches.
+
+    Records have been removed from the buffer by the time they are saved, so
+    a batch that fails to save is saved one record at a time (see
+    `save_records`), and only the records that fail are lost (and counted in
+    `dropped`). If `store_records` is False only the rollups are updated.
+
+    """
+
+    def __init__(
+        self,
+        buffer: RingBuffer,
+        batch_size: int | None = None,
+        flush_interval: float | None = None,
+        store_records: bool = True,
+    ) -> None:
+        self.buffer = buffer
+        self.batch_size = batch_size or settings.WRITER_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.WRITER_FLUSH_INTERVAL
+        self.store_records = store_records
+        self.received = 0
+        self.invalid = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    def _parse(self, payloads: list[bytes]) -> list[ProfilingRecord]:
+        records = []
+        for payload in payloads:
+            try:
+                records.append(unpack_record(payload))
+            except (ValidationError, ValueError, TypeError):
+                self.invalid += 1
+        return records
+
+    def drain(self) -> int:
+        """Save all the records in the buffer, returning the number read."""
+        count = 0
+        while payloads := self.buffer.read(self.batch_size):
+            count += len(payloads)
+            self.received += len(payloads)
+            if not (batch := self._parse(payloads)):
+                continue
+            saved = save_records(batch, self.store_records)
+            self.flushed += saved
+            self.dropped += len(batch) - saved
+        close_old_connections()
+        return count
+
+    def serve(self, stopped: threading.Event) -> None:
+        """Drain the buffer every flush_interval seconds until stopped."""
+        while not stopped.is_set():
+            self.drain()
+            stopped.wait(self.flush_interval)
+        self.drain()
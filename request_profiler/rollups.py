@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import bisect
+import datetime
+from typing import Iterable, Sequence
+
+from django.db import IntegrityError, transaction
+
+from . import settings
+from .models import ProfilingRecord, ProfilingRollup
+
+PERIODS = (
+    ProfilingRollup.PERIOD_MINUTE,
+    ProfilingRollup.PERIOD_HOUR,
+    ProfilingRollup.PERIOD_DAY,
+)
+
+# the ProfilingRecord fields used to build rollups, in order
+RECORD_FIELDS = ("view_func_name", "response_status_code", "start_ts", "duration")
+
+# (period, bucket_start, view_func_name, status_class)
+RollupKey = tuple[str, datetime.datetime, str, int]
+
+
+def bucket_start(ts: datetime.datetime, period: str) -> datetime.datetime:
+    """Return the start of the period (in UTC) that contains ts."""
+    ts = ts.astimezone(datetime.timezone.utc).replace(second=0, microsecond=0)
+    if period == ProfilingRollup.PERIOD_MINUTE:
+        return ts
+    if period == ProfilingRollup.PERIOD_HOUR:
+        return ts.replace(minute=0)
+    if period == ProfilingRollup.PERIOD_DAY:
+        return ts.replace(hour=0, minute=0)
+    raise ValueError(f"Invalid rollup period: {period!r}")
+
+
+def _new_rollup(key: RollupKey) -> ProfilingRollup:
+    period, start, view_func_name, status_class = key
+    return ProfilingRollup(
+        period=period,
+        bucket_start=start,
+        view_func_name=view_func_name,
+        status_class=status_class,
+        histogram=[0] * (len(ProfilingRollup.HISTOGRAM_BOUNDS) + 1),
+    )
+
+
+def _add(rollup: ProfilingRollup, duration: float) -> None:
+    rollup.count += 1
+    rollup.duration_sum += duration
+    rollup.duration_max = max(rollup.duration_max, duration)
+    rollup.histogram[
+        bisect.bisect_left(ProfilingRollup.HISTOGRAM_BOUNDS, duration)
+    ] += 1
+
+
+def _merge(rollup: ProfilingRollup, other: ProfilingRollup) -> None:
+    rollup.count += other.count
+    rollup.duration_sum += other.duration_sum
+    rollup.duration_max = max(rollup.duration_max, other.duration_max)
+    rollup.histogram = [a + b for a, b in zip(rollup.histogram, other.histogram)]
+
+
+def collect(
+    rows: Iterable[tuple], periods: Sequence[str] = PERIODS
+) -> dict[RollupKey, ProfilingRollup]:
+    """Build (unsaved) rollups from (view, status code, start_ts, duration) rows."""
+    rollups: dict[RollupKey, ProfilingRollup] = {}
+    for view_func_name, status_code, start_ts, duration in rows:
+        for period in periods:
+            key = (
+                period,
+                bucket_start(start_ts, period),
+                view_func_name,
+                status_code // 100,
+            )
+            if (rollup := rollups.get(key)) is None:
+                rollup = rollups[key] = _new_rollup(key)
+            _add(rollup, duration)
+    return rollups
+
+
+def _save(rollup: ProfilingRollup) -> None:
+    key = {
+        "period": rollup.period,
+        "bucket_start": rollup.bucket_start,
+        "view_func_name": rollup.view_func_name,
+        "status_class": rollup.status_class,
+    }
+    with transaction.atomic():
+        rollups = ProfilingRollup.objects.select_for_update()
+        if (existing := rollups.filter(**key).first()) is None:
+            try:
+                with transaction.atomic():
+                    rollup.save()
+                return
+            except IntegrityError:
+                # another process created it first
+                existing = rollups.get(**key)
+        _merge(existing, rollup)
+        existing.save()
+
+
+def update_rollups(
+    records: Iterable[ProfilingRecord], periods: Sequence[str] | None = None
+) -> int:
+    """
+    Add records to the stored rollups, and return the number of rollups updated.
+
+    This is called by the writers, for REQUEST_PROFILER_ROLLUP_PERIODS, once
+    records have been saved. Each rollup is locked whilst it is updated, so
+    this is safe to call from multiple processes - the rollups are locked in
+    key order, so that concurrent batches (in an outer transaction) can't
+    deadlock.
+
+    """
+    periods = settings.ROLLUP_PERIODS if periods is None else periods
+    if not periods:
+        return 0
+    rows = [tuple(getattr(r, f) for f in RECORD_FIELDS) for r in records]
+    rollups = collect(rows, periods)
+    for key in sorted(rollups):
+        _save(rollups[key])
+    return len(rollups)
+
+
+def recompute_rollups(period: str, since: datetime.datetime) -> int:
+    """
+    Replace the rollups from the period containing `since` onwards.
+
+    The rollups are rebuilt from the raw records, so this is idempotent, but
+    it should only be run over records that have not been truncated.
+    Returns the number of rollups created.
+
+    """
+    start = bucket_start(since, period)
+    records = (
+        ProfilingRecord.objects.filter(start_ts__gte=start)
+        .order_by()
+        .values_list(*RECORD_FIELDS)
+    )
+    with transaction.atomic():
+        rollups = collect(records.iterator(chunk_size=2000), [period])
+        ProfilingRollup.objects.filter(period=period, bucket_start__gte=start).delete()
+        ProfilingRollup.objects.bulk_create(rollups.values(), batch_size=500)
+    return len(rollups)
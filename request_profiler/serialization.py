@@ -0,0 +1,133 @@
+"""
+Conversion of ProfilingRecord to and from plain (JSON-safe) values.
+
+This is shared by the writers, import and export commands, which use the
+same flat layout - a dict (or row) of FIELDS, keyed on the column name
+(e.g. "user_id"), with timestamps as ISO 8601 strings.
+
+"""
+
+from __future__ import annotations
+
+import csv
+import datetime
+import gzip
+import json
+from typing import IO, Any, Iterator, cast
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+from .models import ProfilingRecord
+
+FORMATS = ("jsonl", "csv")
+
+# (attname, field) of each ProfilingRecord column, other than the pk
+_FIELDS: list[tuple[str, models.Field]] = [
+    (f.attname, f) for f in ProfilingRecord._meta.concrete_fields if not f.primary_key
+]
+FIELDS = [name for name, _ in _FIELDS]
+
+# fields that must be in each row (not nullable, and with no default)
+REQUIRED_FIELDS = {
+    name for name, f in _FIELDS if not (f.null or f.has_default() or f.blank)
+}
+
+
+def record_to_dict(record: ProfilingRecord) -> dict[str, Any]:
+    """Return the record as a dict of JSON-safe values."""
+    data = {}
+    for name, _ in _FIELDS:
+        value = getattr(record, name)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        data[name] = value
+    return data
+
+
+def record_to_json(record: ProfilingRecord) -> str:
+    return json.dumps(record_to_dict(record), separators=(",", ":"))
+
+
+def to_python(data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Validate and convert values (e.g. from JSON or CSV) to field values.
+
+    Missing fields are left out (so take the model default), empty strings
+    are None for nullable fields, and unknown keys are ignored. Raises
+    ValidationError if a value is invalid - including null for a field that
+    is not nullable, or longer than the field's max_length - so that it
+    is rejected here rather than when the record is saved.
+
+    """
+    values = {}
+    for name, field in _FIELDS:
+        if name not in data:
+            continue
+        value = data[name]
+        if value == "" and field.null:
+            value = None
+        value = field.to_python(value)
+        if value is None and not field.null:
+            raise ValidationError(f"{name} cannot be null.")
+        if field.max_length is not None and len(value) > field.max_length:
+            raise ValidationError(
+                f"{name} is longer than {field.max_length} characters."
+            )
+        values[name] = value
+    return values
+
+
+def record_from_dict(data: dict[str, Any]) -> ProfilingRecord:
+    """
+    Return an (unsaved) ProfilingRecord from values such as record_to_dict's.
+
+    Raises ValidationError if a value is invalid, or ValueError if any of
+    REQUIRED_FIELDS is missing.
+
+    """
+    values = to_python(data)
+    if missing := REQUIRED_FIELDS - values.keys():
+        raise ValueError(f"Missing {', '.join(sorted(missing))}.")
+    return ProfilingRecord(**values)
+
+
+def guess_format(path: str) -> str:
+    """Return the format of a file from its name, e.g. "foo.jsonl.gz"."""
+    name = path.removesuffix(".gz")
+    for fmt in FORMATS:
+        if name.endswith(f".{fmt}"):
+            return fmt
+    raise ValueError(f"Unknown format: {path}")
+
+
+def open_file(path: str, mode: str = "r") -> IO[str]:
+    """Open a text file, which is gzipped if the name ends in .gz."""
+    if path.endswith(".gz"):
+        return cast(IO[str], gzip.open(path, f"{mode}t", encoding="utf-8", newline=""))
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def read_rows(file: IO[str], fmt: str) -> Iterator[dict[str, Any] | str]:
+    """
+    Yield each row of a CSV file as a dict, or each line of a JSONL file.
+
+    JSON lines are parsed by `parse_row`, so that an invalid line can be
+    skipped without ending the iteration.
+
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            yield line
+
+
+def parse_row(row: dict[str, Any] | str) -> dict[str, Any]:
+    """Return the values of a row from read_rows, raising ValueError if invalid."""
+    if isinstance(row, str):
+        row = json.loads(row)
+        if not isinstance(row, dict):
+            raise ValueError("Expected a JSON object.")
+    return row
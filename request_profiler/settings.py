@@ -5,23 +5,26 @@ from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.http import HttpRequest
 
-# cache key used to store enabled rulesets.
+# cache key used to store the rulesets version stamp - this is changed
+# whenever a RuleSet is saved or deleted.
 RULESET_CACHE_KEY = str(
     getattr(
         settings, "REQUEST_PROFILER_RULESET_CACHE_KEY", "request_profiler__rulesets"
     )
 )  # noqa
 
-# how long to cache them for - defaults to 10s
+# each process keeps its own copy of the enabled rulesets, and checks the
+# version stamp at most this often (in seconds) - this is the longest it
+# takes for a change to be picked up. defaults to 10s
 RULESET_CACHE_TIMEOUT = int(
     getattr(settings, "REQUEST_PROFILER_RULESET_CACHE_TIMEOUT", 10)
 )  # noqa
 
-# set to True to force the use of a debug cursor so that queries can be counted
-# use with caution - this will force the db.connection to store queries
-FORCE_DEBUG_CURSOR = bool(
-    getattr(settings, "REQUEST_PROFILER_FORCE_DEBUG_CURSOR", False)
-)
+# the rules are reloaded at least this often (in seconds), even if the
+# version stamp is unchanged - in case the cache is not shared between
+# processes. with a per-process cache (LocMemCache) they are reloaded every
+# RULESET_CACHE_TIMEOUT seconds instead.
+RULESET_MAX_AGE = int(getattr(settings, "REQUEST_PROFILER_RULESET_MAX_AGE", 60))
 
 # This is a function that can be used to override all rules to exclude requests
 # from profiling e.g. you can use this to ignore staff, or search engine bots, etc.
@@ -31,6 +34,26 @@ GLOBAL_EXCLUDE_FUNC = getattr(
     lambda r: not (hasattr(r, "user") and r.user.is_staff),
 )
 
+# the names of each user's groups are loaded once per request, to match any
+# group rules - set this to also cache them (per user) for this many seconds.
+# the cache is cleared when a user's groups change, but not when a group is
+# renamed or deleted. defaults to 0 (not cached)
+GROUP_CACHE_TIMEOUT = int(getattr(settings, "REQUEST_PROFILER_GROUP_CACHE_TIMEOUT", 0))
+
+# if True then GLOBAL_EXCLUDE_FUNC and the path-based rules are checked at
+# the start of the request, and requests that cannot match are not profiled
+# at all. rules that depend on the user are checked at the end of the request
+# if the user isn't known at the start.
+MATCH_ON_REQUEST = bool(getattr(settings, "REQUEST_PROFILER_MATCH_ON_REQUEST", False))
+
+# if True then streaming responses are only stopped (and their duration
+# measured) once the response has been sent, rather than when the middleware
+# returns the response - in which case the X-Profiler-Duration header is not
+# set, as the headers have already been sent.
+DEFER_STREAMING_CAPTURE = bool(
+    getattr(settings, "REQUEST_PROFILER_DEFER_STREAMING_CAPTURE", False)
+)
+
 # if True (default) then store sessions even for anonymous users
 STORE_ANONYMOUS_SESSIONS = bool(
     getattr(settings, "REQUEST_PROFILER_STORE_ANONYMOUS_SESSIONS", True)
@@ -54,3 +77,99 @@ if hasattr(settings, "REQUEST_PROFILER_STORE_ANONYMOUS_SESSIONS"):
 # The number of days after which to delete logs - defaults to 0, which
 # means do not delete.
 LOG_TRUNCATION_DAYS = int(getattr(settings, "REQUEST_PROFILER_LOG_TRUNCATION_DAYS", 0))
+
+# Dotted path to the class used to persist captured records - see writers.py.
+# Use "request_profiler.writers.BufferedWriter" to save records in batches from
+# a background thread instead of inline on the response path.
+WRITER = str(
+    getattr(settings, "REQUEST_PROFILER_WRITER", "request_profiler.writers.SyncWriter")
+)
+
+# BufferedWriter only: the maximum number of records held in memory, the number
+# of records saved per bulk insert, and the max time (in seconds) between saves.
+WRITER_BUFFER_SIZE = int(
+    getattr(settings, "REQUEST_PROFILER_WRITER_BUFFER_SIZE", 10000)
+)
+WRITER_BATCH_SIZE = int(getattr(settings, "REQUEST_PROFILER_WRITER_BATCH_SIZE", 500))
+WRITER_FLUSH_INTERVAL = float(
+    getattr(settings, "REQUEST_PROFILER_WRITER_FLUSH_INTERVAL", 5)
+)
+
+# periods ("minute", "hour", "day") for which the writers (and the import,
+# collector and drain commands) update the ProfilingRollup tables as records
+# are saved. defaults to none - rollups can instead be built by the
+# request_profiler_rollup management command. each write locks the rollup
+# rows it updates, so use with a batching writer (e.g. BufferedWriter)
+# rather than SyncWriter
+ROLLUP_PERIODS = tuple(getattr(settings, "REQUEST_PROFILER_ROLLUP_PERIODS", ()))
+
+# if True then the duration of each captured record is added to a per-view
+# quantile sketch, held in memory and periodically merged into the
+# ViewSketch table. combine with the NullWriter to keep percentiles without
+# storing each record.
+SKETCHES_ENABLED = bool(getattr(settings, "REQUEST_PROFILER_SKETCHES_ENABLED", False))
+
+# the period ("minute", "hour", "day") covered by each ViewSketch
+SKETCH_PERIOD = str(getattr(settings, "REQUEST_PROFILER_SKETCH_PERIOD", "hour"))
+
+# how often (in seconds) each process flushes its sketches to the database
+SKETCH_FLUSH_INTERVAL = float(
+    getattr(settings, "REQUEST_PROFILER_SKETCH_FLUSH_INTERVAL", 60.0)
+)
+
+# "day" or "week" to store records in time partitions (see partitions.py),
+# written by the PartitionedWriter. when set, truncate_request_profiler_logs
+# drops whole partitions before deleting any remaining rows.
+PARTITION_PERIOD = getattr(settings, "REQUEST_PROFILER_PARTITION_PERIOD", None)
+
+# the admin changelist shows PostgreSQL's estimate of the number of records
+# rather than counting them, unless the estimate is below this number
+ADMIN_COUNT_ESTIMATE_THRESHOLD = int(
+    getattr(settings, "REQUEST_PROFILER_ADMIN_COUNT_ESTIMATE_THRESHOLD", 10000)
+)
+
+# the admin dashboard's figures are cached for DASHBOARD_CACHE_TIMEOUT
+# seconds, then served stale for up to DASHBOARD_STALE_TIMEOUT more seconds
+# whilst they are recalculated in the background
+DASHBOARD_CACHE_TIMEOUT = int(
+    getattr(settings, "REQUEST_PROFILER_DASHBOARD_CACHE_TIMEOUT", 60)
+)
+DASHBOARD_STALE_TIMEOUT = int(
+    getattr(settings, "REQUEST_PROFILER_DASHBOARD_STALE_TIMEOUT", 600)
+)
+
+# NormalizedWriter only: the number of dimension (path, user agent, referer,
+# view function) ids cached in each process
+DIMENSION_CACHE_SIZE = int(
+    getattr(settings, "REQUEST_PROFILER_DIMENSION_CACHE_SIZE", 10000)
+)
+
+# FileWriter only: the directory to write to, the size (in bytes) and age (in
+# seconds) at which each process's file is rotated, whether each record is
+# fsync'd as it is written, and whether rotated files are gzipped
+FILE_WRITER_DIR = getattr(settings, "REQUEST_PROFILER_FILE_WRITER_DIR", None)
+FILE_WRITER_MAX_BYTES = int(
+    getattr(settings, "REQUEST_PROFILER_FILE_WRITER_MAX_BYTES", 64 * 1024 * 1024)
+)
+FILE_WRITER_MAX_AGE = float(
+    getattr(settings, "REQUEST_PROFILER_FILE_WRITER_MAX_AGE", 3600)
+)
+FILE_WRITER_FSYNC = bool(getattr(settings, "REQUEST_PROFILER_FILE_WRITER_FSYNC", False))
+FILE_WRITER_GZIP = bool(getattr(settings, "REQUEST_PROFILER_FILE_WRITER_GZIP", True))
+
+# UDPWriter / request_profiler_collector only: the address that records are
+# sent to - "host:port" (UDP) or the path of a Unix datagram socket
+COLLECTOR_ADDRESS = str(
+    getattr(settings, "REQUEST_PROFILER_COLLECTOR_ADDRESS", "127.0.0.1:9719")
+)
+
+# RingBufferWriter / request_profiler_drain only: the path of the (per host)
+# ring buffer file - ideally on a tmpfs such as /dev/shm - the number of
+# records it holds, and the size (in bytes) of each
+RING_BUFFER_PATH = getattr(settings, "REQUEST_PROFILER_RING_BUFFER_PATH", None)
+RING_BUFFER_CAPACITY = int(
+    getattr(settings, "REQUEST_PROFILER_RING_BUFFER_CAPACITY", 8192)
+)
+RING_BUFFER_SLOT_SIZE = int(
+    getattr(settings, "REQUEST_PROFILER_RING_BUFFER_SLOT_SIZE", 2048)
+)
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import atexit
+import datetime
+import logging
+import math
+import os
+import struct
+import threading
+from typing import TYPE_CHECKING, Iterable
+
+from django.db import close_old_connections
+
+from . import settings
+
+if TYPE_CHECKING:
+    from .models import ProfilingRecord
+
+logger = logging.getLogger(__name__)
+
+# version, relative_accuracy, count, zero_count, sum, min, max, number of bins
+_HEADER = struct.Struct("<BdqqdddI")
+_VERSION = 1
+
+
+class QuantileSketch:
+    """
+    Streaming quantile sketch with a fixed relative error (a la DDSketch).
+
+    Values are counted in logarithmically sized buckets, so that any quantile
+    is estimated to within `relative_accuracy` of its true value, using
+    memory that grows with the range of the values rather than their number
+    - a few hundred buckets cover durations from a microsecond to an hour at
+    1% accuracy. Sketches with the same accuracy can be merged.
+
+    Negative values are not supported (durations and counts are never
+    negative) and are counted as zero.
+
+    Sketches are serialized with `to_bytes` - about 12 bytes per bucket.
+
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1.")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __repr__(self) -> str:
+        return f"<QuantileSketch count={self.count} bins={len(self.bins)}>"
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def mean(self) -> float | None:
+        return self.sum / self.count if self.count else None
+
+    def _key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        # the value in the middle of the bucket, relative error-wise
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value > 0:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + count
+        else:
+            value = max(value, 0)
+            self.zero_count += count
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def update(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: QuantileSketch) -> None:
+        """Add the values counted by another sketch (with the same accuracy)."""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different accuracy.")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float | None:
+        """Return the estimated value at quantile q (0 to 1), or None if empty."""
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1.")
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                # the extremes are known exactly
+                return min(max(self._value(key), self.min), self.max)
+        return self.max
+
+    def to_bytes(self) -> bytes:
+        keys = sorted(self.bins)
+        header = _HEADER.pack(
+            _VERSION,
+            self.relative_accuracy,
+            self.count,
+            self.zero_count,
+            self.sum,
+            self.min,
+            self.max,
+            len(keys),
+        )
+        counts = [self.bins[key] for key in keys]
+        return header + struct.pack(f"<{len(keys)}i{len(keys)}q", *keys, *counts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> QuantileSketch:
+        version, accuracy, count, zero_count, total, lo, hi, size = _HEADER.unpack_from(
+            data
+        )
+        if version != _VERSION:
+            raise ValueError(f"Unknown sketch version: {version}")
+        sketch = cls(relative_accuracy=accuracy)
+        values = struct.unpack_from(f"<{size}i{size}q", data, _HEADER.size)
+        sketch.bins = dict(zip(values[:size], values[size:]))
+        sketch.zero_count = zero_count
+        sketch.count = count
+        sketch.sum = total
+        sketch.min = lo
+        sketch.max = hi
+        return sketch
+
+
+# (view_func_name, period_start)
+SketchKey = tuple[str, datetime.datetime]
+
+
+class SketchRegistry:
+    """
+    In-process QuantileSketch of request durations, per view and period.
+
+    Durations are added as records are captured (see ProfilingRecord.stop),
+    and every SKETCH_FLUSH_INTERVAL seconds a background thread merges the
+    sketches into the ViewSketch table, where sketches from all processes
+    (and periods) can be merged to give percentiles in constant memory.
+    Anything still held is flushed when the process exits.
+
+    """
+
+    def __init__(self, flush_interval: float | None = None) -> None:
+        self.flush_interval = flush_interval or settings.SKETCH_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self) -> None:
+        # called on init, and in a forked child process, which must not
+        # flush the durations held by its parent.
+        self._pid = os.getpid()
+        self._sketches: dict[SketchKey, QuantileSketch] = {}
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _ensure_started(self) -> None:
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="request-profiler-sketches", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+            close_old_connections()
+
+    def add(
+        self, view_func_name: str, start_ts: datetime.datetime, duration: float
+    ) -> None:
+        from .rollups import bucket_start
+
+        self._ensure_started()
+        key = (view_func_name, bucket_start(start_ts, settings.SKETCH_PERIOD))
+        with self._lock:
+            if (sketch := self._sketches.get(key)) is None:
+                sketch = self._sketches[key] = QuantileSketch()
+            sketch.add(duration)
+
+    def add_record(self, record: ProfilingRecord) -> None:
+        self.add(record.view_func_name, record.start_ts, record.duration)
+
+    @property
+    def pending(self) -> int:
+        """Number of durations waiting to be flushed."""
+        with self._lock:
+            return sum(sketch.count for sketch in self._sketches.values())
+
+    def flush(self) -> None:
+        """Merge the held sketches into the ViewSketch table."""
+        from .models import ViewSketch
+
+        with self._flush_lock:
+            with self._lock:
+                sketches, self._sketches = self._sketches, {}
+            for (view_func_name, period_start), sketch in sketches.items():
+                try:
+                    ViewSketch.objects.merge_sketch(
+                        view_func_name, period_start, sketch
+                    )
+                except Exception:
+                    logger.exception(
+                        "Error saving sketch of %i durations.", sketch.count
+                    )
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
+
+
+registry = SketchRegistry()
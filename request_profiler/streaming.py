@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import time
+from typing import AsyncIterator, Callable, Iterator
+
+from django.http import StreamingHttpResponse
+
+
+class StreamCounter:
+    """
+    Count the bytes of a streaming response as they are sent.
+
+    The response content is wrapped (sync or async, to match the response),
+    and `on_close` is called - once - when the response is closed. The
+    request handler closes the response under both WSGI and ASGI, after the
+    content has been sent or the client has gone away.
+
+    A FileResponse with a Content-Length is not wrapped, as assigning its
+    streaming_content would stop the server from sending the file using
+    `wsgi.file_wrapper` (e.g. sendfile) - only `on_close` is hooked up.
+
+    `is_iterated` is False if the content was never iterated over (as for
+    an unwrapped FileResponse), in which case `count` is meaningless. The
+    time.perf_counter_ns() values at which the first chunk was handed to
+    the server, the content was exhausted, and the response was closed are
+    recorded (the first two are None if that never happened, e.g. the
+    client disconnected).
+
+    """
+
+    def __init__(self, on_close: Callable[[StreamCounter], None]) -> None:
+        self.on_close = on_close
+        self.count = 0
+        self.is_iterated = False
+        self.is_closed = False
+        self.first_byte_ns: int | None = None
+        self.last_byte_ns: int | None = None
+        self.closed_ns: int | None = None
+
+    @classmethod
+    def wrap(
+        cls,
+        response: StreamingHttpResponse,
+        on_close: Callable[[StreamCounter], None],
+    ) -> StreamCounter:
+        """Wrap the response content, and return the counter."""
+        counter = cls(on_close)
+        is_file = getattr(response, "file_to_stream", None) is not None
+        if not (is_file and response.has_header("Content-Length")):
+            content = response.streaming_content
+            if getattr(response, "is_async", False):
+                response.streaming_content = counter._acount(content)
+            else:
+                response.streaming_content = counter._count(content)
+        # run after the closers of the original content (e.g. the file)
+        response._resource_closers.append(counter.close)
+        return counter
+
+    def _chunk(self, chunk: bytes) -> None:
+        if self.first_byte_ns is None:
+            self.first_byte_ns = time.perf_counter_ns()
+        self.count += len(chunk)
+
+    def _count(self, content: Iterator[bytes]) -> Iterator[bytes]:
+        self.is_iterated = True
+        for chunk in content:
+            self._chunk(chunk)
+            yield chunk
+        self.last_byte_ns = time.perf_counter_ns()
+
+    async def _acount(self, content: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        self.is_iterated = True
+        async for chunk in content:
+            self._chunk(chunk)
+            yield chunk
+        self.last_byte_ns = time.perf_counter_ns()
+
+    def close(self) -> None:
+        if self.is_closed:
+            return
+        self.is_closed = True
+        self.closed_ns = time.perf_counter_ns()
+        self.on_close(self)
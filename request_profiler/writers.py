@@ -0,0 +1,515 @@
+from __future__ import annotations
+
+import atexit
+import gzip
+import logging
+import os
+import queue
+import shutil
+import socket
+import threading
+import time
+from typing import IO, TYPE_CHECKING
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from . import settings
+
+if TYPE_CHECKING:
+    from .models import ProfilingRecord
+    from .ringbuffer import RingBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class BaseWriter:
+    """
+    Base class for objects that persist captured ProfilingRecord instances.
+
+    The writer is called from `ProfilingRecord.capture()` once the record
+    has been stopped. Subclasses must implement `write`; `flush` and `close`
+    are only relevant to writers that hold records back.
+
+    """
+
+    def write(self, record: ProfilingRecord) -> None:
+        raise NotImplementedError
+
+    async def awrite(self, record: ProfilingRecord) -> None:
+        """Async version of write - runs write in a thread unless overridden."""
+        await sync_to_async(self.write)(record)
+
+    def flush(self) -> None:
+        """Persist any pending records."""
+
+    def close(self) -> None:
+        """Flush pending records and release any resources."""
+        self.flush()
+
+
+class NullWriter(BaseWriter):
+    """
+    Discard records.
+
+    Use with REQUEST_PROFILER_SKETCHES_ENABLED to keep the per-view duration
+    sketches (and so percentiles) without storing each record.
+
+    """
+
+    def write(self, record: ProfilingRecord) -> None:
+        pass
+
+    async def awrite(self, record: ProfilingRecord) -> None:
+        pass
+
+
+class SyncWriter(BaseWriter):
+    """Save each record inline, on the response path (the default)."""
+
+    def write(self, record: ProfilingRecord) -> None:
+        from .rollups import update_rollups
+
+        if not settings.ROLLUP_PERIODS:
+            record.save()
+            return
+        with transaction.atomic():
+            record.save()
+            update_rollups([record])
+
+
+class BufferedWriter(BaseWriter):
+    """
+    Queue records in memory and save them in batches from a background thread.
+
+    Records are flushed using `bulk_create` whenever `batch_size` records are
+    waiting, or every `flush_interval` seconds, whichever comes first. The
+    queue is bounded by `max_size` - once it is full new records are dropped
+    (and counted) rather than blocking the request. Anything still queued is
+    flushed when the process exits.
+
+    If a batch fails to save (e.g. one record has a value that is too long
+    for its column) its records are saved one at a time, so that only the
+    invalid records are lost.
+
+    The `flushed` and `dropped` attributes count records saved and records
+    discarded (either because the queue was full, or the save failed).
+
+    """
+
+    def __init__(
+        self,
+        max_size: int | None = None,
+        batch_size: int | None = None,
+        flush_interval: float | None = None,
+    ) -> None:
+        self.max_size = max_size or settings.WRITER_BUFFER_SIZE
+        self.batch_size = batch_size or settings.WRITER_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.WRITER_FLUSH_INTERVAL
+        self.flushed = 0
+        self.dropped = 0
+        self._counter_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self) -> None:
+        # called on init, and in a forked child process, which inherits the
+        # parent's queue contents but not its flushing thread.
+        self._pid = os.getpid()
+        self._queue: queue.Queue[ProfilingRecord] = queue.Queue(maxsize=self.max_size)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="request-profiler-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            # this thread owns its own db connection(s)
+            close_old_connections()
+
+    def _count(self, flushed: int = 0, dropped: int = 0) -> None:
+        with self._counter_lock:
+            self.flushed += flushed
+            self.dropped += dropped
+
+    @property
+    def pending(self) -> int:
+        """Number of records waiting to be flushed."""
+        return self._queue.qsize()
+
+    def write(self, record: ProfilingRecord) -> None:
+        self._ensure_started()
+        # don't keep the request and response alive whilst queued
+        record.__dict__.pop("request", None)
+        record.__dict__.pop("response", None)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count(dropped=1)
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    async def awrite(self, record: ProfilingRecord) -> None:
+        # write never blocks, so there's no need for a thread
+        self.write(record)
+
+    def _next_batch(self) -> list[ProfilingRecord]:
+        batch: list[ProfilingRecord] = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self) -> None:
+        from .collector import save_records
+
+        with self._flush_lock:
+            while batch := self._next_batch():
+                saved = save_records(batch)
+                self._count(flushed=saved, dropped=len(batch) - saved)
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
+
+
+class PartitionedWriter(BaseWriter):
+    """
+    Save each record to its time partition (see REQUEST_PROFILER_PARTITION_PERIOD).
+
+    The partition is created the first time a record falls into it, though
+    on PostgreSQL it is better to create them ahead of time with the
+    request_profiler_partitions command.
+
+    """
+
+    def __init__(self) -> None:
+        from .partitions import get_partitions
+
+        self.partitions = get_partitions()
+
+    def write(self, record: ProfilingRecord) -> None:
+        from .rollups import update_rollups
+
+        self.partitions.ensure_partition(record.start_ts)
+        if not settings.ROLLUP_PERIODS:
+            self.partitions.insert(record)
+            return
+        with transaction.atomic(using=self.partitions.connection.alias):
+            self.partitions.insert(record)
+            update_rollups([record])
+
+
+class NormalizedWriter(BaseWriter):
+    """
+    Save each record as a NormalizedProfilingRecord.
+
+    The ids of the record's path, user agent, referer and view function are
+    held in an LRU cache (REQUEST_PROFILER_DIMENSION_CACHE_SIZE), so in the
+    steady state each record is a single insert. The rollups
+    (REQUEST_PROFILER_ROLLUP_PERIODS) are updated from the original record.
+
+    """
+
+    def __init__(self) -> None:
+        from .dimensions import DimensionCache
+
+        self.cache = DimensionCache()
+
+    def _save(self, record: ProfilingRecord) -> None:
+        from .dimensions import normalize
+        from .rollups import update_rollups
+
+        if not settings.ROLLUP_PERIODS:
+            normalize(record, self.cache).save()
+            return
+        with transaction.atomic():
+            normalize(record, self.cache).save()
+            update_rollups([record])
+
+    def write(self, record: ProfilingRecord) -> None:
+        try:
+            self._save(record)
+        except IntegrityError:
+            # a cached dimension value may have been deleted (as unused) by
+            # the truncation command since it was cached
+            self.cache.clear()
+            self._save(record)
+
+
+def gzip_file(path: str) -> None:
+    """Compress a file to path.gz, then remove it."""
+    try:
+        with open(path, "rb") as src, gzip.open(f"{path}.gz.tmp", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(f"{path}.gz.tmp", f"{path}.gz")
+        os.remove(path)
+    except OSError:
+        logger.exception("Error compressing %s.", path)
+
+
+class FileWriter(BaseWriter):
+    """
+    Append records, as JSON lines, to a file - never touching the database.
+
+    Each process writes to its own file in REQUEST_PROFILER_FILE_WRITER_DIR,
+    named "{host}-{pid}-{timestamp}-{n}.jsonl.part" whilst it is being
+    written.
+    The file is rotated (renamed to .jsonl, and compressed to .jsonl.gz if
+    REQUEST_PROFILER_FILE_WRITER_GZIP is set) once it reaches
+    REQUEST_PROFILER_FILE_WRITER_MAX_BYTES or is older than
+    REQUEST_PROFILER_FILE_WRITER_MAX_AGE seconds, and when the process
+    exits. The complete files can then be loaded with the
+    request_profiler_import command.
+
+    Writes are buffered, unless REQUEST_PROFILER_FILE_WRITER_FSYNC is set,
+    when each record is flushed and fsync'd before write returns.
+
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        max_bytes: int | None = None,
+        max_age: float | None = None,
+        fsync: bool | None = None,
+        compress: bool | None = None,
+    ) -> None:
+        directory = directory or settings.FILE_WRITER_DIR
+        if not directory:
+            raise ValueError("REQUEST_PROFILER_FILE_WRITER_DIR is not set.")
+        self.directory: str = directory
+        self.max_bytes = max_bytes or settings.FILE_WRITER_MAX_BYTES
+        self.max_age = max_age or settings.FILE_WRITER_MAX_AGE
+        self.fsync = settings.FILE_WRITER_FSYNC if fsync is None else fsync
+        self.compress = settings.FILE_WRITER_GZIP if compress is None else compress
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._file: IO[str] | None = None
+        self._opened_at = 0.0
+        self._sequence = 0
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(self.close)
+
+    @property
+    def path(self) -> str | None:
+        """The path of the file being written, if any."""
+        return self._file.name if self._file else None
+
+    def _open(self) -> IO[str]:
+        self._opened_at = time.time()
+        prefix = os.path.join(
+            self.directory,
+            "{}-{}-{}".format(
+                socket.gethostname(),
+                os.getpid(),
+                time.strftime("%Y%m%dT%H%M%S", time.gmtime(self._opened_at)),
+            ),
+        )
+        # a file may be rotated more than once a second, and the pid reused
+        while True:
+            path = f"{prefix}-{self._sequence}.jsonl"
+            self._sequence += 1
+            if os.path.exists(path) or os.path.exists(f"{path}.gz"):
+                continue
+            try:
+                return open(f"{path}.part", "x", encoding="utf-8", buffering=65536)
+            except FileExistsError:
+                continue
+
+    def _discard(self) -> None:
+        # drop a file inherited from the parent process, without flushing the
+        # parent's buffered lines to it (again)
+        if self._file is None:
+            return
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        try:
+            os.dup2(devnull, self._file.fileno())
+            self._file.close()
+        finally:
+            os.close(devnull)
+        self._file = None
+
+    def _rotate(self, background: bool = True) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        path = self._file.name.removesuffix(".part")
+        os.replace(self._file.name, path)
+        self._file = None
+        if not self.compress:
+            return
+        if background:
+            # so that a request doesn't wait for the file to be compressed
+            threading.Thread(
+                target=gzip_file, args=(path,), name="request-profiler-gzip"
+            ).start()
+        else:
+            gzip_file(path)
+
+    def write(self, record: ProfilingRecord) -> None:
+        from .serialization import record_to_json
+
+        line = record_to_json(record) + "\n"
+        with self._lock:
+            if self._pid != os.getpid():
+                # a forked child must not write to (or rotate) its parent's file
+                self._pid = os.getpid()
+                self._discard()
+            if self._file is not None and (
+                self._file.tell() >= self.max_bytes
+                or time.time() - self._opened_at >= self.max_age
+            ):
+                self._rotate()
+            if self._file is None:
+                self._file = self._open()
+            self._file.write(line)
+            if self.fsync:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self) -> None:
+        # close is called at exit, when a new thread may not run (or start)
+        with self._lock:
+            if self._pid == os.getpid():
+                self._rotate(background=False)
+
+
+class UDPWriter(BaseWriter):
+    """
+    Send each record, as one datagram, to a collector process.
+
+    Records are sent (as JSON) to REQUEST_PROFILER_COLLECTOR_ADDRESS, either
+    "host:port" for UDP or the path of a Unix datagram socket, where the
+    request_profiler_collector command saves them. Sending never blocks - if
+    the collector is not running, or can't keep up, records are dropped (and
+    counted in `dropped`).
+
+    """
+
+    def __init__(self, address: str | None = None) -> None:
+        from .collector import parse_address
+
+        self.family, self.address = parse_address(address or settings.COLLECTOR_ADDRESS)
+        self.sent = 0
+        self.dropped = 0
+        self._pid = 0
+        self._sock: socket.socket | None = None
+
+    def _socket(self) -> socket.socket:
+        if self._sock is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._sock = socket.socket(self.family, socket.SOCK_DGRAM)
+            self._sock.setblocking(False)
+        return self._sock
+
+    def write(self, record: ProfilingRecord) -> None:
+        from .serialization import record_to_json
+
+        try:
+            self._socket().sendto(record_to_json(record).encode(), self.address)
+        except OSError:
+            # full buffer, no listener (unix socket), or too large
+            self.dropped += 1
+        else:
+            self.sent += 1
+
+    async def awrite(self, record: ProfilingRecord) -> None:
+        # write never blocks, so there's no need for a thread
+        self.write(record)
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class RingBufferWriter(BaseWriter):
+    """
+    Append each record to a ring buffer shared by all processes on the host.
+
+    The buffer (see request_profiler.ringbuffer) is a memory mapped file at
+    REQUEST_PROFILER_RING_BUFFER_PATH, holding the latest
+    REQUEST_PROFILER_RING_BUFFER_CAPACITY records, which the
+    request_profiler_drain command saves in batches. Writing never touches
+    the database or blocks on the drain - if the buffer is full the oldest
+    record is overwritten (and counted in the buffer's `dropped`). Records
+    that are too large for a slot, even once truncated, are counted in
+    `dropped`.
+
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        path = path or settings.RING_BUFFER_PATH
+        if not path:
+            raise ValueError("REQUEST_PROFILER_RING_BUFFER_PATH is not set.")
+        self.path: str = path
+        self.dropped = 0
+        self._pid = 0
+        self._buffer: RingBuffer | None = None
+
+    @property
+    def buffer(self) -> RingBuffer:
+        # each process maps the file itself, rather than using its parent's
+        if self._buffer is None or self._pid != os.getpid():
+            from .ringbuffer import RingBuffer
+
+            self._pid = os.getpid()
+            self._buffer = RingBuffer(self.path)
+        return self._buffer
+
+    def write(self, record: ProfilingRecord) -> None:
+        from .ringbuffer import pack_record
+
+        buffer = self.buffer
+        if (payload := pack_record(record, buffer.max_record_size)) is None:
+            self.dropped += 1
+            return
+        buffer.append(payload)
+
+    async def awrite(self, record: ProfilingRecord) -> None:
+        # write never blocks, so there's no need for a thread
+        self.write(record)
+
+    def close(self) -> None:
+        if self._buffer is not None and self._pid == os.getpid():
+            self._buffer.close()
+        self._buffer = None
+
+
+_writers: dict[str, BaseWriter] = {}
+
+
+def get_writer() -> BaseWriter:
+    """Return the (per-process) writer configured by REQUEST_PROFILER_WRITER."""
+    if (writer := _writers.get(settings.WRITER)) is None:
+        writer = _writers[settings.WRITER] = import_string(settings.WRITER)()
+    return writer
@@ -79,7 +79,9 @@ LOGGING = {
 
 ROOT_URLCONF = "tests.urls"
 
-# turn off caching for tests
+# turn off caching for tests - the ruleset version stamp would otherwise
+# outlive the rules, which are rolled back at the end of each test.
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
 REQUEST_PROFILER_RULESET_CACHE_TIMEOUT = 0
 
 # AUTH_USER_MODEL = 'tests.CustomUser'
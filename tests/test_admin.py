@@ -0,0 +1,195 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from request_profiler import settings
+from request_profiler.dashboard import (
+    MAX_TOP,
+    _refresh,
+    dashboard_data,
+    get_or_refresh,
+)
+from request_profiler.models import ProfilingRecord
+from request_profiler.paginators import estimate_count, parse_cursor
+
+from .utils import LOCMEM_CACHES, create_record
+
+UTC = datetime.timezone.utc
+TS = datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=UTC)
+
+
+class PaginatorTests(TestCase):
+    def test_parse_cursor(self):
+        self.assertEqual(parse_cursor(f"{TS.isoformat()}_12"), (TS, 12))
+        self.assertIsNone(parse_cursor(None))
+        self.assertIsNone(parse_cursor("foo"))
+        self.assertIsNone(parse_cursor(f"{TS.isoformat()}_x"))
+
+    def test_estimate_count(self):
+        # PostgreSQL only
+        self.assertIsNone(estimate_count(ProfilingRecord.objects.all()))
+
+
+class ProfilingRecordAdminTests(TestCase):
+    url = reverse("admin:request_profiler_profilingrecord_changelist")
+
+    def setUp(self):
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "x")
+        self.client.force_login(self.user)
+        for i in range(5):
+            create_record(
+                i,
+                start_ts=TS - datetime.timedelta(minutes=i),
+                response_status_code=500 if i % 2 else 200,
+                user=self.user,
+            )
+
+    def records(self, response):
+        return list(response.context["cl"].result_list)
+
+    def test_changelist(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        records = self.records(response)
+        self.assertEqual([r.duration for r in records], [0, 1, 2, 3, 4])
+        self.assertEqual(records[0].user, self.user)
+        cl = response.context["cl"]
+        self.assertEqual(cl.queryset.query.select_related, {"user": {}})
+        self.assertIsNone(cl.full_result_count)
+
+    def test_changelist__status_filter(self):
+        response = self.client.get(self.url, {"status_class": "5"})
+        self.assertEqual([r.duration for r in self.records(response)], [1, 3])
+
+    def test_changelist__keyset(self):
+        response = self.client.get(self.url)
+        admin = response.context["cl"].model_admin
+        admin.list_per_page = 2
+        try:
+            response = self.client.get(self.url, {"status_class": "2"})
+            paginator = response.context["cl"].paginator
+            self.assertEqual([r.duration for r in self.records(response)], [0, 2])
+            self.assertIn("before=", paginator.next_url)
+            self.assertIn("status_class=2", paginator.next_url)
+            self.assertContains(response, "Older records")
+            response = self.client.get(self.url + paginator.next_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([r.duration for r in self.records(response)], [4])
+            self.assertIsNone(response.context["cl"].paginator.next_url)
+        finally:
+            admin.list_per_page = 100
+
+
+class DashboardTests(TestCase):
+    url = reverse("admin:request_profiler_dashboard")
+
+    def setUp(self):
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "x")
+        self.client.force_login(self.user)
+
+    def test_dashboard(self):
+        now = timezone.now()
+        create_record(1, view_func_name="fast", start_ts=now, query_count=50)
+        create_record(5, view_func_name="slow", start_ts=now, query_count=1)
+        create_record(2, view_func_name="fast", response_status_code=500)
+        create_record(9, start_ts=now - datetime.timedelta(days=2))
+        response = self.client.get(self.url, {"hours": "1", "top": "x"})
+        self.assertEqual(response.status_code, 200)
+        context = response.context
+        self.assertEqual(context["hours"], 24)
+        self.assertEqual(context["total"], 3)
+        self.assertEqual(
+            [row["view_func_name"] for row in context["slowest_views"]],
+            ["slow", "fast"],
+        )
+        self.assertEqual(
+            [row["view_func_name"] for row in context["query_outliers"]],
+            ["fast", "slow"],
+        )
+        self.assertEqual(
+            [
+                (row["response_status_code"], row["count"])
+                for row in context["status_codes"]
+            ],
+            [(200, 2), (500, 1)],
+        )
+        self.assertContains(response, "Slowest views")
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_dashboard__top(self):
+        cache.clear()
+        now = timezone.now()
+        create_record(1, view_func_name="fast", start_ts=now)
+        create_record(5, view_func_name="slow", start_ts=now)
+        with mock.patch(
+            "request_profiler.dashboard.dashboard_data", wraps=dashboard_data
+        ) as mock_data:
+            for top, expected in (("1", ["slow"]), ("-1", ["slow"]), ("5", None)):
+                response = self.client.get(self.url, {"top": top})
+                views = response.context["slowest_views"]
+                self.assertEqual(
+                    [row["view_func_name"] for row in views],
+                    expected or ["slow", "fast"],
+                )
+        # one result is cached for the window, whatever the top
+        mock_data.assert_called_once_with(24, MAX_TOP)
+        cache.clear()
+
+    @mock.patch("request_profiler.admin.get_dashboard_data")
+    def test_dashboard__calculating(self, mock_data):
+        mock_data.return_value = {"calculating": True}
+        response = self.client.get(self.url)
+        self.assertContains(response, "being calculated")
+        self.assertContains(response, 'http-equiv="refresh"')
+        self.assertNotContains(response, "Slowest views")
+
+    def test_dashboard__staff_only(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GetOrRefreshTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch("request_profiler.dashboard.threading.Thread")
+    @mock.patch("request_profiler.dashboard.time.time")
+    def test_get_or_refresh(self, mock_time, mock_thread):
+        func = mock.Mock(side_effect=[1, 2])
+        mock_time.return_value = 0
+        self.assertEqual(get_or_refresh("key", func), 1)
+        # fresh
+        self.assertEqual(get_or_refresh("key", func), 1)
+        self.assertEqual(func.call_count, 1)
+        mock_thread.assert_not_called()
+        # stale - refreshed in the background, once
+        mock_time.return_value = settings.DASHBOARD_CACHE_TIMEOUT
+        self.assertEqual(get_or_refresh("key", func), 1)
+        self.assertEqual(get_or_refresh("key", func), 1)
+        mock_thread.assert_called_once()
+        _refresh(*mock_thread.call_args.kwargs["args"])
+        self.assertEqual(get_or_refresh("key", func), 2)
+        self.assertEqual(func.call_count, 2)
+
+    def test_get_or_refresh__cold(self):
+        func = mock.Mock(return_value=1)
+        # another request is calculating it
+        cache.add("key:refresh", True)
+        self.assertEqual(get_or_refresh("key", func, default=0), 0)
+        func.assert_not_called()
+        cache.delete("key:refresh")
+        self.assertEqual(get_or_refresh("key", func, default=0), 1)
+        self.assertEqual(get_or_refresh("key", func, default=0), 1)
+        func.assert_called_once()
+        # the lock is released, even if func fails
+        cache.clear()
+        func.side_effect = ValueError
+        self.assertRaises(ValueError, get_or_refresh, "key", func)
+        self.assertIsNone(cache.get("key:refresh"))
@@ -0,0 +1,89 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from request_profiler.aggregates import PercentileCont, aggregate_percentiles
+from request_profiler.models import ProfilingRecord
+
+from .utils import create_record
+
+
+class AggregatePercentilesTests(TestCase):
+    def test_aggregate_percentiles(self):
+        for i in range(1, 101):
+            create_record(i / 100, view_func_name="foo", query_count=i)
+        create_record(2, view_func_name="bar")
+        bar, foo = aggregate_percentiles()
+        self.assertEqual(bar["view_func_name"], "bar")
+        self.assertEqual(bar["count"], 1)
+        self.assertEqual(bar["duration_p99"], 2)
+        self.assertIsNone(bar["query_count_p50"])
+        self.assertIsNone(bar["query_count_max"])
+        self.assertEqual(foo["count"], 100)
+        self.assertAlmostEqual(foo["duration_mean"], 0.505)
+        self.assertAlmostEqual(foo["duration_p50"], 0.5, delta=0.01)
+        self.assertAlmostEqual(foo["duration_p90"], 0.9, delta=0.01)
+        self.assertAlmostEqual(foo["query_count_p99"], 99, delta=1)
+        self.assertEqual(foo["duration_max"], 1)
+
+    def test_aggregate_percentiles__group_by_period(self):
+        start_ts = timezone.now().replace(hour=12, minute=30)
+        create_record(1, start_ts=start_ts)
+        create_record(2, start_ts=start_ts, http_method="POST")
+        create_record(3, start_ts=start_ts - datetime.timedelta(hours=1))
+        rows = aggregate_percentiles(
+            group_by=["view_func_name", "http_method"],
+            period="hour",
+            metrics=["duration"],
+            percentiles=[50],
+        )
+        hour = timezone.localtime(start_ts).replace(minute=0, second=0, microsecond=0)
+        self.assertEqual(
+            [(r["http_method"], r["bucket"], r["count"]) for r in rows],
+            [
+                ("GET", hour - datetime.timedelta(hours=1), 1),
+                ("GET", hour, 1),
+                ("POST", hour, 1),
+            ],
+        )
+        self.assertEqual(
+            set(rows[0]),
+            {
+                "view_func_name",
+                "http_method",
+                "bucket",
+                "count",
+                "duration_mean",
+                "duration_p50",
+                "duration_max",
+            },
+        )
+
+    def test_aggregate_percentiles__invalid(self):
+        self.assertRaises(ValueError, aggregate_percentiles, group_by=["user"])
+        self.assertRaises(ValueError, aggregate_percentiles, metrics=["id"])
+
+    def test_percentile_cont(self):
+        # only runs on PostgreSQL, but the SQL can be generated anywhere
+        qs = ProfilingRecord.objects.annotate(p=PercentileCont("duration", 0.9))
+        self.assertIn(
+            "PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY "
+            '"request_profiler_profilingrecord"."duration")',
+            str(qs.query),
+        )
+        self.assertRaises(ValueError, PercentileCont, "duration", 90)
+
+    def test_command(self):
+        create_record(1, view_func_name="foo")
+        create_record(1, start_ts=timezone.now() - datetime.timedelta(days=2))
+        out = StringIO()
+        call_command("request_profiler_percentiles", "-g", "view_func_name", stdout=out)
+        header, row = out.getvalue().splitlines()
+        self.assertTrue(header.startswith("view_func_name,count,duration_mean,"))
+        self.assertTrue(row.startswith("foo,1,1.0,"))
+        out = StringIO()
+        call_command("request_profiler_percentiles", "--days", "0", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
@@ -0,0 +1,136 @@
+import os
+import socket
+import tempfile
+import threading
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from request_profiler import settings
+from request_profiler.collector import Collector, bind_socket, parse_address
+from request_profiler.models import ProfilingRecord, ProfilingRollup
+from request_profiler.writers import UDPWriter
+
+from .utils import fail_saving, stopped_record
+
+
+class ParseAddressTests(TestCase):
+    def test_parse_address(self):
+        self.assertEqual(
+            parse_address("127.0.0.1:9719"), (socket.AF_INET, ("127.0.0.1", 9719))
+        )
+        self.assertEqual(parse_address("/tmp/foo"), (socket.AF_UNIX, "/tmp/foo"))
+        self.assertEqual(parse_address("unix:foo"), (socket.AF_UNIX, "foo"))
+        self.assertRaises(ValueError, parse_address, "localhost")
+        self.assertRaises(ValueError, parse_address, ":80")
+
+
+class CollectorTests(TestCase):
+    def setUp(self):
+        self.sock = bind_socket("127.0.0.1:0")
+        host, port = self.sock.getsockname()
+        self.writer = UDPWriter(f"{host}:{port}")
+
+    def tearDown(self):
+        self.writer.close()
+        self.sock.close()
+
+    def test_collect(self):
+        collector = Collector(self.sock, batch_size=2, flush_interval=60)
+        record = stopped_record()
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.writer.write(record)
+        self.assertEqual(self.writer.sent, 3)
+        self.sock.sendto(b"not json", self.sock.getsockname())
+        collector.receive(timeout=0.5)
+        self.assertEqual(collector.received, 4)
+        self.assertEqual(collector.invalid, 1)
+        # one batch saved
+        self.assertEqual(collector.flushed, 2)
+        self.assertEqual(ProfilingRecord.objects.count(), 2)
+        collector.flush()
+        self.assertEqual(ProfilingRecord.objects.count(), 3)
+        self.assertEqual(ProfilingRecord.objects.first().duration, record.duration)
+
+    def test_collect__invalid(self):
+        collector = Collector(self.sock, flush_interval=60)
+        self.writer.write(stopped_record())
+        # a missing required field, and a null value for a non-null column
+        self.sock.sendto(b'{"duration": 1}', self.sock.getsockname())
+        invalid = stopped_record()
+        invalid.remote_addr = None
+        self.writer.write(invalid)
+        failing = stopped_record()
+        failing.http_method = "FAIL"
+        self.writer.write(failing)
+        collector.receive(timeout=0.5)
+        self.assertEqual(collector.invalid, 2)
+        with fail_saving("FAIL"), self.assertLogs("request_profiler.collector"):
+            collector.flush()
+        # only the record that failed to save is lost
+        self.assertEqual(collector.flushed, 1)
+        self.assertEqual(collector.dropped, 1)
+        self.assertEqual(ProfilingRecord.objects.count(), 1)
+
+    def test_serve(self):
+        collector = Collector(self.sock, flush_interval=60)
+        stopped = threading.Event()
+        self.writer.write(stopped_record())
+        with mock.patch.object(
+            collector, "receive", side_effect=lambda timeout: stopped.set()
+        ):
+            collector.serve(stopped)
+        self.assertEqual(collector.flushed, 0)
+        # saves what it has when stopped
+        collector.receive(timeout=0.5)
+        collector.serve(stopped)
+        self.assertEqual(collector.flushed, 1)
+
+    def test_rollups_only(self):
+        collector = Collector(self.sock, store_records=False)
+        self.writer.write(stopped_record())
+        collector.receive(timeout=0.5)
+        settings.ROLLUP_PERIODS = ("hour",)
+        try:
+            collector.flush()
+        finally:
+            settings.ROLLUP_PERIODS = ()
+        self.assertFalse(ProfilingRecord.objects.exists())
+        self.assertEqual(ProfilingRollup.objects.get().count, 1)
+
+
+class BindSocketTests(TestCase):
+    def test_bind_socket__existing_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "collector.sock")
+            bind_socket(path).close()
+            # a stale socket is replaced
+            bind_socket(path).close()
+            os.remove(path)
+            with open(path, "w") as f:
+                f.write("data")
+            self.assertRaises(ValueError, bind_socket, path)
+            self.assertTrue(os.path.isfile(path))
+            with self.assertRaises(CommandError):
+                call_command("request_profiler_collector", "--address", path)
+
+
+class UDPWriterTests(TestCase):
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "collector.sock")
+            writer = UDPWriter(path)
+            # no collector
+            writer.write(stopped_record())
+            self.assertEqual(writer.dropped, 1)
+            sock = bind_socket(f"unix:{path}")
+            try:
+                writer.write(stopped_record())
+                self.assertEqual(writer.sent, 1)
+                self.assertTrue(sock.recv(65536).startswith(b"{"))
+            finally:
+                sock.close()
+                writer.close()
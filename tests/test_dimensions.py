@@ -0,0 +1,95 @@
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import TestCase
+
+from request_profiler import settings
+from request_profiler.dimensions import DimensionCache, normalize
+from request_profiler.models import (
+    NormalizedProfilingRecord,
+    ProfilingRollup,
+    RequestPath,
+    UserAgent,
+    ViewFunction,
+)
+from request_profiler.writers import NormalizedWriter
+
+from .utils import stopped_record
+
+
+class DimensionCacheTests(TestCase):
+    def test_get_id(self):
+        cache = DimensionCache(max_size=2)
+        pk = cache.get_id(UserAgent, "foo")
+        self.assertEqual(UserAgent.objects.get(value="foo").pk, pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get_id(UserAgent, "foo"), pk)
+        # different tables
+        self.assertNotEqual(cache.get_id(RequestPath, "foo"), None)
+        self.assertEqual(len(cache), 2)
+        # evicts the least recently used
+        cache.get_id(UserAgent, "foo")
+        cache.get_id(UserAgent, "bar")
+        self.assertEqual(len(cache), 2)
+        with self.assertNumQueries(0):
+            cache.get_id(UserAgent, "foo")
+        with self.assertNumQueries(1):
+            self.assertEqual(cache.get_id(RequestPath, "foo"), 1)
+
+    def test_get_id__truncated(self):
+        cache = DimensionCache()
+        pk = cache.get_id(UserAgent, "x" * 500)
+        self.assertEqual(len(UserAgent.objects.get(pk=pk).value), 400)
+
+
+class NormalizedWriterTests(TestCase):
+    def test_write(self):
+        writer = NormalizedWriter()
+        record = stopped_record()
+        record.view_func_name = "foo.bar"
+        record.http_user_agent = "Mozilla"
+        writer.write(record)
+        writer.write(stopped_record())
+        # the ids are all cached
+        with self.assertNumQueries(1):
+            writer.write(stopped_record())
+        self.assertEqual(NormalizedProfilingRecord.objects.count(), 3)
+        self.assertEqual(ViewFunction.objects.count(), 2)
+        normalized = NormalizedProfilingRecord.objects.with_values().earliest("pk")
+        with self.assertNumQueries(0):
+            copy = normalized.to_record()
+        self.assertEqual(copy.view_func_name, "foo.bar")
+        self.assertEqual(copy.http_user_agent, "Mozilla")
+        self.assertEqual(copy.request_uri, "/")
+        self.assertEqual(copy.duration, record.duration)
+        self.assertEqual(copy.start_ts, record.start_ts)
+
+    def test_write__rollups(self):
+        settings.ROLLUP_PERIODS = ("hour",)
+        try:
+            NormalizedWriter().write(stopped_record())
+        finally:
+            settings.ROLLUP_PERIODS = ()
+        self.assertEqual(ProfilingRollup.objects.get().count, 1)
+
+    def test_write__deleted_value(self):
+        writer = NormalizedWriter()
+        writer.write(stopped_record())
+        with mock.patch.object(
+            NormalizedProfilingRecord,
+            "save",
+            autospec=True,
+            side_effect=[IntegrityError, None],
+        ) as mock_save, mock.patch.object(
+            writer.cache, "clear", wraps=writer.cache.clear
+        ) as mock_clear:
+            writer.write(stopped_record())
+        # retried, with the cache cleared
+        self.assertEqual(mock_save.call_count, 2)
+        mock_clear.assert_called_once()
+
+    def test_normalize(self):
+        normalized = normalize(stopped_record(), DimensionCache())
+        self.assertIsNone(normalized.pk)
+        self.assertEqual(normalized.request_path.value, "/")
+        self.assertEqual(normalized.referer.value, "")
@@ -0,0 +1,133 @@
+import ast
+import csv
+import datetime
+import gzip
+import json
+import os
+import struct
+import tempfile
+import zipfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from request_profiler.columnar import (
+    CATEGORY,
+    FLOAT,
+    INT,
+    TEXT,
+    field_kind,
+    npy_header,
+)
+from request_profiler.models import ProfilingRecord
+from request_profiler.serialization import FIELDS
+
+from .utils import create_record
+
+UTC = datetime.timezone.utc
+TS = datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=UTC)
+
+
+def read_npy(data):
+    """Return the header dict and data of an .npy file."""
+    (length,) = struct.unpack_from("<H", data, 8)
+    header = ast.literal_eval(data[10 : 10 + length].decode())
+    return header, data[10 + length :]
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        create_record(1, view_func_name="foo", start_ts=TS, query_count=3)
+        create_record(2, view_func_name="bar", start_ts=TS + datetime.timedelta(days=1))
+        create_record(3, view_func_name="foo", start_ts=TS + datetime.timedelta(days=2))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def export(self, name, *args):
+        path = os.path.join(self.tmpdir.name, name)
+        err = StringIO()
+        call_command("request_profiler_export", path, *args, stderr=err)
+        return path, err.getvalue()
+
+    def test_export__jsonl_gz(self):
+        path, err = self.export("records.jsonl.gz", "--view", "foo")
+        self.assertIn("exported 2 records", err)
+        with gzip.open(path, "rt") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row["duration"] for row in rows], [1, 3])
+        self.assertEqual(rows[0]["start_ts"], TS.isoformat())
+        self.assertEqual(list(rows[0]), FIELDS)
+
+    def test_export__csv(self):
+        path, _ = self.export(
+            "records.csv",
+            "--since",
+            "2024-01-03T00:00Z",
+            "--until",
+            "2024-01-04T03:00:00Z",
+        )
+        with open(path) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["view_func_name"], "bar")
+        self.assertEqual(rows[0]["user_id"], "")
+
+    def test_export__npz(self):
+        ProfilingRecord.objects.filter(view_func_name="bar").update(request_uri="/bär/")
+        path, _ = self.export("records.npz")
+        with zipfile.ZipFile(path) as zf:
+            names = zf.namelist()
+            self.assertIn("duration.npy", names)
+            self.assertIn("view_func_name_categories.npy", names)
+            header, data = read_npy(zf.read("duration.npy"))
+            self.assertEqual(header["descr"], "<f8")
+            self.assertEqual(header["shape"], (3,))
+            self.assertEqual(struct.unpack("<3d", data), (1, 2, 3))
+            header, data = read_npy(zf.read("start_ts.npy"))
+            self.assertEqual(header["descr"], "<M8[us]")
+            self.assertEqual(
+                struct.unpack("<3q", data)[0], int(TS.timestamp()) * 1000000
+            )
+            _, data = read_npy(zf.read("view_func_name.npy"))
+            self.assertEqual(struct.unpack("<3i", data), (0, 1, 0))
+            header, data = read_npy(zf.read("view_func_name_categories.npy"))
+            self.assertEqual(header["descr"], "<U3")
+            self.assertEqual(data.decode("utf-32-le"), "foobar")
+            _, data = read_npy(zf.read("query_count.npy"))
+            self.assertEqual(struct.unpack("<3d", data)[0], 3)
+            # free text is not dictionary encoded
+            self.assertNotIn("request_uri.npy", names)
+            header, offsets = read_npy(zf.read("request_uri_offsets.npy"))
+            self.assertEqual(header["descr"], "<u8")
+            self.assertEqual(header["shape"], (4,))
+            offsets = struct.unpack("<4Q", offsets)
+            header, data = read_npy(zf.read("request_uri_bytes.npy"))
+            self.assertEqual(header["descr"], "|u1")
+            self.assertEqual(header["shape"], (offsets[-1],))
+            uris = [data[a:b].decode() for a, b in zip(offsets, offsets[1:])]
+            self.assertEqual(uris, ["/", "/bär/", "/"])
+
+    def test_field_kind(self):
+        def kind(name):
+            return field_kind(ProfilingRecord._meta.get_field(name))
+
+        self.assertEqual(kind("view_func_name"), CATEGORY)
+        self.assertEqual(kind("http_method"), CATEGORY)
+        self.assertEqual(kind("query_string"), TEXT)
+        self.assertEqual(kind("session_key"), TEXT)
+        self.assertEqual(kind("duration"), FLOAT)
+        self.assertEqual(kind("response_status_code"), INT)
+
+    def test_export__invalid(self):
+        self.assertRaises(CommandError, self.export, "records.txt")
+        self.assertRaises(CommandError, self.export, "records.npz.gz")
+        self.assertRaises(CommandError, self.export, "records.csv", "--since", "x")
+
+    def test_npy_header(self):
+        header = npy_header("<f8", 10)
+        self.assertEqual(len(header) % 64, 0)
+        self.assertTrue(header.endswith(b"\n"))
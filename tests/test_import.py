@@ -0,0 +1,112 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+
+from request_profiler.management.commands.request_profiler_import import (
+    batched,
+    copy_records,
+)
+from request_profiler.models import ProfilingRecord
+from request_profiler.serialization import (
+    FIELDS,
+    REQUIRED_FIELDS,
+    record_to_dict,
+    record_to_json,
+)
+
+from .utils import stopped_record
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def call(self, *args):
+        out = StringIO()
+        err = StringIO()
+        call_command("request_profiler_import", *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_batched(self):
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_required_fields(self):
+        self.assertIn("start_ts", REQUIRED_FIELDS)
+        self.assertNotIn("query_count", REQUIRED_FIELDS)
+        self.assertNotIn("user_id", REQUIRED_FIELDS)
+
+    def test_import__jsonl_gz(self):
+        record = stopped_record()
+        path = self.path("records.jsonl.gz")
+        with gzip.open(path, "wt") as f:
+            for _ in range(3):
+                f.write(record_to_json(record) + "\n")
+            f.write("\n")
+        with self.assertNumQueries(6):
+            # two batches, each an insert in a transaction (savepoint)
+            out, _ = self.call(path, "--batch-size", "2")
+        self.assertIn("imported 3 records", out)
+        self.assertIn("rows/s", out)
+        self.assertEqual(ProfilingRecord.objects.count(), 3)
+        self.assertEqual(ProfilingRecord.objects.first().duration, record.duration)
+
+    def test_import__csv(self):
+        path = self.path("records.csv")
+        data = record_to_dict(stopped_record())
+        with open(path, "w") as f:
+            f.write(",".join(FIELDS) + "\n")
+            f.write(",".join("" if v is None else str(v) for v in data.values()) + "\n")
+        out, _ = self.call(path)
+        self.assertIn("imported 1 records", out)
+        record = ProfilingRecord.objects.get()
+        self.assertIsNone(record.user_id)
+        self.assertIsNone(record.time_to_view)
+
+    def test_import__invalid(self):
+        path = self.path("records.jsonl")
+        data = record_to_dict(stopped_record())
+        with open(path, "w") as f:
+            f.write("not json\n")
+            f.write("[1]\n")
+            f.write(json.dumps({**data, "duration": "x"}) + "\n")
+            f.write(json.dumps({"duration": 1}) + "\n")
+            f.write(json.dumps({**data, "remote_addr": None}) + "\n")
+            f.write(json.dumps({**data, "request_uri": "/" * 201}) + "\n")
+            f.write(json.dumps(data) + "\n")
+        out, err = self.call(path)
+        self.assertIn("imported 1 records", out)
+        self.assertIn("skipped 6 invalid rows", out)
+        self.assertIn("skipping row 5: ['remote_addr cannot be null.']", err)
+        self.assertIn("skipping row 4: Missing", err)
+        self.assertRaisesMessage(
+            CommandError, "Invalid row 1", self.call, path, "--strict"
+        )
+
+    def test_import__unknown_format(self):
+        self.assertRaises(CommandError, self.call, self.path("records.txt"))
+
+    @mock.patch.object(connection, "cursor")
+    def test_copy_records(self, mock_cursor):
+        raw = mock_cursor.return_value.__enter__.return_value.cursor
+        record = stopped_record()
+        copy_records([record, record], "default")
+        sql, buffer = raw.copy_expert.call_args.args
+        self.assertIn("FROM STDIN WITH (FORMAT csv, FORCE_NULL (", sql)
+        rows = list(csv.reader(buffer))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(len(rows[0]), len(FIELDS))
@@ -0,0 +1,211 @@
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from request_profiler import settings
+from request_profiler.matcher import RuleMatcher, TokenBucket, _max_age, get_matcher
+from request_profiler.models import RuleSet
+
+from .utils import LOCMEM_CACHES, skipIfCustomUser
+
+
+class RuleMatcherTests(TestCase):
+    def test_no_rules(self):
+        matcher = RuleMatcher([])
+        self.assertEqual(matcher.rules, ())
+        self.assertFalse(matcher.match("/", None))
+
+    def test_match_uri(self):
+        r1 = RuleSet(uri_regex="^/foo")
+        r2 = RuleSet(uri_regex="bar/$")
+        r3 = RuleSet(uri_regex="")
+        matcher = RuleMatcher([r1, r2, r3])
+        self.assertEqual(list(matcher.match_uri("/foo/bar/")), [r1, r2, r3])
+        self.assertEqual(list(matcher.match_uri("/foo/")), [r1, r3])
+        self.assertEqual(list(matcher.match_uri("/bar/")), [r2, r3])
+        self.assertEqual(list(matcher.match_uri("/baz/")), [r3])
+
+    def test_match_uri__uncombinable(self):
+        # groups, backreferences and inline flags are matched separately
+        r1 = RuleSet(uri_regex=r"^/(\w+)/\1/$")
+        r2 = RuleSet(uri_regex="(?i)^/FOO")
+        r3 = RuleSet(uri_regex="^/bar")
+        matcher = RuleMatcher([r1, r2, r3])
+        self.assertEqual(list(matcher.match_uri("/x/x/")), [r1])
+        self.assertEqual(list(matcher.match_uri("/x/y/")), [])
+        self.assertEqual(list(matcher.match_uri("/foo/")), [r2])
+        self.assertEqual(list(matcher.match_uri("/bar/")), [r3])
+
+    def test_bad_regex(self):
+        r1 = RuleSet(uri_regex="*")
+        r2 = RuleSet(uri_regex="^/foo")
+        matcher = RuleMatcher([r1, r2])
+        self.assertEqual(matcher.rules, (r2,))
+        self.assertTrue(matcher.match("/foo", None))
+        self.assertFalse(matcher.match("/bar", None))
+
+    def test_rules_ordered_by_cost(self):
+        r1 = RuleSet(user_filter_type=RuleSet.USER_FILTER_GROUP)
+        r2 = RuleSet(user_filter_type=RuleSet.USER_FILTER_AUTH)
+        r3 = RuleSet(user_filter_type=RuleSet.USER_FILTER_ALL)
+        self.assertEqual(RuleMatcher([r1, r2, r3]).rules, (r3, r2, r1))
+
+    @skipIfCustomUser
+    def test_match(self):
+        bob = User.objects.create_user("bob")
+        group = Group.objects.create(name="test")
+        r1 = RuleSet(uri_regex="^/foo", user_filter_type=RuleSet.USER_FILTER_AUTH)
+        r2 = RuleSet(
+            uri_regex="^/bar",
+            user_filter_type=RuleSet.USER_FILTER_GROUP,
+            user_group_filter="test",
+        )
+        matcher = RuleMatcher([r1, r2])
+        self.assertFalse(matcher.match("/foo", AnonymousUser()))
+        self.assertTrue(matcher.match("/foo", bob))
+        self.assertFalse(matcher.match("/bar", bob))
+        self.assertEqual(matcher.matching_rules("/foo", bob), [r1])
+        bob.groups.add(group)
+        self.assertTrue(matcher.match("/bar", bob))
+        self.assertEqual(matcher.matching_rules("/bar", bob), [r2])
+
+
+class SamplingTests(TestCase):
+    def test_sample_rate(self):
+        rule = RuleSet(sample_rate=0.25)
+        matcher = RuleMatcher([rule])
+        with mock.patch("request_profiler.matcher.random.random") as mock_random:
+            mock_random.return_value = 0.2
+            self.assertTrue(matcher.match("/", None))
+            self.assertTrue(matcher.pre_match("/"))
+            mock_random.return_value = 0.3
+            self.assertFalse(matcher.match("/", None))
+            self.assertFalse(matcher.pre_match("/"))
+
+    def test_sample_rate__zero(self):
+        matcher = RuleMatcher([RuleSet(sample_rate=0)])
+        self.assertFalse(matcher.match("/", None))
+
+    @mock.patch("request_profiler.matcher.time.monotonic")
+    def test_max_records_per_second(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        matcher = RuleMatcher([RuleSet(max_records_per_second=2)])
+        self.assertTrue(matcher.match("/", None))
+        self.assertTrue(matcher.match("/", None))
+        self.assertFalse(matcher.match("/", None))
+        mock_monotonic.return_value = 100.5
+        self.assertTrue(matcher.match("/", None))
+        self.assertFalse(matcher.pre_match("/"))
+
+    @skipIfCustomUser
+    def test_max_records_per_second__user_filter(self):
+        # tokens are only taken by requests that match completely
+        rule = RuleSet(
+            user_filter_type=RuleSet.USER_FILTER_AUTH, max_records_per_second=1
+        )
+        matcher = RuleMatcher([rule])
+        self.assertFalse(matcher.match("/", AnonymousUser()))
+        self.assertTrue(matcher.match("/", User(username="bob")))
+        self.assertFalse(matcher.match("/", User(username="bob")))
+
+    def test_deferred(self):
+        # rules for all users are skipped as they were checked by pre_match
+        matcher = RuleMatcher([RuleSet(sample_rate=0.5)])
+        with mock.patch("request_profiler.matcher.random.random") as mock_random:
+            mock_random.return_value = 0.9
+            self.assertFalse(matcher.pre_match("/"))
+            mock_random.return_value = 0.1
+            self.assertFalse(matcher.match("/", None, deferred=True))
+            self.assertTrue(matcher.match("/", None))
+
+
+class TokenBucketTests(TestCase):
+    @mock.patch("request_profiler.matcher.time.monotonic")
+    def test_take(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        bucket = TokenBucket(1)
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+        mock_monotonic.return_value = 0.5
+        self.assertFalse(bucket.take())
+        mock_monotonic.return_value = 1
+        self.assertTrue(bucket.take())
+        # tokens do not accumulate beyond the rate
+        mock_monotonic.return_value = 100
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+# treat the cache as shared, so the rules are reloaded on version changes
+@mock.patch("request_profiler.matcher._max_age", lambda: 60)
+class GetMatcherTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_get_matcher(self):
+        self.assertEqual(get_matcher().rules, ())
+        rule = RuleSet.objects.create(uri_regex="^/foo")
+        matcher = get_matcher()
+        self.assertEqual(matcher.rules, (rule,))
+        # unchanged rules return the same matcher
+        self.assertIs(get_matcher(), matcher)
+        rule.uri_regex = "^/bar"
+        rule.save()
+        self.assertIsNot(get_matcher(), matcher)
+        self.assertTrue(get_matcher().match("/bar", None))
+
+    @mock.patch("request_profiler.matcher._checked_at", 0.0)
+    @mock.patch("request_profiler.matcher._matcher", RuleMatcher([]))
+    @mock.patch("request_profiler.matcher.time.monotonic")
+    def test_get_matcher__cache_timeout(self, mock_monotonic):
+        settings.RULESET_CACHE_TIMEOUT = 10
+        try:
+            mock_monotonic.return_value = 1000
+            matcher = get_matcher()
+            rule = RuleSet.objects.create()
+            # the version is not checked again until the timeout expires
+            mock_monotonic.return_value = 1009
+            self.assertIs(get_matcher(), matcher)
+            mock_monotonic.return_value = 1010
+            self.assertEqual(get_matcher().rules, (rule,))
+            # if the version is unchanged the rules are not reloaded
+            matcher = get_matcher()
+            mock_monotonic.return_value = 1020
+            with self.assertNumQueries(0):
+                self.assertIs(get_matcher(), matcher)
+        finally:
+            settings.RULESET_CACHE_TIMEOUT = 0
+
+    @mock.patch("request_profiler.matcher._checked_at", 0.0)
+    @mock.patch("request_profiler.matcher._matcher", RuleMatcher([]))
+    @mock.patch("request_profiler.matcher.time.monotonic")
+    def test_get_matcher__max_age(self, mock_monotonic):
+        mock_monotonic.return_value = 1000
+        matcher = get_matcher()
+        # e.g. changed by another process, with a per-process cache
+        rule = RuleSet.objects.create()
+        cache.set(settings.RULESET_CACHE_KEY, matcher.version)
+        mock_monotonic.return_value = 1059
+        self.assertIs(get_matcher(), matcher)
+        mock_monotonic.return_value = 1060
+        self.assertEqual(get_matcher().rules, (rule,))
+
+
+class MaxAgeTests(TestCase):
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_max_age__per_process_cache(self):
+        self.assertEqual(_max_age(), settings.RULESET_CACHE_TIMEOUT)
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+                "LOCATION": "cache",
+            }
+        }
+    )
+    def test_max_age__shared_cache(self):
+        self.assertEqual(_max_age(), settings.RULESET_MAX_AGE)
@@ -1,12 +1,17 @@
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
 from django.apps import apps
 from django.contrib.auth.models import AnonymousUser, Group, User
 from django.db import connection
 from django.db.migrations.autodetector import MigrationAutodetector
 from django.db.migrations.executor import MigrationExecutor
 from django.db.migrations.state import ProjectState
-from django.test import RequestFactory, TestCase
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase
 
 from request_profiler import settings
+from request_profiler.matcher import RuleMatcher
 from request_profiler.middleware import ProfilingMiddleware, request_profile_complete
 from request_profiler.models import ProfilingRecord, RuleSet
 
@@ -35,6 +40,7 @@ class MockResponse:
     def __init__(self, status_code):
         self.status_code = status_code
         self.content = "Hello, World!"
+        self.streaming = False
         self.values = {}
 
     def __getitem__(self, key):
@@ -167,6 +173,191 @@ class ProfilingMiddlewareDefaultUserTests(TestCase):
         settings.GLOBAL_EXCLUDE_FUNC = lambda x: True
 
 
+@skipIfCustomUser
+class MatchOnRequestTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = ProfilingMiddleware(get_response=lambda r: None)
+        self.bob = User.objects.create_user("bob")
+        request_profile_complete.receivers = []
+        settings.MATCH_ON_REQUEST = True
+
+    def tearDown(self):
+        settings.MATCH_ON_REQUEST = False
+
+    def test_no_rules(self):
+        request = self.factory.get("/")
+        request.session = mock.Mock(session_key=None)
+        self.assertFalse(self.middleware.match_request(request))
+        self.middleware.process_request(request)
+        self.assertFalse(hasattr(request, "profiler"))
+        request.session.save.assert_not_called()
+        response = self.middleware.process_response(request, MockResponse(200))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ProfilingRecord.objects.exists())
+
+    def test_path_rule(self):
+        RuleSet.objects.create(uri_regex="^/foo")
+        request = self.factory.get("/foo")
+        self.assertTrue(self.middleware.match_request(request))
+        self.middleware.process_request(request)
+        self.assertTrue(request.profiler.is_matched)
+        self.middleware.process_response(request, MockResponse(200))
+        self.assertIsNotNone(request.profiler.id)
+        # a different path is not profiled
+        request = self.factory.get("/bar")
+        self.middleware.process_request(request)
+        self.assertFalse(hasattr(request, "profiler"))
+
+    def test_user_rule__deferred(self):
+        RuleSet.objects.create(user_filter_type=RuleSet.USER_FILTER_AUTH)
+        request = self.factory.get("/")
+        self.assertIsNone(self.middleware.match_request(request))
+        self.middleware.process_request(request)
+        self.assertIsNone(request.profiler.is_matched)
+        # the user is added by later middleware
+        request.user = self.bob
+        self.middleware.process_response(request, MockResponse(200))
+        self.assertIsNotNone(request.profiler.id)
+
+    def test_user_rule__user_known(self):
+        RuleSet.objects.create(user_filter_type=RuleSet.USER_FILTER_AUTH)
+        request = self.factory.get("/")
+        request.user = AnonymousUser()
+        self.assertFalse(self.middleware.match_request(request))
+        request.user = self.bob
+        self.assertTrue(self.middleware.match_request(request))
+
+    def test_global_exclude_function(self):
+        RuleSet.objects.create()
+        request = self.factory.get("/")
+        settings.GLOBAL_EXCLUDE_FUNC = lambda x: False
+        try:
+            self.assertFalse(self.middleware.match_request(request))
+        finally:
+            settings.GLOBAL_EXCLUDE_FUNC = lambda x: True
+
+    def test_global_exclude_function__no_rules(self):
+        # the exclude function (which may load the user) is not called if no
+        # rule can match the path
+        RuleSet.objects.create(uri_regex="^/foo")
+        request = self.factory.get("/")
+        exclude = mock.Mock(return_value=True)
+        settings.GLOBAL_EXCLUDE_FUNC = exclude
+        try:
+            self.assertFalse(self.middleware.match_request(request))
+            exclude.assert_not_called()
+            self.assertTrue(self.middleware.match_request(self.factory.get("/foo")))
+            exclude.assert_called_once()
+        finally:
+            settings.GLOBAL_EXCLUDE_FUNC = lambda x: True
+
+    def test_custom_functions__user_rule_matched_on_request(self):
+        # a user rule that doesn't match on the request is not matched (and
+        # so sampled / rate limited) again on the response
+        RuleSet.objects.create(user_filter_type=RuleSet.USER_FILTER_AUTH)
+        request = self.factory.get("/")
+        request.user = AnonymousUser()
+        func = mock.Mock(return_value=True)
+        settings.CUSTOM_FUNCTIONS = [func]
+        try:
+            self.assertIsNone(self.middleware.match_request(request))
+            self.middleware.process_request(request)
+            self.assertIs(request.profiler.is_matched, False)
+            with mock.patch.object(RuleMatcher, "match") as match:
+                self.middleware.process_response(request, MockResponse(200))
+            match.assert_not_called()
+            func.assert_called_with(request)
+            self.assertIsNotNone(request.profiler.id)
+        finally:
+            settings.CUSTOM_FUNCTIONS = []
+
+    def test_custom_functions__deferred(self):
+        request = self.factory.get("/")
+        settings.CUSTOM_FUNCTIONS = [lambda r: True]
+        try:
+            self.assertIsNone(self.middleware.match_request(request))
+            self.middleware.process_request(request)
+            self.middleware.process_response(request, MockResponse(200))
+            self.assertIsNotNone(request.profiler.id)
+        finally:
+            settings.CUSTOM_FUNCTIONS = []
+
+
+@skipIfCustomUser
+class AsyncProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        request_profile_complete.receivers = []
+
+        async def get_response(request):
+            return HttpResponse("Hello, World!")
+
+        self.middleware = ProfilingMiddleware(get_response)
+
+    def test_async_mode(self):
+        self.assertTrue(iscoroutinefunction(self.middleware))
+        self.assertTrue(iscoroutinefunction(self.middleware.process_view))
+        # sync mode is unchanged
+        middleware = ProfilingMiddleware(get_response=lambda r: None)
+        self.assertFalse(iscoroutinefunction(middleware.process_view))
+
+    async def test_call(self):
+        await RuleSet.objects.acreate()
+        request = self.factory.get("/")
+        response = await self.middleware(request)
+        self.assertTrue(response.has_header("X-Profiler-Duration"))
+        self.assertEqual(await ProfilingRecord.objects.acount(), 1)
+
+    async def test_call__no_match(self):
+        await RuleSet.objects.acreate(uri_regex="^/foo")
+        request = self.factory.get("/")
+        response = await self.middleware(request)
+        self.assertFalse(response.has_header("X-Profiler-Duration"))
+        self.assertFalse(hasattr(request, "profiler"))
+        self.assertEqual(await ProfilingRecord.objects.acount(), 0)
+
+    async def test_call__group_rule(self):
+        bob = await User.objects.acreate(username="bob")
+        group = await Group.objects.acreate(name="test")
+        await RuleSet.objects.acreate(
+            user_filter_type=RuleSet.USER_FILTER_GROUP, user_group_filter="TEST"
+        )
+        request = self.factory.get("/")
+        request.user = bob
+        await self.middleware(request)
+        self.assertEqual(await ProfilingRecord.objects.acount(), 0)
+        await bob.groups.aadd(group)
+        await self.middleware(request)
+        self.assertEqual(await ProfilingRecord.objects.acount(), 1)
+
+    async def test_call__match_on_request(self):
+        settings.MATCH_ON_REQUEST = True
+        try:
+            request = self.factory.get("/")
+            await self.middleware(request)
+            self.assertFalse(hasattr(request, "profiler"))
+            await RuleSet.objects.acreate()
+            await self.middleware(request)
+            self.assertTrue(request.profiler.is_matched)
+        finally:
+            settings.MATCH_ON_REQUEST = False
+        self.assertEqual(await ProfilingRecord.objects.acount(), 1)
+
+    async def test_call__match_on_request__no_rules(self):
+        # the user is not loaded for a request that no rule can match
+        await RuleSet.objects.acreate(uri_regex="^/foo")
+        settings.MATCH_ON_REQUEST = True
+        try:
+            with mock.patch("request_profiler.middleware._aload_user") as load_user:
+                await self.middleware(self.factory.get("/"))
+                load_user.assert_not_called()
+                await self.middleware(self.factory.get("/foo"))
+                load_user.assert_called()
+        finally:
+            settings.MATCH_ON_REQUEST = False
+
+
 @skipIfDefaultUser
 class ProfilingMiddlewareCustomUserTests(TestCase):
     def setUp(self):
@@ -1,17 +1,33 @@
 import datetime
+import io
+from unittest import mock
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import AnonymousUser, Group, User
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import connection
-from django.http import HttpResponse, StreamingHttpResponse
-from django.test import RequestFactory, TestCase
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
 
 from request_profiler import settings
-from request_profiler.models import BadProfilerError, ProfilingRecord, RuleSet
+from request_profiler.models import (
+    BadProfilerError,
+    ProfilingRecord,
+    RuleSet,
+    aget_group_names,
+    bump_ruleset_version,
+    get_group_names,
+    get_ruleset_version,
+)
+from request_profiler.queries import execute_wrapper
 
 from .models import CustomUser
-from .utils import skipIfCustomUser, skipIfDefaultUser
+from .utils import LOCMEM_CACHES, skipIfCustomUser, skipIfDefaultUser
+
+
+def dummy_view_func(request, **kwargs):
+    pass
 
 
 class MockSession:
@@ -23,6 +39,7 @@ class MockResponse:
     def __init__(self, status_code):
         self.status_code = status_code
         self.content = "Hello, World!"
+        self.streaming = False
         self.type = HttpResponse
         self.values = {}
 
@@ -48,21 +65,31 @@ class RuleSetQuerySetTests(TestCase):
         r2.save()
         self.assertEqual(RuleSet.objects.live_rules().count(), 1)
 
-    def test_live_rules_with_caching(self):
-        settings.RULESET_CACHE_TIMEOUT = 10
-        self.assertIsNone(cache.get(settings.RULESET_CACHE_KEY))
-        # save a couple of rules
-        RuleSet.objects.create(uri_regex="", enabled=True)
-        RuleSet.objects.create(uri_regex="", enabled=True)
-        self.assertEqual(RuleSet.objects.live_rules().count(), 2)
-        self.assertIsNotNone(cache.get(settings.RULESET_CACHE_KEY))
-        # cache is full, delete the underlying records and retrieve
-        RuleSet.objects.all().delete()
-        # we're going to the cache, so even so DB is empty, we get two back
-        self.assertEqual(RuleSet.objects.live_rules().count(), 2)
-        # clear out cache and confirm we're now going direct to DB
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RuleSetVersionTests(TestCase):
+    """Test the version stamp used to invalidate cached rules."""
+
+    def setUp(self):
         cache.clear()
-        self.assertEqual(RuleSet.objects.live_rules().count(), 0)
+
+    def test_get_ruleset_version(self):
+        self.assertIsNone(cache.get(settings.RULESET_CACHE_KEY))
+        version = get_ruleset_version()
+        self.assertEqual(cache.get(settings.RULESET_CACHE_KEY), version)
+        self.assertEqual(get_ruleset_version(), version)
+        self.assertNotEqual(bump_ruleset_version(), version)
+        self.assertNotEqual(get_ruleset_version(), version)
+
+    def test_ruleset_changes_bump_version(self):
+        version = get_ruleset_version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            rule = RuleSet.objects.create(uri_regex="", enabled=True)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(get_ruleset_version(), version)
+        version = get_ruleset_version()
+        rule.delete()
+        self.assertNotEqual(get_ruleset_version(), version)
 
 
 class RuleSetModelTests(TestCase):
@@ -78,6 +105,8 @@ class RuleSetModelTests(TestCase):
             ("uri_regex", ""),
             ("user_filter_type", 0),
             ("user_group_filter", ""),
+            ("sample_rate", 1.0),
+            ("max_records_per_second", None),
         ]
         for p in props:
             self.assertEqual(getattr(ruleset, p[0]), p[1])
@@ -100,6 +129,12 @@ class RuleSetModelTests(TestCase):
         ruleset.user_group_filter = ""
         self.assertRaises(ValidationError, ruleset.clean)
 
+    def test_sample_rate_validation(self):
+        for rate in (-0.1, 1.1):
+            with self.assertRaises(ValidationError):
+                RuleSet(sample_rate=rate).full_clean()
+        RuleSet(sample_rate=0.5).full_clean()
+
     def test_clean_bad_regex(self):
         # try with a bad regex
         ruleset = RuleSet()
@@ -209,6 +244,56 @@ class RuleSetModelTests(TestCase):
         self.assertFalse(ruleset.match_user(AnonymousUser()))
 
 
+@skipIfCustomUser
+class GroupNamesTests(TestCase):
+    def setUp(self):
+        self.bob = User.objects.create_user("bob")
+        self.group = Group.objects.create(name="Test")
+
+    def test_get_group_names(self):
+        self.assertEqual(get_group_names(AnonymousUser()), frozenset())
+        self.bob.groups.add(self.group)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_group_names(self.bob), {"test"})
+            self.assertEqual(get_group_names(self.bob), {"test"})
+        # the memo is cleared when the user's groups change
+        self.bob.groups.remove(self.group)
+        self.assertEqual(get_group_names(self.bob), frozenset())
+
+    async def test_aget_group_names(self):
+        await self.bob.groups.aadd(self.group)
+        self.assertEqual(await aget_group_names(self.bob), {"test"})
+
+    def test_match_user__group_rules(self):
+        # any number of group rules need a single query
+        rules = [
+            RuleSet(user_filter_type=RuleSet.USER_FILTER_GROUP, user_group_filter=g)
+            for g in ("foo", "bar", "baz", "TEST")
+        ]
+        self.bob.groups.add(self.group)
+        with self.assertNumQueries(1):
+            self.assertEqual([r.match_user(self.bob) for r in rules], [0, 0, 0, 1])
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_get_group_names__cache(self):
+        cache.clear()
+        settings.GROUP_CACHE_TIMEOUT = 10
+        try:
+            get_group_names(self.bob)
+            user = User.objects.get(pk=self.bob.pk)
+            with self.assertNumQueries(0):
+                get_group_names(user)
+            # the cache is cleared when the user's groups change
+            self.group.user_set.add(self.bob)
+            user = User.objects.get(pk=self.bob.pk)
+            self.assertEqual(get_group_names(user), {"test"})
+            self.group.user_set.clear()
+            user = User.objects.get(pk=self.bob.pk)
+            self.assertEqual(get_group_names(user), frozenset())
+        finally:
+            settings.GROUP_CACHE_TIMEOUT = 0
+
+
 class ProfilingRecordModelTests(TestCase):
     """Basic model properrty and method tests."""
 
@@ -253,21 +338,36 @@ class ProfilingRecordModelTests(TestCase):
         self.assertIsNone(profile.duration)
         self.assertTrue(profile.is_running)
 
-    def test_start__force_debug__FALSE(self):
-        """Test the FORCE_DEBUG_CURSOR setting."""
-        settings.FORCE_DEBUG_CURSOR = False
+    def test_stop__queries(self):
         profiler = ProfilingRecord().start()
         User.objects.exists()
+        User.objects.exists()
         profiler.stop()
-        self.assertEqual(profiler.query_count, 0)
+        self.assertEqual(profiler.query_count, 2)
+        self.assertGreater(profiler.query_duration, 0)
+        self.assertGreaterEqual(
+            profiler.query_duration, profiler.slowest_query_duration
+        )
+        # queries are not counted once the profiler has stopped
+        User.objects.exists()
+        self.assertEqual(profiler._queries.count, 2)
+        self.assertFalse(connection.force_debug_cursor)
 
-    def test_start__force_debug__TRUE(self):
-        settings.FORCE_DEBUG_CURSOR = True
+    async def test_stop__queries__sync_to_async(self):
+        # sync code run in a thread shares the request's context
         profiler = ProfilingRecord().start()
-        User.objects.exists()
+        await sync_to_async(User.objects.exists)()
+        profiler.stop()
+        self.assertEqual(profiler.query_count, 1)
+
+    def test_stop__queries__execute_wrapper(self):
+        # the wrapper is outermost, so other wrappers can be pushed and popped
+        profiler = ProfilingRecord().start()
+        with connection.execute_wrapper(lambda execute, *args: execute(*args)):
+            User.objects.exists()
+        self.assertEqual(connection.execute_wrappers, [execute_wrapper])
         profiler.stop()
         self.assertEqual(profiler.query_count, 1)
-        self.assertFalse(connection.force_debug_cursor)
 
     def test_stop(self):
         profile = ProfilingRecord()
@@ -279,6 +379,34 @@ class ProfilingRecordModelTests(TestCase):
         self.assertTrue(profile.duration > 0)
         self.assertFalse(profile.is_running)
 
+    @mock.patch("request_profiler.models.time.perf_counter_ns")
+    def test_stop__phases(self, mock_counter):
+        mock_counter.return_value = 1_000_000_000
+        profile = ProfilingRecord().start()
+        mock_counter.return_value = 1_100_000_000
+        profile.process_view(None, dummy_view_func)
+        mock_counter.return_value = 1_500_000_000
+        self.assertEqual(profile.elapsed, 0.5)
+        profile.stop()
+        self.assertEqual(profile.duration, 0.5)
+        self.assertEqual(profile.end_ts - profile.start_ts, datetime.timedelta(0, 0.5))
+        self.assertEqual(profile.time_to_view, 0.1)
+        self.assertEqual(profile.view_duration, 0.4)
+        self.assertIsNone(profile.response_duration)
+        # now with a template response
+        mock_counter.return_value = 1_000_000_000
+        profile.start()
+        self.assertIsNone(profile.time_to_view)
+        mock_counter.return_value = 1_100_000_000
+        profile.process_view(None, dummy_view_func)
+        mock_counter.return_value = 1_300_000_000
+        profile.process_template_response(None)
+        mock_counter.return_value = 1_500_000_000
+        profile.stop()
+        self.assertEqual(profile.time_to_view, 0.1)
+        self.assertEqual(profile.view_duration, 0.2)
+        self.assertEqual(profile.response_duration, 0.2)
+
     def test_cancel(self):
         profile = ProfilingRecord().cancel()
         self.assertIsNone(profile.start_ts)
@@ -409,4 +537,92 @@ class ProfilingRecordModelTests(TestCase):
         profiler.process_response(response)
         self.assertEqual(profiler.response, response)
         self.assertEqual(profiler.response_status_code, 200)
+        # the length is known once the response has been streamed
         self.assertEqual(profiler.response_content_length, -1)
+        self.assertEqual(b"".join(response), b"Hello, World!")
+        response.close()
+        self.assertEqual(profiler.response_content_length, 13)
+
+    def test__content_length__header(self):
+        response = HttpResponse("Hello, World!")
+        response["Content-Length"] = 5
+        self.assertEqual(ProfilingRecord()._content_length(response), 5)
+        del response["Content-Length"]
+        response.write("!")
+        self.assertEqual(ProfilingRecord()._content_length(response), 14)
+
+    def test__stream_response_content_length__file_response(self):
+        # the file is left for the server to send using wsgi.file_wrapper
+        response = FileResponse(io.BytesIO(b"Hello, World!"))
+        file_to_stream = response.file_to_stream
+        profiler = ProfilingRecord().start()
+        profiler.process_response(response)
+        self.assertIs(response.file_to_stream, file_to_stream)
+        profiler.capture()
+        response.close()
+        self.assertEqual(profiler.response_content_length, 13)
+        self.assertIsNone(profiler.time_to_first_byte)
+        self.assertEqual(ProfilingRecord.objects.count(), 1)
+
+    def test__stream_response_content_length__not_iterated(self):
+        # e.g. the client disconnects before the content is sent
+        response = StreamingHttpResponse("Hello, World!")
+        response["Content-Length"] = 13
+        profiler = ProfilingRecord().start()
+        profiler.process_response(response)
+        response.close()
+        self.assertEqual(profiler.response_content_length, 13)
+
+    def test_capture__streaming(self):
+        response = StreamingHttpResponse(["Hello, ", "World!"])
+        profiler = ProfilingRecord().start()
+        profiler.process_request(RequestFactory().get("/"))
+        profiler.process_response(response)
+        profiler.capture()
+        self.assertFalse(ProfilingRecord.objects.exists())
+        list(response)
+        response.close()
+        self.assertEqual(ProfilingRecord.objects.get().response_content_length, 13)
+        # closing again does not write another record
+        response.close()
+        self.assertEqual(ProfilingRecord.objects.count(), 1)
+
+    def test_capture__streaming__byte_timings(self):
+        response = StreamingHttpResponse(["Hello, ", "World!"])
+        profiler = ProfilingRecord().start()
+        profiler.process_response(response)
+        profiler.capture()
+        self.assertTrue(response.has_header("X-Profiler-Duration"))
+        list(response)
+        response.close()
+        self.assertLess(profiler.duration, profiler.time_to_first_byte)
+        self.assertLess(profiler.time_to_first_byte, profiler.time_to_last_byte)
+
+    def test_capture__streaming__deferred(self):
+        settings.DEFER_STREAMING_CAPTURE = True
+        try:
+            response = StreamingHttpResponse(["Hello, ", "World!"])
+            profiler = ProfilingRecord().start()
+            profiler.process_request(RequestFactory().get("/"))
+            profiler.process_response(response)
+            profiler.capture()
+            self.assertTrue(profiler.is_running)
+            self.assertFalse(response.has_header("X-Profiler-Duration"))
+            list(response)
+            response.close()
+        finally:
+            settings.DEFER_STREAMING_CAPTURE = False
+        record = ProfilingRecord.objects.get()
+        self.assertFalse(profiler.is_running)
+        self.assertLess(record.time_to_last_byte, record.duration)
+
+    def test_capture__streaming__disconnected(self):
+        # the client went away before the content was sent
+        response = StreamingHttpResponse(["Hello, ", "World!"])
+        profiler = ProfilingRecord().start()
+        profiler.process_response(response)
+        profiler.capture()
+        next(iter(response))
+        response.close()
+        self.assertIsNotNone(profiler.time_to_first_byte)
+        self.assertIsNone(profiler.time_to_last_byte)
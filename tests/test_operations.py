@@ -0,0 +1,65 @@
+from unittest import mock
+
+from django.db import connection, models
+from django.test import TestCase
+
+from request_profiler.operations import AddFieldIndexConcurrently, AddIndexConcurrently
+
+
+class OperationTests(TestCase):
+    def setUp(self):
+        self.schema_editor = mock.Mock()
+        self.schema_editor.connection.vendor = "postgresql"
+        self.schema_editor.connection.alias = "default"
+        self.state = mock.Mock()
+        self.model = self.state.apps.get_model.return_value
+
+    def test_add_index_concurrently(self):
+        index = models.Index(fields=["start_ts"], name="test_idx")
+        operation = AddIndexConcurrently(model_name="profilingrecord", index=index)
+        with mock.patch.object(operation, "allow_migrate_model", return_value=True):
+            operation.database_forwards(
+                "request_profiler", self.schema_editor, self.state, self.state
+            )
+            self.schema_editor.add_index.assert_called_once_with(
+                self.model, index, concurrently=True
+            )
+            operation.database_backwards(
+                "request_profiler", self.schema_editor, self.state, self.state
+            )
+            self.schema_editor.remove_index.assert_called_once_with(
+                self.model, index, concurrently=True
+            )
+
+    def test_add_field_index_concurrently(self):
+        field = models.DateTimeField(db_index=True)
+        operation = AddFieldIndexConcurrently(
+            model_name="profilingrecord", name="start_ts", field=field
+        )
+        with mock.patch.object(operation, "allow_migrate_model", return_value=True):
+            operation.database_forwards(
+                "request_profiler", self.schema_editor, self.state, self.state
+            )
+        self.schema_editor._create_index_sql.assert_called_once_with(
+            self.model, fields=[self.model._meta.get_field()], concurrently=True
+        )
+        self.schema_editor.execute.assert_called_once_with(
+            self.schema_editor._create_index_sql.return_value
+        )
+
+    def test_other_databases(self):
+        # behave as the operations they extend
+        self.schema_editor.connection.vendor = connection.vendor
+        operation = AddFieldIndexConcurrently(
+            model_name="profilingrecord",
+            name="start_ts",
+            field=models.DateTimeField(db_index=True),
+        )
+        with mock.patch(
+            "django.db.migrations.AlterField.database_forwards"
+        ) as database_forwards:
+            operation.database_forwards(
+                "request_profiler", self.schema_editor, self.state, self.state
+            )
+        database_forwards.assert_called_once()
+        self.schema_editor.execute.assert_not_called()
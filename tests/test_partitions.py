@@ -0,0 +1,180 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from request_profiler import settings
+from request_profiler.models import ProfilingRecord, ProfilingRollup
+from request_profiler.partitions import (
+    PostgresPartitions,
+    SQLitePartitions,
+    get_partitions,
+    period_start,
+)
+from request_profiler.writers import PartitionedWriter
+
+from .utils import create_record, stopped_record
+
+UTC = datetime.timezone.utc
+# a Wednesday
+TS = datetime.datetime(2024, 1, 3, 4, 5, 6, tzinfo=UTC)
+
+
+class PeriodTests(TestCase):
+    def test_period_start(self):
+        self.assertEqual(
+            period_start(TS, "day"), datetime.datetime(2024, 1, 3, tzinfo=UTC)
+        )
+        self.assertEqual(
+            period_start(TS, "week"), datetime.datetime(2024, 1, 1, tzinfo=UTC)
+        )
+        self.assertRaises(ValueError, period_start, TS, "month")
+
+    def test_get_partitions(self):
+        self.assertRaises(ValueError, get_partitions)
+        self.assertIsInstance(get_partitions("day"), SQLitePartitions)
+
+
+class SQLitePartitionsTests(TestCase):
+    def setUp(self):
+        self.partitions = SQLitePartitions("day", connection)
+
+    def record(self, start_ts):
+        record = stopped_record()
+        record.start_ts = start_ts
+        self.partitions.ensure_partition(start_ts)
+        self.partitions.insert(record)
+        return record
+
+    def test_insert(self):
+        record = self.record(TS)
+        self.assertIsNotNone(record.pk)
+        (partition,) = self.partitions.list_partitions()
+        self.assertEqual(partition.name, "request_profiler_profilingrecord_20240103")
+        self.assertEqual(partition.start, datetime.datetime(2024, 1, 3, tzinfo=UTC))
+        # not in the records table
+        self.assertFalse(ProfilingRecord.objects.exists())
+
+    def test_records_between(self):
+        self.record(TS)
+        self.record(TS - datetime.timedelta(days=1))
+        self.record(TS - datetime.timedelta(days=2))
+        create_record(1, start_ts=TS)
+        records = list(
+            self.partitions.records_between(TS - datetime.timedelta(days=1), TS)
+        )
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].start_ts, TS - datetime.timedelta(days=1))
+        self.assertEqual(records[0].http_method, "GET")
+        records = self.partitions.records_between(TS, TS + datetime.timedelta(days=1))
+        self.assertEqual(len(list(records)), 2)
+
+    def test_unique_ids(self):
+        # ids are unique across the records table and its partitions
+        record = create_record(1, start_ts=TS)
+        ids = [record.pk]
+        ids += [self.record(TS - datetime.timedelta(days=d)).pk for d in (0, 1, 0)]
+        ids.append(create_record(1, start_ts=TS).pk)
+        self.assertEqual(len(set(ids)), 5)
+        records = self.partitions.records_between(
+            TS - datetime.timedelta(days=1), TS + datetime.timedelta(days=1)
+        )
+        self.assertEqual(sorted(r.pk for r in records), sorted(ids))
+
+    def test_drop_partitions(self):
+        self.record(TS)
+        self.record(TS - datetime.timedelta(days=1))
+        dropped = self.partitions.drop_partitions(TS)
+        self.assertEqual([p.start.day for p in dropped], [2])
+        self.assertEqual(len(self.partitions.list_partitions()), 1)
+        # recreated when needed
+        self.record(TS - datetime.timedelta(days=1))
+        self.assertEqual(len(self.partitions.list_partitions()), 2)
+
+    def test_ensure_partitions(self):
+        partitions = self.partitions.ensure_partitions(2)
+        self.assertEqual(len(partitions), 3)
+        self.assertEqual(self.partitions.list_partitions(), partitions)
+
+
+class PostgresPartitionsTests(TestCase):
+    def test_setup_sql(self):
+        statements = PostgresPartitions("week", connection).setup_sql()
+        self.assertIn(
+            'ALTER TABLE "request_profiler_profilingrecord" '
+            'RENAME TO "request_profiler_profilingrecord_legacy"',
+            statements,
+        )
+        self.assertIn("PARTITION BY RANGE (start_ts)", statements[3])
+        self.assertIn("FOR VALUES FROM (MINVALUE)", statements[-2])
+        self.assertEqual(
+            statements[-1],
+            'CREATE TABLE "request_profiler_profilingrecord_default" '
+            'PARTITION OF "request_profiler_profilingrecord" DEFAULT',
+        )
+
+
+class PartitionedStorageTests(TestCase):
+    def setUp(self):
+        settings.PARTITION_PERIOD = "day"
+
+    def tearDown(self):
+        settings.PARTITION_PERIOD = None
+
+    def test_writer(self):
+        record = stopped_record()
+        PartitionedWriter().write(record)
+        self.assertIsNotNone(record.pk)
+        self.assertEqual(len(get_partitions().list_partitions()), 1)
+
+    def test_writer__rollups(self):
+        settings.ROLLUP_PERIODS = ("hour",)
+        try:
+            PartitionedWriter().write(stopped_record())
+        finally:
+            settings.ROLLUP_PERIODS = ()
+        self.assertEqual(ProfilingRollup.objects.get().count, 1)
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            "request_profiler_partitions", "create", "--ahead", "1", stdout=out
+        )
+        self.assertEqual(out.getvalue().count("created"), 2)
+        out = StringIO()
+        call_command("request_profiler_partitions", "list", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+        self.assertRaises(
+            CommandError, call_command, "request_profiler_partitions", "setup"
+        )
+
+    def test_truncate(self):
+        writer = PartitionedWriter()
+        for days in (0, 5, 6):
+            record = stopped_record()
+            record.start_ts = timezone.now() - datetime.timedelta(days=days)
+            writer.write(record)
+        out = StringIO()
+        call_command(
+            "truncate_request_profiler_logs",
+            "--days",
+            "2",
+            stdout=out,
+            stderr=StringIO(),
+        )
+        self.assertEqual(out.getvalue().count("to drop"), 2)
+        self.assertEqual(len(writer.partitions.list_partitions()), 3)
+        call_command(
+            "truncate_request_profiler_logs",
+            "--days",
+            "2",
+            "--commit",
+            stdout=out,
+            stderr=StringIO(),
+        )
+        self.assertIn("dropped partition", out.getvalue())
+        self.assertEqual(len(writer.partitions.list_partitions()), 1)
@@ -0,0 +1,178 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from request_profiler import ringbuffer
+from request_profiler.models import ProfilingRecord
+from request_profiler.ringbuffer import (
+    SLOT_HEADER,
+    Drainer,
+    RingBuffer,
+    pack_record,
+    unpack_record,
+)
+from request_profiler.writers import RingBufferWriter
+
+from .utils import fail_saving, stopped_record
+
+
+class PackRecordTests(TestCase):
+    def test_pack_record(self):
+        record = stopped_record()
+        record.query_string = "q=" + "x" * 1000
+        record.http_user_agent = "Mozilla"
+        self.assertGreater(len(pack_record(record, 2048)), 1000)
+        payload = pack_record(record, 400)
+        self.assertLessEqual(len(payload), 400)
+        unpacked = unpack_record(payload)
+        self.assertEqual(unpacked.duration, record.duration)
+        self.assertEqual(unpacked.http_user_agent, "Mozilla")
+        self.assertTrue(unpacked.query_string.startswith("q=x"))
+        # too small, even once truncated
+        self.assertIsNone(pack_record(record, 100))
+
+    def test_unpack_record__invalid(self):
+        self.assertRaises(ValueError, unpack_record, b"[]")
+        self.assertRaises(ValueError, unpack_record, b"{}")
+        self.assertRaises(ValueError, unpack_record, b"{")
+
+
+class RingBufferTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "ring")
+        self.buffer = RingBuffer(self.path, capacity=4, slot_size=64)
+
+    def tearDown(self):
+        self.buffer.close()
+        self.tmpdir.cleanup()
+
+    def test_append_read(self):
+        self.assertEqual(self.buffer.read(10), [])
+        for i in range(3):
+            self.buffer.append(b"%i" % i)
+        self.assertEqual(self.buffer.pending, 3)
+        self.assertEqual(self.buffer.read(2), [b"0", b"1"])
+        self.assertEqual(self.buffer.read(2), [b"2"])
+        self.assertEqual(self.buffer.pending, 0)
+        self.assertEqual(self.buffer.dropped, 0)
+        self.assertRaises(ValueError, self.buffer.append, b"x" * 64)
+
+    def test_overwrite(self):
+        for i in range(6):
+            self.buffer.append(b"%i" % i)
+        self.assertEqual(self.buffer.pending, 4)
+        self.assertEqual(self.buffer.dropped, 2)
+        self.assertEqual(self.buffer.read(10), [b"2", b"3", b"4", b"5"])
+        self.assertEqual(self.buffer.dropped, 2)
+
+    def test_shared(self):
+        # another mapping (e.g. another process) sees the same records
+        other = RingBuffer(self.path, capacity=4, slot_size=64)
+        try:
+            other.append(b"0")
+            self.assertEqual(self.buffer.read(10), [b"0"])
+            self.assertEqual(other.pending, 0)
+        finally:
+            other.close()
+
+    def test_fork(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.buffer.append(b"child")
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(self.buffer.read(10), [b"child"])
+
+    def test_layout_mismatch(self):
+        self.assertRaises(ValueError, RingBuffer, self.path, capacity=8, slot_size=64)
+        with open(os.path.join(self.tmpdir.name, "other"), "wb") as f:
+            f.write(b"x" * 1024)
+        self.assertRaises(ValueError, RingBuffer, f.name, capacity=4, slot_size=64)
+
+    def test_stalled_slot(self):
+        self.buffer.append(b"0")
+        self.buffer.append(b"1")
+        # as if the writer died whilst writing it
+        SLOT_HEADER.pack_into(self.buffer._mmap, self.buffer._offset(2), 0, 0)
+        self.buffer.append(b"2")
+        self.assertEqual(self.buffer.read(10), [b"0"])
+        with mock.patch.object(ringbuffer, "STALL_TIMEOUT", -1):
+            self.assertEqual(self.buffer.read(10), [b"2"])
+        self.assertEqual(self.buffer.dropped, 1)
+
+    def test_torn_read(self):
+        self.buffer.append(b"0")
+        unpack_from = SLOT_HEADER.unpack_from
+        calls = []
+
+        def overwritten(buffer, offset):
+            # the slot is overwritten whilst it is being copied
+            calls.append(offset)
+            seq, length = unpack_from(buffer, offset)
+            return (seq + 4 if len(calls) > 1 else seq), length
+
+        with mock.patch.object(ringbuffer, "SLOT_HEADER") as slot_header:
+            slot_header.size = SLOT_HEADER.size
+            slot_header.unpack_from.side_effect = overwritten
+            self.assertEqual(self.buffer.read(10), [])
+
+
+class DrainerTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "ring")
+        self.writer = RingBufferWriter(self.path)
+
+    def tearDown(self):
+        self.writer.close()
+        self.tmpdir.cleanup()
+
+    def test_drain(self):
+        record = stopped_record()
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.writer.write(record)
+        self.writer.buffer.append(b"not json")
+        drainer = Drainer(RingBuffer(self.path), batch_size=2)
+        try:
+            self.assertEqual(drainer.drain(), 4)
+        finally:
+            drainer.buffer.close()
+        self.assertEqual(drainer.flushed, 3)
+        self.assertEqual(drainer.invalid, 1)
+        self.assertEqual(ProfilingRecord.objects.count(), 3)
+        self.assertEqual(ProfilingRecord.objects.first().duration, record.duration)
+
+    def test_drain__invalid_record(self):
+        failing = stopped_record()
+        failing.http_method = "FAIL"
+        for record in (stopped_record(), failing, stopped_record()):
+            self.writer.write(record)
+        drainer = Drainer(RingBuffer(self.path))
+        try:
+            with fail_saving("FAIL"), self.assertLogs("request_profiler.collector"):
+                self.assertEqual(drainer.drain(), 3)
+        finally:
+            drainer.buffer.close()
+        # only the record that failed to save is lost
+        self.assertEqual(drainer.flushed, 2)
+        self.assertEqual(drainer.dropped, 1)
+        self.assertEqual(ProfilingRecord.objects.count(), 2)
+
+    def test_writer_too_large(self):
+        writer = RingBufferWriter(os.path.join(self.tmpdir.name, "small"))
+        with mock.patch("request_profiler.settings.RING_BUFFER_SLOT_SIZE", 64):
+            writer.write(stopped_record())
+        writer.close()
+        self.assertEqual(writer.dropped, 1)
+
+    def test_command(self):
+        self.writer.write(stopped_record())
+        call_command("request_profiler_drain", "--path", self.path, "--once")
+        self.assertEqual(ProfilingRecord.objects.count(), 1)
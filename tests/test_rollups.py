@@ -0,0 +1,116 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from request_profiler import settings
+from request_profiler.models import ProfilingRecord, ProfilingRollup
+from request_profiler.rollups import (
+    bucket_start,
+    collect,
+    recompute_rollups,
+    update_rollups,
+)
+from request_profiler.writers import BufferedWriter, SyncWriter
+
+from .utils import create_record, stopped_record
+
+UTC = datetime.timezone.utc
+TS = datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=UTC)
+
+
+class BucketStartTests(TestCase):
+    def test_bucket_start(self):
+        self.assertEqual(bucket_start(TS, "minute"), TS.replace(second=0))
+        self.assertEqual(bucket_start(TS, "hour"), TS.replace(minute=0, second=0))
+        self.assertEqual(
+            bucket_start(TS, "day"), TS.replace(hour=0, minute=0, second=0)
+        )
+        self.assertRaises(ValueError, bucket_start, TS, "week")
+
+    def test_bucket_start__timezone(self):
+        ts = TS.astimezone(datetime.timezone(datetime.timedelta(hours=5)))
+        self.assertEqual(
+            bucket_start(ts, "day"), datetime.datetime(2024, 1, 2, tzinfo=UTC)
+        )
+
+
+class ProfilingRollupTests(TestCase):
+    def test_collect(self):
+        rows = [
+            ("foo", 200, TS, 0.2),
+            ("foo", 201, TS, 20),
+            ("foo", 404, TS, 0.01),
+            ("bar", 200, TS + datetime.timedelta(hours=1), 1),
+        ]
+        rollups = collect(rows, ["hour"])
+        self.assertEqual(len(rollups), 3)
+        rollup = rollups[("hour", TS.replace(minute=0, second=0), "foo", 2)]
+        self.assertEqual(rollup.count, 2)
+        self.assertEqual(rollup.duration_sum, 20.2)
+        self.assertEqual(rollup.duration_max, 20)
+        # 0.2 is in the 0.25 bucket, 20 in the overflow bucket
+        self.assertEqual(rollup.histogram, [0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 1])
+        self.assertEqual(len(collect(rows)), 9)
+
+    def test_quantile(self):
+        rows = [("foo", 200, TS, i / 100) for i in range(1, 101)]
+        (rollup,) = collect(rows, ["day"]).values()
+        self.assertAlmostEqual(rollup.duration_mean, 0.505)
+        self.assertAlmostEqual(rollup.quantile(0.5), 0.5)
+        self.assertAlmostEqual(rollup.quantile(0.9), 0.9)
+        self.assertEqual(rollup.quantile(1), 1)
+        self.assertIsNone(ProfilingRollup().quantile(0.5))
+
+    def test_update_rollups(self):
+        records = [create_record(0.1, start_ts=TS), create_record(0.2, start_ts=TS)]
+        self.assertEqual(update_rollups(records, ["hour", "day"]), 2)
+        self.assertEqual(update_rollups(records[:1], ["hour"]), 1)
+        rollup = ProfilingRollup.objects.get(period="hour")
+        self.assertEqual(rollup.count, 3)
+        self.assertAlmostEqual(rollup.duration_sum, 0.4)
+        self.assertEqual(rollup.duration_max, 0.2)
+        self.assertEqual(ProfilingRollup.objects.get(period="day").count, 2)
+        # no periods configured
+        self.assertEqual(update_rollups(records), 0)
+
+    def test_update_rollups__lock_order(self):
+        # rollups are locked in key order, whatever the order of the records
+        records = [create_record(0.1, view_func_name=name) for name in "cab"]
+        with mock.patch("request_profiler.rollups._save") as save:
+            update_rollups(records, ["hour"])
+        names = [c.args[0].view_func_name for c in save.call_args_list]
+        self.assertEqual(names, ["a", "b", "c"])
+
+    def test_recompute_rollups(self):
+        create_record(1, start_ts=TS)
+        create_record(2, start_ts=TS - datetime.timedelta(hours=1))
+        self.assertEqual(recompute_rollups("hour", TS), 1)
+        # idempotent
+        self.assertEqual(recompute_rollups("hour", TS), 1)
+        rollup = ProfilingRollup.objects.get()
+        self.assertEqual(rollup.count, 1)
+        self.assertEqual(rollup.bucket_start, TS.replace(minute=0, second=0))
+        self.assertEqual(recompute_rollups("hour", TS - datetime.timedelta(hours=1)), 2)
+        self.assertEqual(ProfilingRollup.objects.count(), 2)
+
+    def test_writers(self):
+        settings.ROLLUP_PERIODS = ("hour",)
+        try:
+            SyncWriter().write(stopped_record())
+            writer = BufferedWriter(batch_size=100, flush_interval=60)
+            writer.write(stopped_record())
+            writer.flush()
+        finally:
+            settings.ROLLUP_PERIODS = ()
+        self.assertEqual(ProfilingRecord.objects.count(), 2)
+        self.assertEqual(ProfilingRollup.objects.get().count, 2)
+
+    def test_command(self):
+        create_record(1)
+        out = StringIO()
+        call_command("request_profiler_rollup", "--period", "day", stdout=out)
+        self.assertIn("rebuilt 1 day rollups", out.getvalue())
+        self.assertEqual(ProfilingRollup.objects.get().count, 1)
@@ -0,0 +1,43 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from request_profiler.serialization import (
+    FIELDS,
+    record_from_dict,
+    record_to_dict,
+    record_to_json,
+    to_python,
+)
+
+from .utils import stopped_record
+
+
+class SerializationTests(TestCase):
+    def test_round_trip(self):
+        record = stopped_record()
+        data = json.loads(record_to_json(record))
+        self.assertEqual(list(data), FIELDS)
+        self.assertNotIn("id", data)
+        self.assertEqual(data["start_ts"], record.start_ts.isoformat())
+        copy = record_from_dict(data)
+        self.assertEqual(record_to_dict(copy), record_to_dict(record))
+        copy.save()
+
+    def test_to_python(self):
+        values = to_python(
+            {"duration": "1.5", "query_count": "", "user_id": "", "foo": "bar"}
+        )
+        self.assertEqual(
+            values, {"duration": 1.5, "query_count": None, "user_id": None}
+        )
+        self.assertRaises(ValidationError, to_python, {"duration": "x"})
+        self.assertRaises(ValidationError, to_python, {"remote_addr": None})
+        self.assertRaises(ValidationError, to_python, {"http_method": "x" * 11})
+        self.assertEqual(to_python({"http_method": "GET"}), {"http_method": "GET"})
+
+    def test_record_from_dict__missing(self):
+        data = record_to_dict(stopped_record())
+        del data["start_ts"]
+        self.assertRaisesMessage(ValueError, "Missing start_ts", record_from_dict, data)
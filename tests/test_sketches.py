@@ -0,0 +1,109 @@
+import datetime
+import random
+from unittest import mock
+
+from django.test import TestCase
+
+from request_profiler import settings
+from request_profiler.models import ProfilingRecord, ViewSketch
+from request_profiler.sketches import QuantileSketch, SketchRegistry
+
+UTC = datetime.timezone.utc
+TS = datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=UTC)
+
+
+class QuantileSketchTests(TestCase):
+    def test_quantile(self):
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        self.assertIsNone(sketch.quantile(0.5))
+        values = [random.uniform(0.001, 10) for _ in range(10000)]
+        sketch.update(values)
+        values.sort()
+        for q in (0, 0.5, 0.9, 0.99, 1):
+            expected = values[int(q * (len(values) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q), expected, delta=expected * 0.01)
+        self.assertEqual(sketch.min, values[0])
+        self.assertEqual(sketch.max, values[-1])
+        self.assertAlmostEqual(sketch.mean, sum(values) / len(values))
+        # far fewer buckets than values
+        self.assertLess(len(sketch.bins), 1000)
+
+    def test_zero(self):
+        sketch = QuantileSketch()
+        sketch.update([0, 0, 0, 1])
+        self.assertEqual(sketch.quantile(0.5), 0)
+        self.assertAlmostEqual(sketch.quantile(1), 1, delta=0.01)
+
+    def test_merge(self):
+        a, b = QuantileSketch(), QuantileSketch()
+        a.update([1, 2, 3])
+        b.update([4, 5])
+        a.merge(b)
+        self.assertEqual(a.count, 5)
+        self.assertEqual(a.max, 5)
+        self.assertAlmostEqual(a.quantile(0.5), 3, delta=0.03)
+        self.assertRaises(ValueError, a.merge, QuantileSketch(relative_accuracy=0.1))
+
+    def test_to_bytes(self):
+        sketch = QuantileSketch()
+        self.assertEqual(QuantileSketch.from_bytes(sketch.to_bytes()).count, 0)
+        sketch.update([0, 0.001, 0.5, 1, 30])
+        copy = QuantileSketch.from_bytes(memoryview(sketch.to_bytes()))
+        self.assertEqual(copy.bins, sketch.bins)
+        self.assertEqual(copy.count, 5)
+        self.assertEqual(copy.zero_count, 1)
+        self.assertEqual((copy.min, copy.max), (0, 30))
+        self.assertEqual(copy.quantile(0.5), sketch.quantile(0.5))
+        self.assertRaises(ValueError, QuantileSketch.from_bytes, b"\x02" + bytes(52))
+
+
+class SketchRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = SketchRegistry(flush_interval=60)
+
+    def tearDown(self):
+        self.registry.flush()
+
+    def test_add_and_flush(self):
+        self.registry.add("foo", TS, 1)
+        self.registry.add("foo", TS.replace(minute=59), 2)
+        self.registry.add("foo", TS + datetime.timedelta(hours=1), 3)
+        self.registry.add("bar", TS, 4)
+        self.assertEqual(self.registry.pending, 4)
+        self.registry.flush()
+        self.assertEqual(self.registry.pending, 0)
+        self.assertEqual(ViewSketch.objects.count(), 3)
+        foo = ViewSketch.objects.get(
+            view_func_name="foo", period_start=TS.replace(minute=0, second=0)
+        )
+        self.assertEqual(foo.count, 2)
+        # flushing again merges into the stored sketches
+        self.registry.add("foo", TS, 5)
+        self.registry.flush()
+        foo.refresh_from_db()
+        self.assertEqual(foo.count, 3)
+        self.assertEqual(foo.get_sketch().max, 5)
+
+    def test_merged(self):
+        for i in range(1, 101):
+            self.registry.add("foo", TS + datetime.timedelta(hours=i % 3), i / 100)
+        self.registry.flush()
+        self.assertEqual(ViewSketch.objects.count(), 3)
+        sketch = ViewSketch.objects.filter(view_func_name="foo").merged()
+        self.assertEqual(sketch.count, 100)
+        self.assertAlmostEqual(sketch.quantile(0.99), 0.99, delta=0.01)
+        self.assertEqual(ViewSketch.objects.none().merged().count, 0)
+
+    def test_sketches_enabled(self):
+        settings.SKETCHES_ENABLED = True
+        settings.WRITER = "request_profiler.writers.NullWriter"
+        try:
+            with mock.patch("request_profiler.models.registry", self.registry):
+                profiler = ProfilingRecord().start()
+                profiler.view_func_name = "foo"
+                profiler.capture()
+        finally:
+            settings.SKETCHES_ENABLED = False
+            settings.WRITER = "request_profiler.writers.SyncWriter"
+        self.assertEqual(self.registry.pending, 1)
+        self.assertFalse(ProfilingRecord.objects.exists())
@@ -0,0 +1,95 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from request_profiler.dimensions import DimensionCache, normalize
+from request_profiler.models import (
+    NormalizedProfilingRecord,
+    ProfilingRecord,
+    RequestPath,
+)
+
+from .utils import create_record, stopped_record
+
+
+class TruncateLogsTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for days in (0, 1, 3, 4, 5, 6, 7):
+            create_record(1, start_ts=now - datetime.timedelta(days=days))
+
+    def truncate(self, *args):
+        out = StringIO()
+        call_command(
+            "truncate_request_profiler_logs", *args, stdout=out, stderr=StringIO()
+        )
+        return out.getvalue()
+
+    def test_truncate__dry_run(self):
+        out = self.truncate("--days", "2")
+        self.assertIn("found 5 records to delete", out)
+        self.assertEqual(ProfilingRecord.objects.count(), 7)
+
+    def test_truncate__zero_days(self):
+        out = self.truncate("--days", "0", "--commit")
+        self.assertIn("aborting truncation", out)
+        self.assertEqual(ProfilingRecord.objects.count(), 7)
+
+    def test_truncate__batches(self):
+        out = self.truncate("--days", "2", "--commit", "--batch-size", "2")
+        self.assertIn("deleted 2 log records so far", out)
+        self.assertIn("deleted 4 log records so far", out)
+        self.assertIn("deleted 5 log records.", out)
+        self.assertEqual(ProfilingRecord.objects.count(), 2)
+        self.assertFalse(
+            ProfilingRecord.objects.filter(
+                start_ts__lt=timezone.now() - datetime.timedelta(days=3)
+            ).exists()
+        )
+
+    @mock.patch(
+        "request_profiler.management.commands.truncate_request_profiler_logs.time"
+    )
+    def test_truncate__max_runtime(self, mock_time):
+        mock_time.monotonic.side_effect = [0, 5, 10]
+        out = self.truncate(
+            "--days",
+            "2",
+            "--commit",
+            "--batch-size",
+            "2",
+            "--max-runtime",
+            "10",
+            "--sleep",
+            "1",
+        )
+        self.assertIn("--max-runtime has been reached", out)
+        self.assertEqual(ProfilingRecord.objects.count(), 3)
+        mock_time.sleep.assert_called_once_with(1)
+        # and then carry on where it left off
+        mock_time.monotonic.side_effect = None
+        mock_time.monotonic.return_value = 0
+        self.truncate("--days", "2", "--commit")
+        self.assertEqual(ProfilingRecord.objects.count(), 2)
+
+    def test_truncate__normalized(self):
+        cache = DimensionCache()
+        for days, path in ((0, "/new/"), (3, "/old/"), (4, "/new/")):
+            record = stopped_record()
+            record.start_ts = timezone.now() - datetime.timedelta(days=days)
+            record.request_uri = path
+            normalize(record, cache).save()
+        out = self.truncate("--days", "2")
+        self.assertIn("found 2 normalized records to delete", out)
+        out = self.truncate("--days", "2", "--commit")
+        self.assertIn("deleted 2 normalized log records", out)
+        self.assertEqual(NormalizedProfilingRecord.objects.count(), 1)
+        # the values no longer used are deleted
+        self.assertIn("deleted 1 unused values", out)
+        self.assertEqual(
+            list(RequestPath.objects.values_list("value", flat=True)), ["/new/"]
+        )
@@ -1,3 +1,4 @@
+from asgiref.sync import sync_to_async
 from django.test import TestCase
 from django.urls import reverse
 
@@ -68,6 +69,42 @@ class ViewTests(TestCase):
         self.assertEqual(str(record.duration), response["X-Profiler-Duration"])
         self.assertEqual(record.response_status_code, 200)
 
+    def test_phases(self):
+        self.client.get(reverse("test_view"))
+        record = ProfilingRecord.objects.get()
+        self.assertGreater(record.time_to_view, 0)
+        self.assertGreater(record.view_duration, 0)
+        self.assertAlmostEqual(
+            record.time_to_view + record.view_duration, record.duration
+        )
+        # the end of the view is only known for a TemplateResponse
+        self.assertIsNone(record.response_duration)
+
+    def test_phases__template_response(self):
+        self.client.get(reverse("test_template_response"))
+        record = ProfilingRecord.objects.get()
+        self.assertGreater(record.response_duration, 0)
+        self.assertAlmostEqual(
+            record.time_to_view + record.view_duration + record.response_duration,
+            record.duration,
+        )
+
+    def test_streaming_response(self):
+        response = self.client.get(reverse("test_streaming_response"))
+        # the record is written once the response has been streamed
+        self.assertFalse(ProfilingRecord.objects.exists())
+        self.assertEqual(b"".join(response.streaming_content), b"this is a test")
+        record = ProfilingRecord.objects.get()
+        self.assertEqual(record.response_content_length, 14)
+
+    async def test_streaming_response__async_client(self):
+        response = await self.async_client.get(reverse("test_streaming_response"))
+        # the ASGI handler closes the response in a thread
+        content = await sync_to_async(b"".join)(response.streaming_content)
+        self.assertEqual(content, b"this is a test")
+        record = await ProfilingRecord.objects.aget()
+        self.assertEqual(record.response_content_length, 14)
+
     def test_rules_match_view_no_session(self):
         url = reverse("test_view")
         settings.STORE_ANONYMOUS_SESSIONS = False
@@ -83,3 +120,25 @@ class ViewTests(TestCase):
         response = self.client.get(url)
         self.assertTrue(response.has_header("X-Profiler-Duration"))
         self.assertEqual(ProfilingRecord.objects.get().response_status_code, 404)
+
+    def test_match_on_request__no_match(self):
+        # unmatched requests are not profiled, and no session is saved
+        self.rule.uri_regex = "^/admin/"
+        self.rule.save()
+        settings.MATCH_ON_REQUEST = True
+        try:
+            response = self.client.get(reverse("test_response"))
+        finally:
+            settings.MATCH_ON_REQUEST = False
+        self.assertFalse(response.has_header("X-Profiler-Duration"))
+        self.assertFalse(ProfilingRecord.objects.exists())
+        self.assertEqual(response.cookies, {})
+
+    async def test_async_client(self):
+        # run through the ASGI handler, with the middleware in async mode
+        response = await self.async_client.get(reverse("test_response"))
+        self.assertTrue(response.has_header("X-Profiler-Duration"))
+        record = await ProfilingRecord.objects.aget()
+        self.assertIsNone(record.user_id)
+        self.assertEqual(record.view_func_name, "test_response")
+        self.assertEqual(record.response_status_code, 200)
@@ -0,0 +1,236 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase
+
+from request_profiler import settings
+from request_profiler.models import ProfilingRecord
+from request_profiler.writers import (
+    BufferedWriter,
+    FileWriter,
+    NullWriter,
+    SyncWriter,
+    get_writer,
+)
+
+from .utils import stopped_record
+
+
+class SyncWriterTests(TestCase):
+    def test_write(self):
+        record = stopped_record()
+        SyncWriter().write(record)
+        self.assertIsNotNone(record.id)
+
+    async def test_awrite(self):
+        record = await sync_to_async(stopped_record)()
+        await SyncWriter().awrite(record)
+        self.assertIsNotNone(record.id)
+        self.assertTrue(await ProfilingRecord.objects.filter(id=record.id).aexists())
+
+
+class NullWriterTests(TestCase):
+    def test_write(self):
+        NullWriter().write(stopped_record())
+        self.assertFalse(ProfilingRecord.objects.exists())
+
+
+class BufferedWriterTests(TestCase):
+    def setUp(self):
+        # large batch / interval so that the background thread stays idle
+        self.writer = BufferedWriter(max_size=3, batch_size=100, flush_interval=60)
+
+    def tearDown(self):
+        # don't leave anything to be flushed at exit, after the db has gone
+        self.writer.flush()
+
+    def test_write_and_flush(self):
+        self.writer.write(stopped_record())
+        self.writer.write(stopped_record())
+        self.assertEqual(self.writer.pending, 2)
+        self.assertEqual(ProfilingRecord.objects.count(), 0)
+        self.writer.flush()
+        self.assertEqual(self.writer.pending, 0)
+        self.assertEqual(self.writer.flushed, 2)
+        self.assertEqual(ProfilingRecord.objects.count(), 2)
+
+    def test_write__releases_request(self):
+        record = stopped_record()
+        record.request = object()
+        record.response = object()
+        self.writer.write(record)
+        self.assertFalse(hasattr(record, "request"))
+        self.assertFalse(hasattr(record, "response"))
+
+    def test_write__queue_full(self):
+        for _ in range(5):
+            self.writer.write(stopped_record())
+        self.assertEqual(self.writer.pending, 3)
+        self.assertEqual(self.writer.dropped, 2)
+        self.writer.flush()
+        self.assertEqual(self.writer.flushed, 3)
+
+    def test_flush__in_batches(self):
+        self.writer.batch_size = 2
+        self.writer.write(stopped_record())
+        self.writer.write(stopped_record())
+        self.writer.write(stopped_record())
+        self.writer.flush()
+        self.assertEqual(self.writer.flushed, 3)
+        self.assertEqual(ProfilingRecord.objects.count(), 3)
+
+    def test_flush__invalid_record(self):
+        invalid = stopped_record()
+        invalid.remote_addr = None
+        self.writer.write(stopped_record())
+        self.writer.write(invalid)
+        self.writer.write(stopped_record())
+        with self.assertLogs("request_profiler.collector", "ERROR"):
+            self.writer.flush()
+        # only the invalid record is lost
+        self.assertEqual(self.writer.flushed, 2)
+        self.assertEqual(self.writer.dropped, 1)
+        self.assertEqual(ProfilingRecord.objects.count(), 2)
+
+    def test_ensure_started__once(self):
+        threads = [
+            threading.Thread(target=self.writer._ensure_started) for _ in range(4)
+        ]
+
+        def slow_thread(*args, **kwargs):
+            time.sleep(0.05)
+            return mock.Mock()
+
+        with mock.patch(
+            "request_profiler.writers.threading.Thread", side_effect=slow_thread
+        ) as mock_thread:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        mock_thread.assert_called_once()
+
+
+class GetWriterTests(TestCase):
+    def test_get_writer(self):
+        self.assertIsInstance(get_writer(), SyncWriter)
+        self.assertIs(get_writer(), get_writer())
+
+    def test_get_writer__setting(self):
+        settings.WRITER = "request_profiler.writers.BufferedWriter"
+        try:
+            self.assertIsInstance(get_writer(), BufferedWriter)
+        finally:
+            settings.WRITER = "request_profiler.writers.SyncWriter"
+
+
+class FileWriterTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def files(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_write(self):
+        writer = FileWriter(self.directory, compress=False)
+        record = stopped_record()
+        with self.assertNumQueries(0):
+            writer.write(record)
+            writer.write(stopped_record())
+        self.assertTrue(writer.path.endswith(".jsonl.part"))
+        writer.flush()
+        with open(writer.path) as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])["duration"], record.duration)
+        writer.close()
+        self.assertIsNone(writer.path)
+        (name,) = self.files()
+        self.assertTrue(name.endswith(".jsonl"))
+
+    def test_rotate__size(self):
+        writer = FileWriter(self.directory, max_bytes=1, compress=False)
+        writer.write(stopped_record())
+        with mock.patch("request_profiler.writers.time.time", return_value=0):
+            writer.write(stopped_record())
+        writer.close()
+        files = self.files()
+        self.assertEqual(len(files), 2)
+        self.assertTrue(files[0].endswith("-19700101T000000-1.jsonl"))
+
+    @mock.patch("request_profiler.writers.time")
+    def test_rotate__age__gzip(self, mock_time):
+        mock_time.time.return_value = 0
+        mock_time.strftime.side_effect = ["1", "2"]
+        writer = FileWriter(self.directory, max_age=60, compress=True)
+        writer.write(stopped_record())
+        mock_time.time.return_value = 60
+        with mock.patch("request_profiler.writers.threading.Thread") as mock_thread:
+            writer.write(stopped_record())
+            path = mock_thread.call_args.kwargs["args"][0]
+        self.assertTrue(path.endswith("-1-0.jsonl"))
+        mock_thread.call_args.kwargs["target"](path)
+        self.assertEqual(len(self.files()), 2)
+        with gzip.open(f"{path}.gz", "rt") as f:
+            self.assertEqual(len(f.readlines()), 1)
+        writer.compress = False
+        writer.close()
+
+    def test_rotate__same_second(self):
+        writer = FileWriter(self.directory, max_bytes=1, compress=True)
+        for _ in range(5):
+            writer.write(stopped_record())
+        with mock.patch("request_profiler.writers.threading.Thread") as mock_thread:
+            writer.close()
+        # compressed in this thread, as close is called at exit
+        mock_thread.assert_not_called()
+        for thread in threading.enumerate():
+            if thread.name == "request-profiler-gzip":
+                thread.join()
+        files = self.files()
+        self.assertEqual(len(files), 5)
+        for name in files:
+            with gzip.open(os.path.join(self.directory, name), "rt") as f:
+                self.assertEqual(len(f.readlines()), 1)
+
+    def test_fork(self):
+        writer = FileWriter(self.directory, compress=False)
+        writer.write(stopped_record())
+        pid = os.fork()
+        if pid == 0:
+            try:
+                writer.write(stopped_record())
+                writer.close()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        writer.close()
+        lines = []
+        for name in self.files():
+            with open(os.path.join(self.directory, name)) as f:
+                lines.extend(f.readlines())
+        # the parent's buffered line is written once, by the parent
+        self.assertEqual(len(self.files()), 2)
+        self.assertEqual(len(lines), 2)
+
+    @mock.patch("request_profiler.writers.os.fsync")
+    def test_fsync(self, mock_fsync):
+        writer = FileWriter(self.directory, fsync=True, compress=False)
+        writer.write(stopped_record())
+        mock_fsync.assert_called_once()
+        with open(writer.path) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        writer.close()
+
+    def test_no_directory(self):
+        self.assertRaises(ValueError, FileWriter)
@@ -1,6 +1,45 @@
-from unittest import skipIf
+import contextlib
+import datetime
+from unittest import mock, skipIf
 
 from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from request_profiler.models import ProfilingRecord
+
+# use with override_settings to test caching, which is disabled in settings
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+def stopped_record():
+    """Return an unsaved, stopped, ProfilingRecord."""
+    profiler = ProfilingRecord().start()
+    profiler.http_method = "GET"
+    profiler.request_uri = "/"
+    profiler.remote_addr = "127.0.0.1"
+    profiler.response_status_code = 200
+    profiler.response_content_length = 0
+    return profiler.stop()
+
+
+def create_record(duration, view_func_name="test", start_ts=None, **kwargs):
+    """Create a ProfilingRecord of the duration (in seconds)."""
+    start_ts = start_ts or timezone.now()
+    return ProfilingRecord.objects.create(
+        start_ts=start_ts,
+        end_ts=start_ts + datetime.timedelta(seconds=duration),
+        duration=duration,
+        http_method=kwargs.pop("http_method", "GET"),
+        request_uri=kwargs.pop("request_uri", "/"),
+        remote_addr="127.0.0.1",
+        view_func_name=view_func_name,
+        response_status_code=kwargs.pop("response_status_code", 200),
+        response_content_length=0,
+        **kwargs,
+    )
 
 
 def skipIfDefaultUser(test_func):
@@ -15,3 +54,19 @@ def skipIfCustomUser(test_func):
     return skipIf(settings.AUTH_USER_MODEL != "auth.User", "Custom user model in use")(
         test_func
     )
+
+
+@contextlib.contextmanager
+def fail_saving(http_method):
+    """Fail to bulk_create records, and to save those with the http_method."""
+    save = ProfilingRecord.save
+
+    def failing_save(record, *args, **kwargs):
+        if record.http_method == http_method:
+            raise DatabaseError("Failed.")
+        return save(record, *args, **kwargs)
+
+    with mock.patch.object(ProfilingRecord, "save", failing_save), mock.patch.object(
+        ProfilingRecord.objects, "bulk_create", side_effect=DatabaseError("Failed.")
+    ):
+        yield
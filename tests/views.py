@@ -1,5 +1,6 @@
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.template.response import TemplateResponse
 from django.views import View
 
 
@@ -11,6 +12,14 @@ def test_view(request):
     return render(request, "test.html")
 
 
+def test_template_response(request):
+    return TemplateResponse(request, "test.html")
+
+
+def test_streaming_response(request):
+    return StreamingHttpResponse(["this ", "is ", "a ", "test"])
+
+
 def test_404(request):
     raise Http404()
 